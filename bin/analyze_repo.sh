@@ -31,8 +31,10 @@ fi
 
 echo "analyzing tags of ${repo_url} saving intermediate results to ${TMP_DIR}"
 printf '{"repo_url": "%s"}\n' "${repo_url}" \
-	| docker run --rm -i -v /var/run/docker.sock:/var/run/docker.sock "${IMAGE_NAME}" python fpr/run_pipeline.py $verbose_flag find_git_refs --docker-pull --docker-build | tee "${TMP_DIR}/repo_tags.jsonl" \
-	| docker run --rm -i -v /var/run/docker.sock:/var/run/docker.sock "${IMAGE_NAME}" python fpr/run_pipeline.py $verbose_flag find_dep_files --docker-pull --docker-build | tee "${TMP_DIR}/repo_dep_files.jsonl" \
-	| docker run --rm -i -v /var/run/docker.sock:/var/run/docker.sock "${IMAGE_NAME}" python fpr/run_pipeline.py $verbose_flag run_repo_tasks --docker-pull --docker-build --repo-task list_metadata --repo-task audit | tee "${TMP_DIR}/repo_tasks.jsonl" \
-        | docker run --rm -i "${IMAGE_NAME}" python fpr/run_pipeline.py $verbose_flag postprocess --repo-task list_metadata --repo-task audit | tee "${TMP_DIR}/repo_postprocessed_tasks.jsonl" \
-        | docker run --rm -i --env DB_URL --net=host "${IMAGE_NAME}" python fpr/run_pipeline.py $verbose_flag save_to_db --create-tables --input-type postprocessed_repo_task
+	| docker run --rm -i -v /var/run/docker.sock:/var/run/docker.sock -v "${TMP_DIR}:${TMP_DIR}" --env DB_URL --net=host "${IMAGE_NAME}" \
+	  python fpr/run_pipeline.py $verbose_flag find_git_refs,find_dep_files,run_repo_tasks,postprocess,save_to_db \
+	    --docker-pull --docker-build -o "${TMP_DIR}/repo_tags.jsonl.gz" \
+	    -- --docker-pull --docker-build -o "${TMP_DIR}/repo_dep_files.jsonl.gz" \
+	    -- --docker-pull --docker-build --repo-task list_metadata --repo-task audit -o "${TMP_DIR}/repo_tasks.jsonl.gz" \
+	    -- --repo-task list_metadata --repo-task audit -o "${TMP_DIR}/repo_postprocessed_tasks.jsonl.gz" \
+	    -- --create-tables --input-type postprocessed_repo_task
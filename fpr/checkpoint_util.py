@@ -0,0 +1,220 @@
+import argparse
+import collections
+from dataclasses import dataclass, field
+import functools
+import json
+import logging
+import os
+import traceback
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterable,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+from fpr.serialize_util import canonical_json, dumps_jsonline
+
+log = logging.getLogger("fpr.checkpoint_util")
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# what to do with the outputs of items finished in a previous run
+RESUME_MODES = ["replay", "suppress"]
+
+
+def item_key(key: Any) -> str:
+    "Returns a stable string for a JSON serializable input item key"
+    return canonical_json(key)
+
+
+@dataclass
+class PendingItem:
+    "An item running or with outputs to write and flush before recording it"
+    pipeline: str
+    key: str
+    outputs: List[Any] = field(default_factory=list)
+    # numbers of outputs written and flushed to the pipeline outfiles
+    written: int = 0
+    flushed: int = 0
+    # whether fn finished without errors and the item was recorded
+    finished: bool = False
+    recorded: bool = False
+    # whether writing an output failed
+    failed: bool = False
+
+
+class CheckpointJournal:
+    """Append-only JSON lines journal of pipeline input items that
+    finished and their outputs
+
+    Each line is a JSON object with pipeline, key, and outputs
+    fields. Loading indexes the byte offset of each line, so outputs are
+    only read back when replayed.
+
+    Items are recorded after their outputs are written and flushed to
+    the pipeline outfiles, so a crash can't drop the outputs of an item
+    recorded as finished.
+    """
+
+    def __init__(self, path: str, resume: str = "replay"):
+        self.path = path
+        self.resume = resume
+        self.offsets: Dict[Tuple[str, str], int] = {}
+        # outputs to write and their items in the order they were yielded
+        self.pending: Deque[Tuple[Any, PendingItem]] = collections.deque()
+        self.load()
+        self.file = open(path, "ab")
+        if self.file.tell() and not self.ends_with_newline():
+            # terminate a line truncated by a crash
+            self.file.write(b"\n")
+            self.file.flush()
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            offset = 0
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    self.offsets[(record["pipeline"], record["key"])] = offset
+                except (ValueError, KeyError, TypeError):
+                    log.warning(
+                        f"skipping invalid checkpoint line at byte {offset} of {self.path}"
+                    )
+                offset += len(line)
+        log.info(f"loaded {len(self.offsets)} finished items from {self.path}")
+
+    def ends_with_newline(self) -> bool:
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def is_finished(self, pipeline_name: str, key: str) -> bool:
+        return (pipeline_name, key) in self.offsets
+
+    def read_outputs(self, pipeline_name: str, key: str) -> List[Any]:
+        with open(self.path, "rb") as f:
+            f.seek(self.offsets[(pipeline_name, key)])
+            return json.loads(f.readline())["outputs"]
+
+    def record(self, pipeline_name: str, key: str, outputs: List[Any]) -> None:
+        offset = self.file.tell()
+        self.file.write(
+            dumps_jsonline(
+                dict(pipeline=pipeline_name, key=key, outputs=outputs), default=str
+            )
+        )
+        self.file.flush()
+        self.offsets[(pipeline_name, key)] = offset
+
+    def start(self, pipeline_name: str, key: str) -> PendingItem:
+        return PendingItem(pipeline_name, key)
+
+    def add_output(self, item: PendingItem, output: Any) -> None:
+        "Adds an output to write before recording item"
+        item.outputs.append(output)
+        self.pending.append((output, item))
+
+    def pop_pending(self, output: Any) -> Optional[PendingItem]:
+        "Removes output from the outputs to write and returns its item"
+        for i, (pending_output, item) in enumerate(self.pending):
+            if pending_output is output:
+                del self.pending[i]
+                return item
+        return None
+
+    def written(self, output: Any) -> Optional[Callable[[], None]]:
+        """Marks an output as written
+
+        Returns a function to call after the output is flushed or None
+        when output isn't pending (e.g. a replayed output).
+        """
+        item = self.pop_pending(output)
+        if item is None:
+            return None
+        item.written += 1
+        return functools.partial(self.flushed, item, item.written)
+
+    def write_failed(self, output: Any) -> None:
+        "Marks an output as not written so its item isn't recorded"
+        item = self.pop_pending(output)
+        if item is not None:
+            item.failed = True
+
+    def flushed(self, item: PendingItem, written: int) -> None:
+        "Marks the first written outputs of item as flushed"
+        item.flushed = max(item.flushed, written)
+        self.record_flushed(item)
+
+    def finish(self, item: PendingItem) -> None:
+        "Records item once all its outputs are flushed"
+        item.finished = True
+        self.record_flushed(item)
+
+    def record_flushed(self, item: PendingItem) -> None:
+        if (
+            item.finished
+            and not item.failed
+            and not item.recorded
+            and item.flushed == len(item.outputs)
+        ):
+            item.recorded = True
+            self.record(item.pipeline, item.key, item.outputs)
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def checkpointed(
+    args: argparse.Namespace,
+    pipeline_name: str,
+    key_fn: Callable[[T], Any],
+    fn: Callable[[T], AsyncIterable[R]],
+) -> Callable[[T], AsyncGenerator[R, None]]:
+    """Returns an async generator function for rx_util.map_concurrently
+    that yields fn's outputs for an input item and logs errors running fn
+
+    When run_pipeline sets args.checkpoint_journal, the outputs of items
+    that finish without errors (outside of dry runs) are recorded under
+    key_fn(item) once run_pipeline writes them and items finished in a
+    previous run are replayed or skipped without calling fn.
+    """
+    journal: Optional[CheckpointJournal] = getattr(args, "checkpoint_journal", None)
+
+    async def run_item(item: T) -> AsyncGenerator[R, None]:
+        key = item_key(key_fn(item))
+        if journal is not None and journal.is_finished(pipeline_name, key):
+            log.debug(f"{journal.resume} finished {pipeline_name} item {key}")
+            if journal.resume == "replay":
+                for output in journal.read_outputs(pipeline_name, key):
+                    yield output
+            return
+
+        pending = None
+        if journal is not None and not getattr(args, "dry_run", False):
+            pending = journal.start(pipeline_name, key)
+        try:
+            async for output in fn(item):
+                if journal is not None and pending is not None:
+                    # before yielding since the output can be written
+                    # before fn finishes e.g. with a concurrency of 1
+                    journal.add_output(pending, output)
+                yield output
+        except Exception as e:
+            log.error(
+                f"error running {pipeline_name} for {key}:\n{traceback.format_exc()}"
+            )
+            return
+        if journal is not None and pending is not None:
+            journal.finish(pending)
+
+    return run_item
@@ -1,7 +1,7 @@
 import argparse
 import asyncio
 import logging
-from typing import AbstractSet, Dict, AsyncGenerator, Generator, Optional
+from typing import AbstractSet, Dict, AsyncGenerator, Generator, Iterable, Optional
 
 import aiohttp
 
@@ -52,7 +52,7 @@ async def async_query(
 
 
 async def fetch_cratesio_metadata(
-    args: argparse.Namespace, source: Generator[Dict, None, None]
+    args: argparse.Namespace, source: Iterable[Dict]
 ) -> AsyncGenerator[Dict, None]:
     log.info("pipeline crates_io_metadata started")
     rust_crate_ids: Generator[RustPackageID, None, None] = (
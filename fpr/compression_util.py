@@ -0,0 +1,149 @@
+import argparse
+import gzip
+import io
+import logging
+import os
+import sys
+from typing import IO, Any, Dict, Optional, cast
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # type: ignore
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None  # type: ignore
+
+
+log = logging.getLogger("fpr.compression_util")
+
+# leading bytes of compressed files
+MAGIC_BYTES: Dict[str, bytes] = {
+    "gzip": b"\x1f\x8b",
+    "zstd": b"\x28\xb5\x2f\xfd",
+    "lz4": b"\x04\x22\x4d\x18",
+}
+MAGIC_BYTES_LEN = max(len(magic) for magic in MAGIC_BYTES.values())
+
+FILE_EXTENSIONS: Dict[str, str] = {".gz": "gzip", ".zst": "zstd", ".lz4": "lz4"}
+
+# name of the optional package for each compression
+PACKAGES: Dict[str, str] = {"gzip": "gzip", "zstd": "zstandard", "lz4": "lz4"}
+
+
+def compression_from_magic_bytes(head: bytes) -> Optional[str]:
+    for name, magic in MAGIC_BYTES.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def compression_from_path(path: str) -> Optional[str]:
+    return FILE_EXTENSIONS.get(os.path.splitext(path)[1].lower(), None)
+
+
+def is_available(compression: str) -> bool:
+    return {"gzip": True, "zstd": zstandard is not None, "lz4": lz4_frame is not None}[
+        compression
+    ]
+
+
+def open_path(compression: str, path: str, mode: str) -> io.BufferedIOBase:
+    "Opens a binary stream for the compressed file at path"
+    if compression == "gzip":
+        return gzip.GzipFile(path, mode)
+    elif compression == "zstd":
+        return zstandard.open(path, mode)
+    elif compression == "lz4":
+        return lz4_frame.open(path, mode)
+    raise NotImplementedError(f"unknown compression {compression}")
+
+
+def wrap_reader(compression: str, f: IO[bytes]) -> io.BufferedIOBase:
+    "Returns a binary stream decompressing the already open file f"
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=f, mode="rb")
+    elif compression == "zstd":
+        return io.BufferedReader(
+            zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+        )
+    elif compression == "lz4":
+        return lz4_frame.LZ4FrameFile(f, mode="rb")
+    raise NotImplementedError(f"unknown compression {compression}")
+
+
+def detect_path_compression(path: str, mode: str) -> Optional[str]:
+    """Returns the compression of the file at path from its magic bytes
+    when reading an existing regular file or its extension otherwise
+    """
+    if "r" in mode and os.path.isfile(path):
+        with open(path, "rb") as f:
+            return compression_from_magic_bytes(f.read(MAGIC_BYTES_LEN))
+    return compression_from_path(path)
+
+
+def open_compressed(path: str, mode: str = "r", encoding: str = "UTF-8") -> IO:
+    """Opens path streaming gzip, zstd, or lz4 (de)compression when
+    detected from the file magic bytes or extension
+
+    Returns a text stream unless mode includes 'b'. zstd and lz4 require
+    the optional zstandard and lz4 packages.
+    """
+    binary_mode = mode.replace("t", "").replace("b", "") + "b"
+    compression = detect_path_compression(path, binary_mode)
+    if compression is None:
+        stream: Any = open(path, binary_mode)
+    elif not is_available(compression):
+        raise ImportError(
+            f"{path} is {compression} compressed and requires the "
+            f"{PACKAGES[compression]} package (pip install {PACKAGES[compression]})"
+        )
+    else:
+        log.debug(f"opening {compression} compressed {path} with mode {binary_mode}")
+        stream = open_path(compression, path, binary_mode)
+
+    if "b" in mode:
+        return stream
+    return io.TextIOWrapper(stream, encoding=encoding)
+
+
+def open_stdin(encoding: str = "UTF-8") -> IO:
+    """Returns stdin decompressing it when its buffered leading bytes
+    match a compression's magic bytes
+    """
+    stdin = cast(io.BufferedReader, sys.stdin.buffer)
+    compression = compression_from_magic_bytes(
+        stdin.peek(MAGIC_BYTES_LEN)[:MAGIC_BYTES_LEN]
+    )
+    if compression is None:
+        return sys.stdin
+    if not is_available(compression):
+        raise ImportError(
+            f"stdin is {compression} compressed and requires the "
+            f"{PACKAGES[compression]} package (pip install {PACKAGES[compression]})"
+        )
+    reader: Any = wrap_reader(compression, stdin)
+    return io.TextIOWrapper(reader, encoding=encoding)
+
+
+class CompressedFileType(argparse.FileType):
+    """argparse.FileType that streams gzip, zstd, and lz4 compressed files
+
+    Reads detect compression from magic bytes and writes use the file
+    extension (.gz, .zst, or .lz4). '-' is stdin (decompressed when
+    compressed) or stdout (never compressed).
+    """
+
+    def __call__(self, string: str) -> IO:
+        mode = getattr(self, "_mode")
+        encoding = getattr(self, "_encoding") or "UTF-8"
+        try:
+            if string == "-" and "r" in mode:
+                return open_stdin(encoding)
+            elif string == "-":
+                return super().__call__(string)
+            return open_compressed(string, mode, encoding)
+        except (OSError, ImportError) as e:
+            raise argparse.ArgumentTypeError(f"can't open '{string}': {e}")
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import logging
+import pathlib
+import sqlite3
+import time
+from typing import Any, Optional
+
+from fpr.serialize_util import canonical_json, dumps_jsonline
+
+log = logging.getLogger("fpr.disk_cache_util")
+
+# rows to delete at a time when evicting entries
+EVICT_BATCH_SIZE = 100
+
+
+def cache_key(key: Any) -> str:
+    "Returns the hex sha256 of a JSON serializable key"
+    return hashlib.sha256(canonical_json(key).encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """SQLite backed cache of JSON serializable values by content
+    addressed key
+
+    Entries older than max_age seconds are expired and the least
+    recently read or written entries are evicted when the size of the
+    stored values goes over max_size bytes.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_size: Optional[int] = None,
+        max_age: Optional[float] = None,
+    ):
+        self.path = path
+        self.max_size = max_size
+        self.max_age = max_age
+        pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)"
+        )
+        self.db.commit()
+        self.hits, self.misses = 0, 0
+
+    def get(self, key: Any) -> Optional[Any]:
+        "Returns the value for key or None for missing and expired keys"
+        digest, now = cache_key(key), time.time()
+        row = self.db.execute(
+            "SELECT value, created_at FROM entries WHERE key = ?", (digest,)
+        ).fetchone()
+        if row is not None and self.is_expired(row[1], now):
+            self.db.execute("DELETE FROM entries WHERE key = ?", (digest,))
+            self.db.commit()
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+        self.db.execute(
+            "UPDATE entries SET accessed_at = ? WHERE key = ?", (now, digest)
+        )
+        self.db.commit()
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: Any, value: Any) -> None:
+        value_bytes, now = dumps_jsonline(value, default=str), time.time()
+        self.db.execute(
+            "INSERT OR REPLACE INTO entries "
+            "(key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            (cache_key(key), value_bytes, len(value_bytes), now, now),
+        )
+        self.db.commit()
+        self.evict()
+
+    def is_expired(self, created_at: float, now: float) -> bool:
+        return self.max_age is not None and now - created_at > self.max_age
+
+    @property
+    def size(self) -> int:
+        "Returns the total size of the stored values in bytes"
+        (size,) = self.db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        return size
+
+    def evict(self) -> None:
+        "Deletes expired entries then least recently used ones over max_size"
+        if self.max_age is not None:
+            self.db.execute(
+                "DELETE FROM entries WHERE created_at < ?",
+                (time.time() - self.max_age,),
+            )
+        if self.max_size is not None:
+            size = self.size
+            while size > self.max_size:
+                rows = self.db.execute(
+                    "SELECT key, size FROM entries ORDER BY accessed_at LIMIT ?",
+                    (EVICT_BATCH_SIZE,),
+                ).fetchall()
+                if not rows:
+                    break
+                to_delete = []
+                for key, entry_size in rows:
+                    if size <= self.max_size:
+                        break
+                    to_delete.append((key,))
+                    size -= entry_size
+                self.db.executemany("DELETE FROM entries WHERE key = ?", to_delete)
+        self.db.commit()
+
+    def close(self) -> None:
+        log.info(
+            f"disk cache {self.path} had {self.hits} hits and {self.misses} misses"
+        )
+        self.db.close()
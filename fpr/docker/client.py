@@ -1,9 +1,15 @@
+import asyncio
+import collections
 import contextlib
+import logging
+import os
+import re
 from typing import (
     Any,
     AsyncContextManager,
     AsyncGenerator,
     BinaryIO,
+    Counter,
     IO,
     Sequence,
     List,
@@ -11,15 +17,142 @@ from typing import (
     Union,
     Dict,
     Optional,
+    Tuple,
 )
 
 import aiodocker
+import aiohttp
+
+from fpr.metrics_util import MetricsRegistry
+
+log = logging.getLogger("fpr.docker.client")
+
+# max. number of open connections to the docker daemon
+DEFAULT_CONNECTION_LIMIT = 32
+
+DEFAULT_DOCKER_HOST = "unix:///var/run/docker.sock"
+
+API_VERSION_RE = re.compile(r"^v[0-9.]+$")
+
+# path parts after a resource type that aren't object IDs or names
+ACTIONS_WITHOUT_ID = {"build", "create", "json", "load", "prune", "search"}
+
+
+def api_endpoint(path: str) -> str:
+    """Returns a docker API path without the API version and with object
+    IDs and names replaced with {id} e.g. containers/{id}/exec for
+    /v1.40/containers/3f4e.../exec
+    """
+    parts = [part for part in path.split("/") if part]
+    if parts and API_VERSION_RE.match(parts[0]):
+        parts = parts[1:]
+    if len(parts) < 2 or (len(parts) == 2 and parts[1] in ACTIONS_WITHOUT_ID):
+        return "/".join(parts)
+    return "/".join([parts[0], "{id}", *parts[2:][-1:]])
+
+
+class DockerClientManager:
+    """Shares one aiodocker client and connection pool between pipelines
+    and counts docker API calls by method and endpoint
+
+    The connection limit and call counts apply to unix socket and plain
+    TCP docker hosts. Other hosts (e.g. TLS) use aiodocker's defaults.
+    """
+
+    def __init__(self, connection_limit: int = DEFAULT_CONNECTION_LIMIT):
+        self.connection_limit = connection_limit
+        self.metrics: Optional[MetricsRegistry] = None
+        self.calls: Counter[Tuple[str, str]] = collections.Counter()
+        self.client: Optional[aiodocker.docker.Docker] = None
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def configure(
+        self, connection_limit: int, metrics: Optional[MetricsRegistry] = None
+    ) -> None:
+        self.connection_limit = connection_limit
+        self.metrics = metrics
+
+    async def on_request_start(
+        self,
+        session: aiohttp.ClientSession,
+        trace_config_ctx: Any,
+        params: aiohttp.TraceRequestStartParams,
+    ) -> None:
+        method, endpoint = params.method, api_endpoint(params.url.path)
+        self.calls[(method, endpoint)] += 1
+        if self.metrics is not None:
+            self.metrics.inc(
+                "fpr_docker_api_calls_total", method=method, endpoint=endpoint
+            )
+
+    def create(self) -> aiodocker.docker.Docker:
+        docker_host = os.environ.get("DOCKER_HOST", DEFAULT_DOCKER_HOST)
+        if docker_host.startswith("unix://"):
+            url = "unix://localhost"
+            connector: aiohttp.BaseConnector = aiohttp.UnixConnector(
+                docker_host[len("unix://") :], limit=self.connection_limit
+            )
+        elif (
+            docker_host.startswith("tcp://")
+            and os.environ.get("DOCKER_TLS_VERIFY", "0") != "1"
+        ):
+            url = "http://" + docker_host[len("tcp://") :]
+            connector = aiohttp.TCPConnector(limit=self.connection_limit)
+        else:
+            log.info(
+                f"using default docker client for {docker_host} without a "
+                "connection limit or API call counts"
+            )
+            return aiodocker.Docker()
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self.on_request_start)
+        self.session = aiohttp.ClientSession(
+            connector=connector, trace_configs=[trace_config]
+        )
+        log.debug(
+            f"created docker client for {docker_host} with connection limit "
+            f"{self.connection_limit}"
+        )
+        return aiodocker.Docker(url=url, connector=connector, session=self.session)
+
+    def get(self) -> aiodocker.docker.Docker:
+        "Returns the shared client for the running event loop"
+        loop = asyncio.get_running_loop()
+        if self.client is None or self.loop is not loop:
+            self.client, self.loop = self.create(), loop
+        return self.client
+
+    async def close(self) -> None:
+        if self.client is None:
+            return
+        if self.calls:
+            log.info(
+                f"made {sum(self.calls.values())} docker API calls: "
+                f"{dict(self.calls.most_common())}"
+            )
+        await self.client.close()
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.client, self.session, self.loop = None, None, None
+
+
+shared_client = DockerClientManager()
+
+# requests streaming for a container's lifetime (e.g. followed logs) use
+# their own connections without a limit (0 for aiohttp), so they can't
+# use up the shared client's connections and block other API calls
+streaming_client = DockerClientManager(connection_limit=0)
 
 
 @contextlib.asynccontextmanager
 async def aiodocker_client() -> AsyncGenerator[aiodocker.docker.Docker, None]:
-    client = aiodocker.Docker()
-    try:
-        yield client
-    finally:
-        await client.close()
+    "Yields the shared client, which run_pipeline closes at shutdown"
+    yield shared_client.get()
+
+
+@contextlib.asynccontextmanager
+async def aiodocker_streaming_client() -> AsyncGenerator[aiodocker.docker.Docker, None]:
+    "Yields the client for long lived streams, which run_pipeline closes at shutdown"
+    yield streaming_client.get()
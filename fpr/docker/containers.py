@@ -1,22 +1,26 @@
 import asyncio
 import contextlib
 import functools
+import hashlib
 import sys
 import os
 import logging
 import json
 import pathlib
+import re
 from io import BytesIO
+import shlex
 import tarfile
 import tempfile
 from typing import (
     Any,
     AsyncGenerator,
-    BinaryIO,
     IO,
+    Iterable,
     Sequence,
     List,
     Generator,
+    Mapping,
     Union,
     Dict,
     Optional,
@@ -24,11 +28,12 @@ from typing import (
 )
 import aiodocker
 
-from fpr.docker.client import aiodocker_client
+from fpr.docker.client import aiodocker_client, aiodocker_streaming_client
 import fpr.docker.log_reader as docker_log_reader
 import fpr.docker.volumes
 from fpr.models.git_ref import GitRef, GitRefKind
 from fpr.pipelines.util import exc_to_str
+from fpr.serialize_util import get_in
 
 log = logging.getLogger("fpr.containers")
 
@@ -63,6 +68,41 @@ class DockerRunException(Exception):
     pass
 
 
+# bytes to read from an exec output stream at a time
+EXEC_READ_CHUNK_SIZE = 64 * 1024
+
+# max. bytes of exec stdout or stderr to keep in memory before spooling to disk
+EXEC_SPOOL_MAX_SIZE = 1024 * 1024
+
+
+def iter_spool_records(
+    spool: IO[bytes], sep: bytes = b"\0", chunk_size: int = EXEC_READ_CHUNK_SIZE
+) -> Generator[bytes, None, None]:
+    "Yields sep terminated records (e.g. from git -z output) from a spool file"
+    buf = bytearray()
+    for chunk in iter_spool_chunks(spool, chunk_size):
+        buf += chunk
+        *records, rest = buf.split(sep)
+        yield from (bytes(record) for record in records)
+        buf = bytearray(rest)
+    if buf:
+        yield bytes(buf)
+
+
+def iter_spool_chunks(
+    spool: IO[bytes], chunk_size: int = EXEC_READ_CHUNK_SIZE
+) -> Generator[bytes, None, None]:
+    "Yields chunks of a spool file from the start without loading all of it"
+    offset = 0
+    while True:
+        spool.seek(offset)
+        chunk = spool.read(chunk_size)
+        if not chunk:
+            break
+        offset += len(chunk)
+        yield chunk
+
+
 class Exec:
     # from: https://github.com/hirokiky/aiodocker/blob/8a91b27cff7311398ca36f5453d94679fed99d11/aiodocker/execute.py
 
@@ -70,6 +110,11 @@ class Exec:
         self.exec_id: str = exec_id
         self.container: aiodocker.docker.DockerContainer = container
         self.start_result: Optional[bytes] = None
+        # set by Container.run when it waits or checks the exit code
+        self.last_inspect: Optional[DockerExecInspectResult] = None
+        # demultiplexed output from start_streaming
+        self.stdout: Optional[IO[bytes]] = None
+        self.stderr: Optional[IO[bytes]] = None
 
     @classmethod
     async def create(
@@ -103,6 +148,51 @@ class Exec:
             response.release()
             return result
 
+    async def start_streaming(
+        self: "Exec",
+        timeout: Optional[int] = None,
+        chunk_size: int = EXEC_READ_CHUNK_SIZE,
+        spool_max_size: int = EXEC_SPOOL_MAX_SIZE,
+        **kwargs,
+    ) -> None:
+        """
+        Start executing a process and write its stdout and stderr to
+        spool files in self.stdout and self.stderr as output arrives.
+
+        Keeps a chunk of the raw stream and up to spool_max_size bytes
+        per spool file in memory rather than the whole output.
+        """
+        self.stdout = tempfile.SpooledTemporaryFile(max_size=spool_max_size)
+        self.stderr = tempfile.SpooledTemporaryFile(max_size=spool_max_size)
+        spools = {
+            docker_log_reader.DockerLogStream.STDOUT: self.stdout,
+            docker_log_reader.DockerLogStream.STDERR: self.stderr,
+        }
+        parser = docker_log_reader.MessageParser()
+        response_cm = self.container.docker._query(
+            f"exec/{self.exec_id}/start",
+            method="POST",
+            headers={"content-type": "application/json"},
+            data=json.dumps(kwargs),
+            timeout=timeout,
+        )
+        async with response_cm as response:
+            async for chunk in response.content.iter_chunked(chunk_size):
+                if kwargs.get("Tty", False):
+                    # tty output is not multiplexed
+                    self.stdout.write(chunk)
+                    continue
+                parser.feed(chunk)
+                for stream, msg in parser.frames():
+                    spools[stream].write(msg)
+        parser.close()
+
+    def close(self: "Exec") -> None:
+        "Closes and removes the stdout and stderr spool files"
+        for spool in [self.stdout, self.stderr]:
+            if spool is not None:
+                spool.close()
+
     async def resize(self: "Exec", **kwargs) -> None:
         await self.container.docker._query(
             f"exec/{self.exec_id}/resize", method="POST", params=kwargs
@@ -114,26 +204,72 @@ class Exec:
         )
         return data
 
-    async def wait(self: "Exec") -> None:
-        while True:
-            resp = await self.inspect()
-            log.debug("Exec wait resp:", resp)
-            if resp["Running"] is False:
-                break
-            else:
-                await asyncio.sleep(0.1)
+    async def wait(self: "Exec") -> DockerExecInspectResult:
+        """Waits for the exec process to exit and returns its final inspect
+        result
+
+        Subscribes to the container's exec_die events before inspecting
+        so an exit between the two isn't missed. The subscription holds
+        its connection until the exec exits, so it uses the streaming
+        client to leave the shared client's connections for inspects.
+        """
+        filters = json.dumps(
+            dict(
+                type=["container"], event=["exec_die"], container=[self.container._id],
+            )
+        )
+        async with aiodocker_streaming_client() as streaming_client:
+            events_cm = streaming_client._query(
+                "events", method="GET", params=dict(filters=filters), timeout=None
+            )
+            async with events_cm as events:
+                resp = await self.inspect()
+                if resp["Running"] is False:
+                    return resp
+                async for line in events.content:
+                    if not line.strip():
+                        continue
+                    event = json.loads(line)
+                    log.debug(f"Exec wait event: {event}")
+                    if get_in(event, ["Actor", "Attributes", "execID"]) == self.exec_id:
+                        break
+        return await self.inspect()
 
     @property
     def decoded_start_result_stdout_and_stderr_line_iters(
         self: "Exec",
     ) -> Tuple[Generator[str, None, None], Generator[str, None, None]]:
+        if self.stdout is not None and self.stderr is not None:
+            return (
+                docker_log_reader.iter_newlines(iter_spool_chunks(self.stdout)),
+                docker_log_reader.iter_newlines(iter_spool_chunks(self.stderr)),
+            )
         assert self.start_result is not None
         return docker_log_reader.stdout_stderr_line_iters(
             docker_log_reader.iter_messages(self.start_result)
         )
 
+    @property
+    def decoded_start_result_stdout_and_stderr(self: "Exec") -> Tuple[str, str]:
+        "Returns all of stdout and stderr each decoded into one str"
+        if self.stdout is not None and self.stderr is not None:
+            return (
+                docker_log_reader.join_lines(iter_spool_chunks(self.stdout)),
+                docker_log_reader.join_lines(iter_spool_chunks(self.stderr)),
+            )
+        assert self.start_result is not None
+        stdout_msgs, stderr_msgs = docker_log_reader.split_streams(
+            docker_log_reader.iter_messages(self.start_result)
+        )
+        return (
+            docker_log_reader.join_lines(stdout_msgs),
+            docker_log_reader.join_lines(stderr_msgs),
+        )
+
     @property
     def decoded_start_result_stdout(self: "Exec") -> List[str]:
+        if self.stdout is not None:
+            return list(docker_log_reader.iter_newlines(iter_spool_chunks(self.stdout)))
         assert self.start_result is not None
         return list(
             docker_log_reader.iter_lines(
@@ -154,7 +290,7 @@ aiodocker.containers.DockerContainer.exec_create = _exec_create
 
 async def _run(
     self: aiodocker.containers.DockerContainer,
-    cmd: str,
+    cmd: Union[str, List[str]],
     attach_stdout: bool = True,
     attach_stderr: bool = True,
     detach: bool = False,
@@ -163,33 +299,76 @@ async def _run(
     # fpr specific args
     wait: bool = True,
     check: bool = True,
+    keep_output: bool = True,
     **kwargs,
 ) -> Exec:
     """Create and run an instance of exec (Instance of Exec). Optionally wait for it to finish and check its exit code
+
+    Splits str cmds on spaces. Pass a list for args containing spaces.
+    Callers close the returned exec's output spool files or pass
+    keep_output=False to close them before it's returned.
     """
     config = dict(
-        Cmd=cmd.split(" "), AttachStdout=attach_stdout, AttachStderr=attach_stderr
+        Cmd=cmd if isinstance(cmd, list) else cmd.split(" "),
+        AttachStdout=attach_stdout,
+        AttachStderr=attach_stderr,
     )
     if working_dir is not None:
         config["WorkingDir"] = working_dir
     container_log_name = self["Name"] if "Name" in self._container else self["Id"]
     log.debug(f"container {container_log_name} in {working_dir} running {cmd!r}")
     exec_ = await self.exec_create(**config)
-    exec_.start_result = await exec_.start(Detach=detach, Tty=tty)
+    await exec_.start_streaming(Detach=detach, Tty=tty)
 
     if wait:
-        await exec_.wait()
+        if not detach and (attach_stdout or attach_stderr):
+            # the attached output stream ends when the process exits
+            exec_.last_inspect = await exec_.inspect()
+        if exec_.last_inspect is None or exec_.last_inspect["Running"]:
+            exec_.last_inspect = await exec_.wait()
     if check:
-        last_inspect = await exec_.inspect()
+        if exec_.last_inspect is None:
+            exec_.last_inspect = await exec_.inspect()
+        last_inspect = exec_.last_inspect
         if last_inspect["ExitCode"] != 0:
+            exec_.close()
             raise DockerRunException(
                 f"{self._id} command {cmd} failed with non-zero exit code {last_inspect['ExitCode']}"
             )
+    if not keep_output:
+        exec_.close()
     return exec_
 
 
 aiodocker.containers.DockerContainer.run = _run
 
+# seconds to wait for a container's followed logs to end after stopping it
+LOG_FOLLOW_CLOSE_TIMEOUT = 10
+
+
+def container_log_path(log_dir: Optional[str], name: str) -> Optional[pathlib.Path]:
+    "Returns the file to capture container name's logs to or None to not capture them"
+    if log_dir is None:
+        return None
+    return pathlib.Path(log_dir) / f"{name}.log"
+
+
+async def follow_logs(
+    container: aiodocker.containers.DockerContainer, log_path: pathlib.Path
+) -> None:
+    """Appends the container's stdout and stderr to log_path as it
+    arrives until the container stops
+
+    Uses one streaming logs request instead of refetching the whole log.
+    run follows logs with the streaming client, since the request stays
+    open until the container stops.
+    """
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    with log_path.open("a", encoding="utf-8") as fout:
+        async for piece in container.log(stdout=True, stderr=True, follow=True):
+            fout.write(piece)
+            fout.flush()
+
 
 @contextlib.asynccontextmanager
 async def run(
@@ -199,6 +378,11 @@ async def run(
     entrypoint: Optional[str] = None,
     working_dir: Optional[str] = None,
     volumes: Optional[List[fpr.docker.volumes.DockerVolumeConfig]] = None,
+    binds: Optional[List[fpr.docker.volumes.DockerBindConfig]] = None,
+    env: Optional[Dict[str, str]] = None,
+    nano_cpus: Optional[int] = None,
+    memory: Optional[int] = None,
+    log_path: Optional[pathlib.Path] = None,
 ) -> AsyncGenerator[aiodocker.docker.DockerContainer, None]:
     async with aiodocker_client() as client:
         volume_configs: List[
@@ -221,17 +405,44 @@ async def run(
                 config["Entrypoint"] = entrypoint
             if working_dir:
                 config["WorkingDir"] = working_dir
+            if nano_cpus:
+                config["HostConfig"]["NanoCpus"] = nano_cpus
+            if memory:
+                config["HostConfig"]["Memory"] = memory
+            if env:
+                config["Env"] = [f"{name}={value}" for name, value in env.items()]
             if volumes:
                 config["Volumes"] = {cfg.mount_point: dict() for cfg in volume_configs}
                 config["HostConfig"]["Mounts"] = [
                     dict(Target=cfg.mount_point, Source=cfg.name, Type="volume")
                     for cfg in volume_configs
                 ]
+            if binds:
+                config["HostConfig"]["Mounts"] += [
+                    dict(
+                        Target=bind.mount_point,
+                        Source=bind.source,
+                        Type="bind",
+                        ReadOnly=bind.read_only,
+                    )
+                    for bind in binds
+                ]
             log.info(f"starting image {repository_tag} as {name}")
             log.debug(f"container {name} starting {cmd} with config {config}")
             container = await client.containers.run(config=config, name=name)
             # fetch container info so we can include container name in logs
             await container.show()
+            follow_task = None
+            if log_path is not None:
+                async with aiodocker_streaming_client() as streaming_client:
+                    follow_task = asyncio.ensure_future(
+                        follow_logs(
+                            aiodocker.containers.DockerContainer(
+                                streaming_client, **container._container
+                            ),
+                            log_path,
+                        )
+                    )
             try:
                 yield container
             except DockerRunException as e:
@@ -245,53 +456,54 @@ async def run(
                 )
             finally:
                 await container.stop()
+                if follow_task is not None:
+                    try:
+                        await asyncio.wait_for(follow_task, LOG_FOLLOW_CLOSE_TIMEOUT)
+                    except Exception as e:
+                        log.error(
+                            f"error capturing container {name} logs to {log_path}:\n{exc_to_str()}"
+                        )
                 await container.delete()
 
 
-@contextlib.contextmanager
-def temp_dockerfile_tgz(fileobject: BinaryIO) -> Generator[IO, None, None]:
-    """
-    Create a zipped tar archive from a Dockerfile
-    **Remember to close the file object**
-    Args:
-        fileobj: a Dockerfile
-    Returns:
-        a NamedTemporaryFile() object
-
-    from https://github.com/aio-libs/aiodocker/blob/335acade67eea409bc09a51309123134f3a3c57a/aiodocker/utils.py#L230
+def dockerfile_tgz(dockerfile: bytes) -> BytesIO:
     """
-    f = tempfile.NamedTemporaryFile()
-    t = tarfile.open(mode="w:gz", fileobj=f)
+    Returns an in memory gzipped tar archive with dockerfile as its
+    Dockerfile to use as a build context
 
-    if isinstance(fileobject, BytesIO):
+    adapted from https://github.com/aio-libs/aiodocker/blob/335acade67eea409bc09a51309123134f3a3c57a/aiodocker/utils.py#L230
+    """
+    f = BytesIO()
+    with tarfile.open(mode="w:gz", fileobj=f) as t:
         dfinfo = tarfile.TarInfo("Dockerfile")
-        dfinfo.size = len(fileobject.getvalue())
-        fileobject.seek(0)
-    else:
-        dfinfo = t.gettarinfo(fileobj=fileobject, arcname="Dockerfile")
-
-    t.addfile(dfinfo, fileobject)
-    t.close()
+        dfinfo.size = len(dockerfile)
+        t.addfile(dfinfo, BytesIO(dockerfile))
     f.seek(0)
-    try:
-        yield f
-    finally:
-        f.close()
+    return f
 
 
-async def build(dockerfile: bytes, tag: str, pull: bool = False) -> str:
+async def build(
+    dockerfile: bytes,
+    tag: str,
+    pull: bool = False,
+    labels: Optional[Dict[str, str]] = None,
+) -> str:
     # NB: can shell out to docker build if this doesn't work
     async with aiodocker_client() as client:
-        log.debug(f"building image {tag} with dockerfile:\n{dockerfile}")
-        with temp_dockerfile_tgz(BytesIO(dockerfile)) as tar_obj:
-            async for build_log_line in client.images.build(
-                fileobj=tar_obj,
-                encoding="utf-8",
-                rm=True,
-                tag=tag,
-                pull=pull,
-                stream=True,
-            ):
+        log.debug(f"building image {tag} with dockerfile:\n{dockerfile!r}")
+        async for build_log_line in client.images.build(
+            fileobj=dockerfile_tgz(dockerfile),
+            encoding="utf-8",
+            rm=True,
+            tag=tag,
+            pull=pull,
+            labels=labels,
+            quiet=True,
+            stream=True,
+        ):
+            if "error" in build_log_line:
+                log.error(f"building image {tag}: {build_log_line['error']}")
+            else:
                 log.debug(f"building image {tag}: {build_log_line}")
 
         image_info = await client.images.inspect(tag)
@@ -304,11 +516,18 @@ async def ensure_repo(
     repo_url: str,
     git_clean=True,
     working_dir="/",
+    shared=False,
 ) -> None:
     test_repo_exec: Exec = await container.run(
-        f"test -d repo", wait=True, check=False, working_dir=working_dir
+        f"test -d repo",
+        wait=True,
+        check=False,
+        working_dir=working_dir,
+        keep_output=False,
+    )
+    test_repo_exec_inspect_result = (
+        test_repo_exec.last_inspect or await test_repo_exec.inspect()
     )
-    test_repo_exec_inspect_result = await test_repo_exec.inspect()
     log.debug(f"test repo result: {test_repo_exec_inspect_result}")
     if test_repo_exec_inspect_result["ExitCode"] == 0:
         log.debug(
@@ -319,13 +538,31 @@ async def ensure_repo(
         if git_clean:
             cmds.append(("git clean -f -d -x -q", True))
         working_dir += "repo"
+    elif shared:
+        # borrow objects from a local mirror (e.g. a git_mirror_util mirror) instead of copying them
+        cmds = [
+            ("rm -rf repo", False),
+            (f"git clone --shared --origin origin {repo_url} repo", True),
+        ]
     else:
         cmds = [
             ("rm -rf repo", False),
             (f"git clone --depth=1 --origin origin {repo_url} repo", True),
         ]
     for cmd, check in cmds:
-        await container.run(cmd, wait=True, check=check, working_dir=working_dir)
+        await container.run(
+            cmd, wait=True, check=check, working_dir=working_dir, keep_output=False
+        )
+
+
+async def reset_repo(
+    container: aiodocker.containers.DockerContainer, working_dir="/repo"
+):
+    "Discards tracked and untracked changes to a checkout e.g. from running tasks"
+    for cmd in ["git reset --hard --quiet", "git clean -f -d -x -q"]:
+        await container.run(
+            cmd, wait=True, check=True, working_dir=working_dir, keep_output=False
+        )
 
 
 async def fetch_branch(
@@ -335,7 +572,9 @@ async def fetch_branch(
     working_dir: str = "/repo",
 ):
     cmd = f"git fetch {remote} {branch}"
-    await container.run(cmd, wait=True, check=True, working_dir=working_dir)
+    await container.run(
+        cmd, wait=True, check=True, working_dir=working_dir, keep_output=False
+    )
 
 
 async def fetch_commit(
@@ -346,15 +585,182 @@ async def fetch_commit(
 ):
     # per https://stackoverflow.com/a/30701724
     cmd = f"git fetch {remote} {commit}"
-    await container.run(cmd, wait=True, check=True, working_dir=working_dir)
+    await container.run(
+        cmd, wait=True, check=True, working_dir=working_dir, keep_output=False
+    )
 
 
 async def fetch_tags(
     container: aiodocker.containers.DockerContainer, working_dir="/repo"
 ):
     await container.run(
-        "git fetch --tags origin", working_dir=working_dir, wait=True, check=True
+        "git fetch --tags origin",
+        working_dir=working_dir,
+        wait=True,
+        check=True,
+        keep_output=False,
+    )
+
+
+async def fetch_refs(
+    container: aiodocker.containers.DockerContainer,
+    refs: List[GitRef],
+    working_dir="/repo",
+) -> List[str]:
+    """Fetches refs without checking them out and returns names for them
+    that git rev-parse and ls-tree accept
+    """
+    names: List[str] = []
+    if any(ref.kind == GitRefKind.TAG for ref in refs):
+        await fetch_tags(container, working_dir=working_dir)
+    for ref in refs:
+        if ref.kind == GitRefKind.BRANCH:
+            await fetch_branch(container, branch=ref.value, working_dir=working_dir)
+            names.append(f"origin/{ref.value}")
+        elif ref.kind == GitRefKind.COMMIT:
+            await fetch_commit(container, commit=ref.value, working_dir=working_dir)
+            names.append(ref.value)
+        else:
+            names.append(f"refs/tags/{ref.value}")
+    return names
+
+
+async def get_ref_commits(
+    container: aiodocker.containers.DockerContainer,
+    ref_names: List[str],
+    working_dir="/repo",
+) -> List[str]:
+    "Returns the commit for each ref name from one git rev-parse"
+    exec_ = await container.run(
+        ["git", "rev-parse", *[f"{name}^{{commit}}" for name in ref_names]],
+        working_dir=working_dir,
+        check=True,
     )
+    commits = exec_.decoded_start_result_stdout
+    exec_.close()
+    return commits
+
+
+async def get_tags_by_commit(
+    container: aiodocker.containers.DockerContainer, working_dir="/repo"
+) -> Dict[str, List[str]]:
+    "Returns sorted tag names by the commit they point at"
+    exec_ = await container.run(
+        [
+            "git",
+            "for-each-ref",
+            "--format=%(objectname) %(*objectname) %(refname:short)",
+            "refs/tags",
+        ],
+        working_dir=working_dir,
+        check=True,
+    )
+    tags: Dict[str, List[str]] = {}
+    for line in exec_.decoded_start_result_stdout:
+        object_name, peeled_object_name, tag_name = line.split(" ", 2)
+        tags.setdefault(peeled_object_name or object_name, []).append(tag_name)
+    exec_.close()
+    return {commit: sorted(tag_names) for commit, tag_names in tags.items()}
+
+
+async def ls_tree_blobs(
+    container: aiodocker.containers.DockerContainer,
+    ref_names: List[str],
+    working_dir="/repo",
+) -> Generator[Tuple[str, str, str], None, None]:
+    """Lists files in the trees of refs without checking them out
+
+    Returns a generator of (ref name, path, blob object name) for
+    regular and executable files (not symlinks or submodules).
+    """
+    # one exec for all refs; print a NUL terminated ref record before each tree
+    script = 'for ref in "$@"; do printf "ref %s\\0" "$ref"; git ls-tree -r -z --full-tree "$ref" || exit 1; done'
+    exec_ = await container.run(
+        ["bash", "-c", script, "ls_tree_blobs", *ref_names],
+        working_dir=working_dir,
+        check=True,
+    )
+    assert exec_.stdout is not None
+
+    def iter_blobs() -> Generator[Tuple[str, str, str], None, None]:
+        ref_name = ""
+        assert exec_.stdout is not None
+        try:
+            for record in iter_spool_records(exec_.stdout):
+                line = record.decode("utf-8", errors="surrogateescape")
+                if line.startswith("ref "):
+                    ref_name = line[len("ref ") :]
+                    continue
+                # e.g. "100644 blob 7f5c...\tpath/to/package.json"
+                meta, path = line.split("\t", 1)
+                mode, object_type, object_name = meta.split(" ")
+                if object_type == "blob" and mode in {"100644", "100755"}:
+                    yield ref_name, path, object_name
+        finally:
+            exec_.close()
+
+    return iter_blobs()
+
+
+# max. number of blobs to pass to one git cat-file --batch exec
+CAT_FILE_BATCH_SIZE = 10000
+
+
+def iter_cat_file_batch_sha256s(
+    spool: IO[bytes], chunk_size: int = EXEC_READ_CHUNK_SIZE
+) -> Generator[Tuple[str, str], None, None]:
+    """Yields (object name, sha256 hex digest of its contents) pairs from
+    git cat-file --batch output reading a chunk of contents at a time
+    """
+    spool.seek(0)
+    while True:
+        header = spool.readline()
+        if not header:
+            break
+        # e.g. b"7f5c... blob 1234\n" or b"7f5c... missing\n"
+        parts = header.decode("utf-8").split()
+        if len(parts) != 3:
+            log.warning(f"git cat-file did not find object: {header!r}")
+            continue
+        object_name, _, size = parts
+        remaining = int(size)
+        digest = hashlib.sha256()
+        while remaining:
+            chunk = spool.read(min(remaining, chunk_size))
+            if not chunk:
+                raise DockerRunException(
+                    f"truncated git cat-file output for {object_name}"
+                )
+            digest.update(chunk)
+            remaining -= len(chunk)
+        spool.read(1)  # trailing newline
+        yield object_name, digest.hexdigest()
+
+
+async def blob_sha256s(
+    container: aiodocker.containers.DockerContainer,
+    object_names: Iterable[str],
+    working_dir="/repo",
+) -> Dict[str, str]:
+    "Returns sha256 hex digests of blob contents by blob object name"
+    object_names = sorted(set(object_names))
+    sha256s: Dict[str, str] = {}
+    for start in range(0, len(object_names), CAT_FILE_BATCH_SIZE):
+        exec_ = await container.run(
+            [
+                "bash",
+                "-c",
+                'printf "%s\\n" "$@" | git cat-file --batch',
+                "blob_sha256s",
+                *object_names[start : start + CAT_FILE_BATCH_SIZE],
+            ],
+            working_dir=working_dir,
+            check=True,
+        )
+        assert exec_.stdout is not None
+        sha256s.update(iter_cat_file_batch_sha256s(exec_.stdout))
+        exec_.close()
+    return sha256s
 
 
 async def fetch_tag(
@@ -365,6 +771,7 @@ async def fetch_tag(
         working_dir=working_dir,
         wait=True,
         check=True,
+        keep_output=False,
     )
 
 
@@ -379,7 +786,11 @@ async def ensure_ref(
         await fetch_commit(container, commit=ref.value, working_dir=working_dir)
 
     await container.run(
-        f"git checkout {ref.value}", working_dir=working_dir, wait=True, check=True
+        f"git checkout {ref.value}",
+        working_dir=working_dir,
+        wait=True,
+        check=True,
+        keep_output=False,
     )
 
 
@@ -387,33 +798,225 @@ async def run_container_cmd_no_args_return_first_line_or_none(
     cmd: str, container: aiodocker.containers.DockerContainer, working_dir="/repo"
 ) -> Optional[str]:
     exec_ = await container.run(cmd, working_dir=working_dir, detach=False)
-    if len(exec_.decoded_start_result_stdout):
-        return exec_.decoded_start_result_stdout[0]
-    else:
-        return None
+    lines = exec_.decoded_start_result_stdout
+    exec_.close()
+    return lines[0] if lines else None
 
-    return exec_.decoded_start_result_stdout[0]
 
+# commands for info about the checked out ref
+REF_INFO_COMMANDS: Dict[str, str] = {
+    "branch": "git rev-parse --abbrev-ref HEAD",
+    "commit": "git rev-parse HEAD",
+    "tag": "git tag -l --points-at HEAD",
+}
 
 get_commit = functools.partial(
-    run_container_cmd_no_args_return_first_line_or_none, "git rev-parse HEAD"
+    run_container_cmd_no_args_return_first_line_or_none, REF_INFO_COMMANDS["commit"]
 )
 get_branch = functools.partial(
-    run_container_cmd_no_args_return_first_line_or_none,
-    "git rev-parse --abbrev-ref HEAD",
+    run_container_cmd_no_args_return_first_line_or_none, REF_INFO_COMMANDS["branch"]
 )
 get_tag = functools.partial(
-    run_container_cmd_no_args_return_first_line_or_none, "git tag -l --points-at HEAD"
+    run_container_cmd_no_args_return_first_line_or_none, REF_INFO_COMMANDS["tag"]
 )
 get_committer_timestamp = functools.partial(
     run_container_cmd_no_args_return_first_line_or_none,
     'git show -s --format="%ct" HEAD',
 )
+get_git_version = functools.partial(
+    run_container_cmd_no_args_return_first_line_or_none, "git --version"
+)
 get_ripgrep_version = functools.partial(
     run_container_cmd_no_args_return_first_line_or_none, "rg --version"
 )
 
 
+def cache_entries_to_prune(
+    records: Iterable[bytes],
+    max_size: int,
+    cache_dir: str,
+    entry_patterns: Sequence[str] = (),
+) -> Tuple[List[List[str]], int]:
+    """Returns the paths of the least recently used cache entries to
+    delete to bring a cache under max_size bytes and the cache size
+
+    Takes NUL terminated tab separated access time, modification time,
+    size, and path records from find -printf. Uses the later of the two
+    times since volumes are often mounted with noatime or relatime.
+
+    Groups files into entries by the first of entry_patterns matching
+    the start of their path relative to cache_dir. A match is deleted
+    whole, so packages and git repos aren't left partially deleted, and
+    matches with the same entry named group (e.g. a package's archive
+    and unpacked source dir) are deleted together. Files matching no
+    pattern are entries of their own.
+    """
+    patterns = [re.compile(pattern) for pattern in entry_patterns]
+    prefix = cache_dir.rstrip("/") + "/"
+    # entry key -> [last used time, size, paths to delete]
+    entries: Dict[str, List[Any]] = {}
+    total_size = 0
+    for record in records:
+        atime, mtime, file_size, path = record.decode(
+            "utf-8", errors="surrogateescape"
+        ).split("\t", 3)
+        used, size = max(float(atime), float(mtime)), int(file_size)
+        total_size += size
+
+        key, entry_path = path, path
+        relative_path = path[len(prefix) :] if path.startswith(prefix) else path
+        for pattern in patterns:
+            match = pattern.match(relative_path)
+            if match:
+                entry_path = prefix + match.group(0)
+                key = (
+                    match.group("entry")
+                    if "entry" in pattern.groupindex
+                    else match.group(0)
+                )
+                break
+        entry = entries.setdefault(key, [used, 0, []])
+        entry[0] = max(entry[0], used)
+        entry[1] += size
+        if entry_path not in entry[2]:
+            entry[2].append(entry_path)
+
+    to_delete: List[List[str]] = []
+    remaining = total_size
+    for _, size, paths in sorted(
+        entries.values(), key=lambda entry: (entry[0], entry[2])
+    ):
+        if remaining <= max_size:
+            break
+        to_delete.append(paths)
+        remaining -= size
+    return to_delete, total_size
+
+
+# max. number of paths to pass to one rm exec
+PRUNE_BATCH_SIZE = 1000
+
+
+async def prune_cache(
+    container: aiodocker.containers.DockerContainer,
+    cache_dir: str,
+    max_size: int,
+    entry_patterns: Sequence[str] = (),
+) -> int:
+    """Deletes least recently used entries from cache_dir over max_size
+    bytes and returns how many
+
+    See cache_entries_to_prune for entry_patterns.
+    """
+    exec_ = await container.run(
+        ["find", cache_dir, "-type", "f", "-printf", "%A@\\t%T@\\t%s\\t%p\\0"],
+        check=True,
+    )
+    assert exec_.stdout is not None
+    to_delete, total_size = cache_entries_to_prune(
+        iter_spool_records(exec_.stdout), max_size, cache_dir, entry_patterns
+    )
+    exec_.close()
+    log.info(
+        f"pruning {len(to_delete)} entries from {total_size} byte cache {cache_dir} to {max_size} bytes"
+    )
+    # delete an entry's paths in the same rm
+    batches: List[List[str]] = [[]]
+    for paths in to_delete:
+        if len(batches[-1]) >= PRUNE_BATCH_SIZE:
+            batches.append([])
+        batches[-1].extend(paths)
+    for batch in batches:
+        if batch:
+            await container.run(
+                ["rm", "-rf", "--", *batch], check=True, keep_output=False
+            )
+    return len(to_delete)
+
+
+def probe_script(commands: Mapping[str, str]) -> str:
+    """Returns a bash script printing NUL terminated name, exit code, and
+    stdout records for each command
+
+    Commands are split on spaces like Container.run does.
+    """
+    return "".join(
+        f'out=$({shlex.join(command.split(" "))} 2>/dev/null); '
+        f'printf "%s\\0%s\\0%s\\0" {shlex.quote(name)} "$?" "$out"; '
+        for name, command in commands.items()
+    )
+
+
+def parse_probe_records(records: Iterable[bytes]) -> Dict[str, Optional[str]]:
+    "Returns the first line of output by command name or None for failed commands"
+    results: Dict[str, Optional[str]] = {}
+    record_iter = iter(records)
+    for name, exit_code, output in zip(record_iter, record_iter, record_iter):
+        command_name = name.decode("utf-8")
+        if exit_code != b"0":
+            log.warning(
+                f"probe command {command_name} failed with exit code {exit_code.decode('utf-8')}"
+            )
+            results[command_name] = None
+        else:
+            results[command_name] = (
+                output.decode("utf-8").split("\n", 1)[0] if output else None
+            )
+    return results
+
+
+async def probe(
+    container: aiodocker.containers.DockerContainer,
+    commands: Mapping[str, str],
+    working_dir: str = "/repo",
+) -> Dict[str, Optional[str]]:
+    """Runs commands in one exec and returns the first line of stdout
+    for each by name (None for no output or non-zero exit codes)
+    """
+    if not commands:
+        return {}
+    exec_ = await container.run(
+        ["bash", "-c", probe_script(commands)], working_dir=working_dir, check=True
+    )
+    assert exec_.stdout is not None
+    results = parse_probe_records(iter_spool_records(exec_.stdout))
+    exec_.close()
+    return results
+
+
+# version command output by docker image ID and command
+image_versions: Dict[str, Dict[str, Optional[str]]] = {}
+
+
+async def probe_ref_info_and_versions(
+    container: aiodocker.containers.DockerContainer,
+    version_commands: Mapping[str, str],
+    working_dir: str = "/repo",
+) -> Tuple[Dict[str, Optional[str]], Dict[str, Optional[str]]]:
+    """Returns the branch, commit, and tag of the checked out ref and
+    the output of each version command by name from one exec
+
+    Memoizes version outputs by the container's image ID.
+    """
+    versions = image_versions.setdefault(container["Image"], {})
+    uncached_version_commands = {
+        command: command
+        for command in version_commands.values()
+        if command not in versions
+    }
+    results = await probe(
+        container,
+        {**REF_INFO_COMMANDS, **uncached_version_commands},
+        working_dir=working_dir,
+    )
+    for command in uncached_version_commands:
+        versions[command] = results[command]
+    return (
+        {name: results[name] for name in REF_INFO_COMMANDS},
+        {name: versions[command] for name, command in version_commands.items()},
+    )
+
+
 async def find_files(
     search_patterns: List[str],
     container: aiodocker.containers.DockerContainer,
@@ -423,9 +1026,10 @@ async def find_files(
     for search_pattern in search_patterns:
         cmd += f" --iglob {search_pattern}"
     exec_ = await container.run(cmd, working_dir=working_dir, check=True)
-    log.info(f"{cmd} result: {exec_.start_result}")
-
-    return exec_.decoded_start_result_stdout
+    files = exec_.decoded_start_result_stdout
+    exec_.close()
+    log.debug(f"{cmd} result: {files}")
+    return files
 
 
 async def get_tags(
@@ -440,7 +1044,9 @@ async def get_tags(
         ' --format="%(refname:short)\t%(taggerdate:unix)\t%(creatordate:unix)" refs/tags'
     )
     exec_ = await container.run(cmd, working_dir=working_dir, check=True)
-    for line in exec_.decoded_start_result_stdout:
+    lines = exec_.decoded_start_result_stdout
+    exec_.close()
+    for line in lines:
         tag_name, tag_ts, commit_ts = [part.strip('",') for part in line.split("\t", 2)]
         if tag_ts == "":
             tag_ts = None
@@ -452,11 +1058,15 @@ async def get_tags(
 async def nodejs_metadata(
     container: aiodocker.containers.DockerContainer, working_dir: str = "/repo"
 ) -> str:
-    await container.run("npm install", working_dir=working_dir, check=True)
+    await container.run(
+        "npm install", working_dir=working_dir, check=True, keep_output=False
+    )
     exec_ = await container.run(
         "npm ls --json --long", working_dir=working_dir, check=True
     )
-    return exec_.decoded_start_result_stdout[0]
+    lines = exec_.decoded_start_result_stdout
+    exec_.close()
+    return lines[0]
 
 
 async def nodejs_audit(
@@ -466,7 +1076,9 @@ async def nodejs_audit(
     exec_ = await container.run(
         "npm audit --json", working_dir=working_dir, check=False
     )
-    return exec_.decoded_start_result_stdout[0]
+    lines = exec_.decoded_start_result_stdout
+    exec_.close()
+    return lines[0]
 
 
 async def sha256sum(
@@ -1,26 +1,98 @@
-import argparse
 import asyncio
+import hashlib
 import logging
-from typing import Iterable
+from typing import Any, Dict, Iterable, Optional
+
+import aiodocker
 
 import fpr.docker.containers as containers
+from fpr.docker.client import aiodocker_client
 from fpr.models.docker_image import DockerImage
 from fpr.pipelines.util import exc_to_str
+from fpr.serialize_util import get_in
 
 log = logging.getLogger("fpr.docker.images")
 
+# label for the hash of the dockerfile and base image an image was built from
+BUILD_HASH_LABEL = "fpr.build-sha256"
+
+# base image repo_name_tag to its pull for the running event loop
+base_image_pulls: Dict[str, asyncio.Future] = {}
+
+
+class DockerBuildException(Exception):
+    pass
+
+
+def build_hash(dockerfile: bytes, base_image_id: str) -> str:
+    "Returns a hex sha256 of a dockerfile and the ID of its base image"
+    hasher = hashlib.sha256()
+    hasher.update(base_image_id.encode("utf-8"))
+    hasher.update(b"\0")
+    hasher.update(dockerfile)
+    return hasher.hexdigest()
+
+
+async def inspect_image(name: str) -> Optional[Dict[str, Any]]:
+    "Returns docker image inspect output for name or None if it doesn't exist"
+    async with aiodocker_client() as client:
+        try:
+            return await client.images.inspect(name)
+        except aiodocker.exceptions.DockerError as err:
+            if err.status == 404:
+                return None
+            raise err
+
+
+async def pull(name: str) -> None:
+    async with aiodocker_client() as client:
+        log.info(f"pulling base image {name}")
+        await client.images.pull(name)
+
+
+async def pull_once(name: str) -> None:
+    "Pulls an image at most once per run; concurrent callers share the pull"
+    loop = asyncio.get_running_loop()
+    pull_future = base_image_pulls.get(name, None)
+    if pull_future is None or pull_future.get_loop() is not loop:
+        pull_future = base_image_pulls[name] = asyncio.ensure_future(pull(name))
+    await asyncio.shield(pull_future)
+
+
+async def build_image(docker_pull: bool, image: DockerImage) -> str:
+    """Builds and tags image unless an image with its local tag was
+    already built from the same dockerfile and base image
+
+    Returns the local tag.
+    """
+    base_name, local_name = image.base.repo_name_tag, image.local.repo_name_tag
+    base_info = None if docker_pull else await inspect_image(base_name)
+    if base_info is None:
+        await pull_once(base_name)
+        base_info = await inspect_image(base_name)
+    if base_info is None:
+        raise DockerBuildException(f"base image {base_name} not found after pulling it")
+
+    dockerfile = image.dockerfile_bytes
+    image_hash = build_hash(dockerfile, base_info["Id"])
+    local_info = await inspect_image(local_name)
+    if (
+        local_info is not None
+        and get_in(local_info, ["Config", "Labels", BUILD_HASH_LABEL]) == image_hash
+    ):
+        log.info(f"skipping build of up to date image {local_name} {image_hash}")
+        return local_name
+    return await containers.build(
+        dockerfile, local_name, labels={BUILD_HASH_LABEL: image_hash}
+    )
+
 
 async def build_images(
     docker_pull: bool, images: Iterable[DockerImage]
 ) -> Iterable[str]:
     try:
         built_image_tags: Iterable[str] = await asyncio.gather(
-            *[
-                containers.build(
-                    image.dockerfile_bytes, image.local.repo_name, pull=docker_pull
-                )
-                for image in images
-            ]
+            *[build_image(docker_pull, image) for image in images]
         )
         return built_image_tags
     except Exception as err:
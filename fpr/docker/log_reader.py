@@ -1,3 +1,4 @@
+import codecs
 import enum
 import logging
 import struct
@@ -11,6 +12,8 @@ from typing import (
     IO,
     Iterable,
     Iterator,
+    List,
+    Optional,
     Sequence,
     Tuple,
     TypeVar,
@@ -36,7 +39,8 @@ class DockerLogStream(enum.Enum):
     STDERR = 2
 
 
-DockerLogMessage = bytes
+# a memoryview for messages from MessageParser
+DockerLogMessage = Union[bytes, memoryview]
 
 
 # byte lengths from https://github.com/moby/moby/blob/master/pkg/stdcopy/stdcopy.go
@@ -63,7 +67,6 @@ def stream_no_to_DockerLogStream(stream_no: int) -> DockerLogStream:
 
 
 def read_message(msg_bytes: bytes) -> Tuple[DockerLogStream, bytes, bytes]:
-    log.debug(f"reading {len(msg_bytes)} byte message {msg_bytes}")
     if len(msg_bytes) < HEADER_LENGTH:
         raise DockerLogReadError(
             f"Too few bytes in {msg_bytes}. Need at least {HEADER_LENGTH}."
@@ -82,23 +85,85 @@ def read_message(msg_bytes: bytes) -> Tuple[DockerLogStream, bytes, bytes]:
     )
 
 
+class MessageParser:
+    """Incrementally parses docker log messages from chunks of a raw
+    stream e.g. as they arrive from the docker API
+
+    .feed() a chunk then iterate over .frames() for the messages it
+    completes. Messages within a chunk are memoryviews of the chunk
+    rather than copies. Only a message split across chunks is copied
+    into a buffer (once) and then handed off to the caller.
+    """
+
+    def __init__(self) -> None:
+        # bytes of a message split across chunks
+        self.buf = bytearray()
+        # the last fed chunk and offset of its first unparsed byte
+        self.chunk = memoryview(b"")
+        self.offset = 0
+
+    def feed(self, chunk: bytes) -> None:
+        if self.offset < len(self.chunk):
+            # frames() wasn't drained; parse the rest of the last chunk first
+            chunk = b"".join([self.buf, self.chunk[self.offset :], chunk])
+            self.buf = bytearray()
+        self.chunk, self.offset = memoryview(chunk), 0
+
+    def take(self, n_bytes: int) -> None:
+        "Appends up to n_bytes from the chunk to the buffered partial message"
+        end = min(self.offset + n_bytes, len(self.chunk))
+        self.buf += self.chunk[self.offset : end]
+        self.offset = end
+
+    def frames(
+        self,
+    ) -> Generator[Tuple[DockerLogStream, DockerLogMessage], None, None]:
+        "Yields messages completed by the fed chunks"
+        chunk = self.chunk
+        while True:
+            if self.buf:
+                if len(self.buf) < HEADER_LENGTH:
+                    self.take(HEADER_LENGTH - len(self.buf))
+                    if len(self.buf) < HEADER_LENGTH:
+                        return
+                stream_no, msg_length = struct.unpack_from(LOG_HEADER_FORMAT, self.buf)
+                stream = stream_no_to_DockerLogStream(stream_no)
+                self.take(HEADER_LENGTH + msg_length - len(self.buf))
+                if len(self.buf) < HEADER_LENGTH + msg_length:
+                    return
+                msg, self.buf = memoryview(self.buf)[HEADER_LENGTH:], bytearray()
+                yield stream, msg
+                continue
+
+            offset = self.offset
+            if len(chunk) - offset < HEADER_LENGTH:
+                self.take(HEADER_LENGTH)
+                return
+            stream_no, msg_length = struct.unpack_from(LOG_HEADER_FORMAT, chunk, offset)
+            stream = stream_no_to_DockerLogStream(stream_no)
+            msg_end = offset + HEADER_LENGTH + msg_length
+            if len(chunk) < msg_end:
+                self.take(msg_end - offset)
+                return
+            self.offset = msg_end
+            yield stream, chunk[offset + HEADER_LENGTH : msg_end]
+
+    def close(self) -> None:
+        "Raises DockerLogReadError if the stream ended in a partial message"
+        pending = len(self.buf) + len(self.chunk) - self.offset
+        if pending:
+            raise DockerLogReadError(
+                f"stream ended with {pending} bytes of a partial message"
+            )
+
+
 def iter_messages(
     msg_bytes: bytes,
 ) -> Generator[Tuple[DockerLogStream, DockerLogMessage], None, None]:
-    msg_bytes_remaining = msg_bytes
-    log.debug(f"itering through {len(msg_bytes)} msg bytes")
-    while True:
-        if not msg_bytes_remaining:
-            log.debug(f"nothing to read from {msg_bytes_remaining}")
-            break
-
-        stream, content, msg_bytes_remaining = read_message(msg_bytes_remaining)
-        log.debug(
-            f"read msg {stream} ({len(content)} bytes, {len(msg_bytes_remaining)} left) {content}"
-        )
-        yield stream, content
-        if not msg_bytes_remaining:
-            break
+    parser = MessageParser()
+    parser.feed(msg_bytes)
+    yield from parser.frames()
+    parser.close()
 
 
 def partition(
@@ -128,27 +193,116 @@ def split_streams(
     )
 
 
+@enum.unique
+class LongLinePolicy(enum.Enum):
+    # yield max_line_length byte pieces of the line as separate lines
+    SPLIT = "split"
+    # yield the first max_line_length bytes of the line and drop the rest
+    TRUNCATE = "truncate"
+    # raise a DockerLogReadError
+    ERROR = "error"
+
+
+class LineSplitter:
+    """Incrementally splits chunks of a byte stream into '\n' delimited
+    lines decoded as utf8
+
+    Buffers the current line in a bytearray and decodes with an
+    incremental decoder, so long lines take linear time and multibyte
+    characters can be split across chunks.
+    """
+
+    def __init__(
+        self,
+        max_line_length: Optional[int] = None,
+        long_line_policy: LongLinePolicy = LongLinePolicy.SPLIT,
+    ):
+        self.max_line_length = max_line_length
+        self.long_line_policy = long_line_policy
+        self.buf = bytearray()
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        # whether the rest of the current line is being dropped
+        self.truncated = False
+
+    def append(self, piece: bytes, lines: List[str]) -> None:
+        "Adds part of a line to the buffer applying the long line policy"
+        if self.truncated:
+            return
+        self.buf += piece
+        max_length = self.max_line_length
+        if max_length is None or len(self.buf) <= max_length:
+            return
+        if self.long_line_policy == LongLinePolicy.ERROR:
+            raise DockerLogReadError(f"line longer than {max_length} bytes")
+        elif self.long_line_policy == LongLinePolicy.TRUNCATE:
+            lines.append(self.decoder.decode(self.buf[:max_length]))
+            self.decoder.reset()
+            self.buf.clear()
+            self.truncated = True
+        else:
+            split_end = len(self.buf) - len(self.buf) % max_length
+            if split_end == len(self.buf):
+                # keep the last piece to end the line with
+                split_end -= max_length
+            for start in range(0, split_end, max_length):
+                lines.append(self.decoder.decode(self.buf[start : start + max_length]))
+            del self.buf[:split_end]
+
+    def end_line(self, lines: List[str]) -> None:
+        if not self.truncated:
+            lines.append(self.decoder.decode(self.buf, final=True))
+        self.decoder.reset()
+        self.buf.clear()
+        self.truncated = False
+
+    def feed(self, chunk: DockerLogMessage) -> List[str]:
+        "Returns lines completed by chunk"
+        data = bytes(chunk)
+        lines: List[str] = []
+        start = 0
+        while True:
+            newline = data.find(b"\n", start)
+            if newline == -1:
+                self.append(data[start:], lines)
+                return lines
+            self.append(data[start:newline], lines)
+            self.end_line(lines)
+            start = newline + 1
+
+    def close(self) -> List[str]:
+        "Returns the last line if the stream didn't end with a newline"
+        lines: List[str] = []
+        if self.buf or self.truncated:
+            self.end_line(lines)
+        return lines
+
+
 def iter_newlines(
     msg_bytes_iter: Iterable[DockerLogMessage],
+    max_line_length: Optional[int] = None,
+    long_line_policy: LongLinePolicy = LongLinePolicy.SPLIT,
 ) -> Generator[str, None, None]:
     """
     Returns content of '\n' delimited lines decoded as utf8 for an iterator over bytes
     """
-    buf = bytes()
+    splitter = LineSplitter(max_line_length, long_line_policy)
     for msg_bytes in msg_bytes_iter:
-        before = msg_bytes
-        while True:
-            before, newline, after = before.partition(b"\n")
-            if newline:
-                yield str(buf + before, encoding="utf-8")
-                buf = bytes()
-                before = after
-            else:
-                buf += before
-                break
-
-    if len(buf):
-        yield buf.decode("utf-8")
+        yield from splitter.feed(msg_bytes)
+    yield from splitter.close()
+
+
+def join_lines(msg_bytes_iter: Iterable[DockerLogMessage]) -> str:
+    """
+    Returns '\n'.join(iter_newlines(msg_bytes_iter)) without splitting the
+    stream into lines i.e. the stream decoded as utf8 without one trailing
+    newline
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    text = "".join(
+        [decoder.decode(msg_bytes) for msg_bytes in msg_bytes_iter]
+        + [decoder.decode(b"", final=True)]
+    )
+    return text[:-1] if text.endswith("\n") else text
 
 
 def iter_lines(
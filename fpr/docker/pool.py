@@ -0,0 +1,155 @@
+import collections
+import contextlib
+from dataclasses import dataclass
+import logging
+import time
+from typing import (
+    AsyncContextManager,
+    AsyncGenerator,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+)
+
+import aiodocker
+
+import fpr.docker.containers as containers
+from fpr.pipelines.util import exc_to_str
+
+log = logging.getLogger("fpr.docker.pool")
+
+# resets a reused container e.g. with containers.reset_repo
+ResetFn = Callable[[aiodocker.containers.DockerContainer], Awaitable[None]]
+
+
+@dataclass
+class PooledContainer:
+    key: Hashable
+    container: aiodocker.containers.DockerContainer
+    # exits the context manager that started the container
+    exit_stack: contextlib.AsyncExitStack
+    last_used: float
+
+    @property
+    def log_name(self) -> str:
+        container = self.container
+        return container["Name"] if "Name" in container._container else container["Id"]
+
+
+class ContainerPool:
+    """Keeps started containers to reuse for later items with the same key
+    (e.g. image and org/repo)
+
+    Keeps up to max_idle idle containers and stops containers idle for
+    more than idle_timeout seconds. With max_idle 0 containers are
+    stopped after each use like containers.run.
+    """
+
+    def __init__(self, max_idle: int = 4, idle_timeout: float = 60.0):
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        # idle containers by key from least to most recently used
+        self.idle: Dict[Hashable, List[PooledContainer]] = collections.defaultdict(list)
+
+    @property
+    def idle_count(self) -> int:
+        return sum(len(pooled) for pooled in self.idle.values())
+
+    async def discard(self, pooled: PooledContainer) -> None:
+        log.debug(f"stopping pooled container {pooled.log_name} for {pooled.key}")
+        try:
+            await pooled.exit_stack.aclose()
+        except Exception as e:
+            log.error(f"error stopping pooled container:\n{exc_to_str()}")
+
+    async def evict(self) -> None:
+        "Stops idle containers past the idle timeout or over max idle"
+        now = time.monotonic()
+        evicted: List[PooledContainer] = []
+        for key, pooled_containers in self.idle.items():
+            expired = [
+                pooled
+                for pooled in pooled_containers
+                if now - pooled.last_used > self.idle_timeout
+            ]
+            evicted.extend(expired)
+            self.idle[key] = [p for p in pooled_containers if p not in expired]
+
+        lru = sorted(
+            (
+                pooled
+                for pooled_containers in self.idle.values()
+                for pooled in pooled_containers
+            ),
+            key=lambda pooled: pooled.last_used,
+        )
+        for pooled in lru[: max(len(lru) - self.max_idle, 0)]:
+            self.idle[pooled.key].remove(pooled)
+            evicted.append(pooled)
+
+        for pooled in evicted:
+            await self.discard(pooled)
+
+    async def reuse(
+        self, key: Hashable, reset: Optional[ResetFn],
+    ) -> Optional[PooledContainer]:
+        "Returns the most recently used idle container for key after resetting it"
+        while self.idle[key]:
+            pooled = self.idle[key].pop()
+            if reset is None:
+                return pooled
+            try:
+                await reset(pooled.container)
+                log.debug(f"reusing pooled container {pooled.log_name} for {key}")
+                return pooled
+            except Exception as e:
+                log.warning(
+                    f"error resetting pooled container {pooled.log_name}:\n{exc_to_str()}"
+                )
+                await self.discard(pooled)
+        return None
+
+    @contextlib.asynccontextmanager
+    async def acquire(
+        self,
+        key: Hashable,
+        start: Callable[[], AsyncContextManager[aiodocker.containers.DockerContainer]],
+        reset: Optional[ResetFn] = None,
+    ) -> AsyncGenerator[aiodocker.containers.DockerContainer, None]:
+        """Yields an idle container for key reset with reset or a container
+        started with start (e.g. a partial of containers.run)
+
+        The container returns to the pool unless the with block raises.
+        Logs DockerRunExceptions like containers.run.
+        """
+        await self.evict()
+        pooled = await self.reuse(key, reset)
+        if pooled is None:
+            exit_stack = contextlib.AsyncExitStack()
+            container = await exit_stack.enter_async_context(start())
+            pooled = PooledContainer(key, container, exit_stack, time.monotonic())
+
+        try:
+            yield pooled.container
+        except containers.DockerRunException as e:
+            log.error(
+                f"{pooled.log_name} error running docker command:\n{exc_to_str()}"
+            )
+            await self.discard(pooled)
+            return
+        except BaseException:
+            await self.discard(pooled)
+            raise
+
+        pooled.last_used = time.monotonic()
+        self.idle[key].append(pooled)
+        await self.evict()
+
+    async def close(self) -> None:
+        "Stops all idle containers"
+        for pooled_containers in self.idle.values():
+            while pooled_containers:
+                await self.discard(pooled_containers.pop())
@@ -0,0 +1,178 @@
+import asyncio
+import collections
+import contextlib
+from dataclasses import dataclass
+import logging
+import os
+from typing import AsyncGenerator, Callable, Deque, Optional, Tuple
+
+from fpr.docker.client import aiodocker_client
+from fpr.metrics_util import MetricsRegistry
+
+log = logging.getLogger("fpr.docker.scheduler")
+
+
+@dataclass
+class JobResources:
+    "Limits for a container job's CPUs and memory in bytes (None for no limit)"
+    cpus: Optional[float] = None
+    memory: Optional[int] = None
+
+    @property
+    def nano_cpus(self) -> Optional[int]:
+        return None if self.cpus is None else int(self.cpus * 1e9)
+
+
+@dataclass
+class SchedulerSlot:
+    resources: JobResources
+    # number of concurrency limit decreases when the job was admitted
+    epoch: int
+    # set to count the job as failed when adjusting the concurrency limit
+    failed: bool = False
+
+
+def host_load() -> float:
+    "Returns the one minute load average per CPU of this host"
+    return os.getloadavg()[0] / (os.cpu_count() or 1)
+
+
+async def docker_host_resources() -> Tuple[int, int]:
+    "Returns the number of CPUs and bytes of memory of the docker host"
+    async with aiodocker_client() as client:
+        info = await client.system.info()
+    return info["NCPU"], info["MemTotal"]
+
+
+class ContainerScheduler:
+    """Admits container jobs in order while their resource limits fit in
+    a CPU and memory budget and fewer jobs than a concurrency limit are
+    running
+
+    The concurrency limit starts at max_concurrency and adapts with AIMD.
+    It grows by 1 / limit when a job finishes with host load under
+    max_load and is multiplied by decrease_factor when a job fails or
+    host load is over max_load. Jobs admitted before a decrease don't
+    decrease it again, so a burst of failures only halves it once.
+
+    One job is always admitted when none are running, so a job with
+    limits over the budget runs alone instead of waiting forever.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        cpu_budget: Optional[float] = None,
+        memory_budget: Optional[int] = None,
+        min_concurrency: int = 1,
+        max_load: float = 1.0,
+        decrease_factor: float = 0.5,
+        load_fn: Callable[[], float] = host_load,
+        metrics: Optional[MetricsRegistry] = None,
+    ):
+        self.max_concurrency = max(max_concurrency, min_concurrency)
+        self.min_concurrency = min_concurrency
+        self.cpu_budget = cpu_budget
+        self.memory_budget = memory_budget
+        self.max_load = max_load
+        self.decrease_factor = decrease_factor
+        self.load_fn = load_fn
+        self.metrics = metrics
+
+        self.limit = float(self.max_concurrency)
+        self.decreases = 0
+        self.slots_used = 0
+        self.cpus_used = 0.0
+        self.memory_used = 0
+        # tickets of jobs waiting to be admitted in arrival order
+        self.queue: Deque[object] = collections.deque()
+        self.condition = asyncio.Condition()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self.queue)
+
+    def fits(self, resources: JobResources) -> bool:
+        if self.slots_used == 0:
+            return True
+        if self.slots_used >= int(self.limit):
+            return False
+        if (
+            self.cpu_budget is not None
+            and resources.cpus is not None
+            and self.cpus_used + resources.cpus > self.cpu_budget
+        ):
+            return False
+        if (
+            self.memory_budget is not None
+            and resources.memory is not None
+            and self.memory_used + resources.memory > self.memory_budget
+        ):
+            return False
+        return True
+
+    def update_metrics(self) -> None:
+        if self.metrics is None:
+            return
+        self.metrics.set("fpr_scheduler_queue_depth", self.queue_depth)
+        self.metrics.set("fpr_scheduler_slots_used", self.slots_used)
+        self.metrics.set("fpr_scheduler_concurrency_limit", int(self.limit))
+        self.metrics.set("fpr_scheduler_cpus_used", self.cpus_used)
+        self.metrics.set("fpr_scheduler_memory_bytes_used", self.memory_used)
+
+    def adjust(self, slot: SchedulerSlot) -> None:
+        "Updates the concurrency limit after a job finishes"
+        load = self.load_fn()
+        if slot.failed or load > self.max_load:
+            if slot.epoch == self.decreases:
+                self.limit = max(
+                    float(self.min_concurrency), self.limit * self.decrease_factor
+                )
+                self.decreases += 1
+                log.info(
+                    f"decreased container job concurrency to {int(self.limit)} "
+                    f"(job failed: {slot.failed}, host load: {load:.2f})"
+                )
+        else:
+            self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+
+    @contextlib.asynccontextmanager
+    async def slot(
+        self, resources: JobResources
+    ) -> AsyncGenerator[SchedulerSlot, None]:
+        "Waits for the job to be admitted and releases its resources after it"
+        ticket = object()
+        async with self.condition:
+            self.queue.append(ticket)
+            self.update_metrics()
+            try:
+                await self.condition.wait_for(
+                    lambda: self.queue[0] is ticket and self.fits(resources)
+                )
+            finally:
+                self.queue.remove(ticket)
+                self.condition.notify_all()
+            slot = SchedulerSlot(resources, self.decreases)
+            self.slots_used += 1
+            self.cpus_used += resources.cpus or 0.0
+            self.memory_used += resources.memory or 0
+            self.update_metrics()
+
+        try:
+            yield slot
+        except Exception:
+            slot.failed = True
+            raise
+        finally:
+            async with self.condition:
+                self.slots_used -= 1
+                self.cpus_used -= resources.cpus or 0.0
+                self.memory_used -= resources.memory or 0
+                self.adjust(slot)
+                if self.metrics is not None:
+                    self.metrics.inc(
+                        "fpr_scheduler_jobs_total",
+                        result="failed" if slot.failed else "ok",
+                    )
+                self.update_metrics()
+                self.condition.notify_all()
@@ -20,6 +20,14 @@ class DockerVolumeConfig:
     delete: bool = True
 
 
+@dataclass
+class DockerBindConfig:
+    "A host directory to mount in a container e.g. a git mirror cache"
+    source: str
+    mount_point: str
+    read_only: bool = True
+
+
 async def list_volumes(
     client: aiodocker.docker.Docker, filters: Optional[Dict[str, str]] = None
 ) -> Dict[str, Union[List[str], List[DockerVolumeResponseJSON]]]:
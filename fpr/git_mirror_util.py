@@ -0,0 +1,97 @@
+import argparse
+import asyncio
+import functools
+import logging
+import pathlib
+from typing import Dict, List, Tuple
+
+from fpr.docker.volumes import DockerBindConfig
+from fpr.models.org_repo import OrgRepo
+
+log = logging.getLogger("fpr.git_mirror_util")
+
+# where containers mount the mirror cache dir
+MIRROR_MOUNT_POINT = "/mirrors"
+
+
+class GitMirrorError(Exception):
+    pass
+
+
+async def run_git(*git_args: str) -> str:
+    "Runs git on the host and returns its stdout"
+    proc = await asyncio.create_subprocess_exec(
+        "git",
+        *git_args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        raise GitMirrorError(
+            f"git {' '.join(git_args)} failed with exit code {proc.returncode}: "
+            f"{stderr.decode('utf-8', errors='replace')}"
+        )
+    return stdout.decode("utf-8")
+
+
+class GitMirrorCache:
+    """Bare mirrors of repos in a host directory to clone from in
+    containers instead of the remote
+
+    Each mirror is cloned or fetched at most once per run. Concurrent
+    callers for the same repo wait for the same fetch.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = pathlib.Path(cache_dir).resolve()
+        self.fetches: Dict[pathlib.Path, asyncio.Future] = {}
+
+    def mirror_path(self, org_repo: OrgRepo) -> pathlib.Path:
+        return self.cache_dir / org_repo.org / f"{org_repo.repo}.git"
+
+    def container_path(self, org_repo: OrgRepo) -> str:
+        return f"{MIRROR_MOUNT_POINT}/{org_repo.org}/{org_repo.repo}.git"
+
+    @property
+    def binds(self) -> List[DockerBindConfig]:
+        return [DockerBindConfig(str(self.cache_dir), MIRROR_MOUNT_POINT)]
+
+    async def update(self, path: pathlib.Path, repo_url: str) -> None:
+        if (path / "HEAD").exists():
+            log.info(f"fetching git mirror {path} from {repo_url}")
+            await run_git("--git-dir", str(path), "fetch", "--prune", "--quiet")
+        else:
+            log.info(f"cloning git mirror {path} from {repo_url}")
+            path.parent.mkdir(parents=True, exist_ok=True)
+            await run_git("clone", "--mirror", "--quiet", repo_url, str(path))
+
+    async def ensure(self, org_repo: OrgRepo, repo_url: str) -> pathlib.Path:
+        "Returns the host path of an up to date mirror of repo_url"
+        path = self.mirror_path(org_repo)
+        if path not in self.fetches:
+            self.fetches[path] = asyncio.ensure_future(self.update(path, repo_url))
+        await asyncio.shield(self.fetches[path])
+        return path
+
+
+@functools.lru_cache(maxsize=None)
+def get_mirror_cache(cache_dir: str) -> GitMirrorCache:
+    "Returns a mirror cache shared by the pipelines in a run"
+    return GitMirrorCache(cache_dir)
+
+
+async def clone_source(
+    args: argparse.Namespace, org_repo: OrgRepo
+) -> Tuple[str, List[DockerBindConfig]]:
+    """Returns the URL for a container to clone org_repo from and the
+    binds to mount for it
+
+    With --git-mirror-dir that's the repo's mirror (fetched on the host
+    first) and otherwise the GitHub clone URL.
+    """
+    if not getattr(args, "git_mirror_dir", None):
+        return org_repo.github_clone_url, []
+    mirror_cache = get_mirror_cache(args.git_mirror_dir)
+    await mirror_cache.ensure(org_repo, org_repo.github_clone_url)
+    return mirror_cache.container_path(org_repo), mirror_cache.binds
@@ -0,0 +1,199 @@
+import bisect
+import collections
+import contextlib
+import json
+import logging
+import math
+import os
+import tempfile
+import time
+from typing import Any, DefaultDict, Dict, Generator, List, Sequence, Tuple
+
+
+log = logging.getLogger("fpr.metrics_util")
+
+# histogram bucket upper bounds in seconds
+DEFAULT_BUCKETS: Sequence[float] = (
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1.0,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    300.0,
+)
+
+METRICS_FORMATS = ["json", "prometheus"]
+
+# sorted label name and value pairs
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def to_labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((name, str(value)) for (name, value) in labels.items()))
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        # non-cumulative counts for each bucket and an overflow bucket
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative_counts(self) -> List[Tuple[float, int]]:
+        "Returns (upper bound, count of observations <= upper bound) pairs"
+        total, counts = 0, []
+        for upper_bound, count in zip([*self.buckets, math.inf], self.bucket_counts):
+            total += count
+            counts.append((upper_bound, total))
+        return counts
+
+
+class MetricsRegistry:
+    """Counters, gauges, and histograms keyed by metric name and labels
+    that can be written as JSON or Prometheus text
+    """
+
+    def __init__(self) -> None:
+        self.counters: DefaultDict[str, Dict[Labels, float]] = collections.defaultdict(
+            dict
+        )
+        self.gauges: DefaultDict[str, Dict[Labels, float]] = collections.defaultdict(
+            dict
+        )
+        self.histograms: DefaultDict[
+            str, Dict[Labels, Histogram]
+        ] = collections.defaultdict(dict)
+
+    def inc(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        key = to_labels(labels)
+        self.counters[name][key] = self.counters[name].get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels: Any) -> None:
+        self.gauges[name][to_labels(labels)] = value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        key = to_labels(labels)
+        if key not in self.histograms[name]:
+            self.histograms[name][key] = Histogram()
+        self.histograms[name][key].observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels: Any) -> Generator[None, None, None]:
+        "Observes the seconds spent in the with block in histogram name"
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "counters": {
+                name: [
+                    {"labels": dict(labels), "value": value}
+                    for (labels, value) in values.items()
+                ]
+                for (name, values) in self.counters.items()
+            },
+            "gauges": {
+                name: [
+                    {"labels": dict(labels), "value": value}
+                    for (labels, value) in values.items()
+                ]
+                for (name, values) in self.gauges.items()
+            },
+            "histograms": {
+                name: [
+                    {
+                        "labels": dict(labels),
+                        "buckets": {
+                            str(upper_bound): count
+                            for (upper_bound, count) in histogram.cumulative_counts()
+                        },
+                        "count": histogram.count,
+                        "sum": histogram.sum,
+                    }
+                    for (labels, histogram) in histograms.items()
+                ]
+                for (name, histograms) in self.histograms.items()
+            },
+        }
+
+    def to_prometheus(self) -> str:
+        "Returns the metrics in the Prometheus text exposition format"
+        lines: List[str] = []
+        for metric_type, metrics in [
+            ("counter", self.counters),
+            ("gauge", self.gauges),
+        ]:
+            for name, values in sorted(metrics.items()):
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in sorted(values.items()):
+                    lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        for name, histograms in sorted(self.histograms.items()):
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in sorted(histograms.items()):
+                for upper_bound, count in histogram.cumulative_counts():
+                    bucket_labels = (*labels, ("le", format_value(upper_bound)))
+                    lines.append(f"{name}_bucket{format_labels(bucket_labels)} {count}")
+                lines.append(
+                    f"{name}_sum{format_labels(labels)} {format_value(histogram.sum)}"
+                )
+                lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str, metrics_format: str = "json") -> None:
+        """Writes the metrics to path
+
+        Replaces the file atomically so readers (e.g. a node_exporter
+        textfile collector) never see a partial write.
+        """
+        if metrics_format == "prometheus":
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.to_dict(), sort_keys=True, indent=2)
+        tmp_fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(path)), prefix=".fpr-metrics-"
+        )
+        with os.fdopen(tmp_fd, "w", encoding="utf-8") as tmp_file:
+            tmp_file.write(content)
+        os.replace(tmp_path, path)
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for (name, value) in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for (name, value) in escaped) + "}"
+
+
+class ErrorCountingHandler(logging.Handler):
+    "Counts error log records by logger name in fpr_log_errors_total"
+
+    def __init__(self, registry: MetricsRegistry):
+        super().__init__(level=logging.ERROR)
+        self.registry = registry
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.registry.inc("fpr_log_errors_total", logger=record.name)
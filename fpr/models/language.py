@@ -57,6 +57,27 @@ class ContainerTask:
     check: bool = False
 
 
+@dataclass(frozen=True)
+class PackageCache:
+    # named docker volume to keep the cache in e.g. fpr-cache-npm
+    volume_name: str
+
+    # where to mount the volume in task containers
+    mount_point: str
+
+    # environment variables pointing the package manager at the mount point
+    env: Dict[str, str] = field(default_factory=dict)
+
+    # whether the package manager locks the cache for concurrent writers
+    # (e.g. npm's content addressed cache); otherwise tasks using the
+    # cache run one at a time
+    concurrent_writes: bool = True
+
+    # regexes matching the start of paths relative to the mount point
+    # for dirs pruning deletes whole (see containers.cache_entries_to_prune)
+    prune_entry_patterns: List[str] = field(default_factory=list)
+
+
 @dataclass(frozen=True)
 class PackageManager:
     name: str
@@ -71,6 +92,9 @@ class PackageManager:
     # commands for listing the package manager version
     version_commands: Dict[str, str] = field(default_factory=dict)
 
+    # caches to share between task containers with --use-package-caches
+    caches: List[PackageCache] = field(default_factory=list)
+
 
 @dataclass(frozen=True)
 class Language:
@@ -178,6 +202,16 @@ package_managers: Dict[str, PackageManager] = {
                 ),
             },
             version_commands={"npm": "npm --version"},
+            caches=[
+                PackageCache(
+                    volume_name="fpr-cache-npm",
+                    mount_point="/caches/npm",
+                    env={"npm_config_cache": "/caches/npm"},
+                    # _cacache index and content files are separate
+                    # entries that npm treats as misses when missing
+                    prune_entry_patterns=[r"_npx/[^/]+(?=/)"],
+                )
+            ],
         ),
         PackageManager(
             name="yarn",
@@ -207,6 +241,17 @@ package_managers: Dict[str, PackageManager] = {
                 ),
             },
             version_commands={"yarn": "yarn --version"},
+            caches=[
+                PackageCache(
+                    volume_name="fpr-cache-yarn",
+                    mount_point="/caches/yarn",
+                    env={"YARN_CACHE_FOLDER": "/caches/yarn"},
+                    # yarn 1 only locks its cache with --mutex
+                    concurrent_writes=False,
+                    # v6/<package dir>/.yarn-metadata.json etc.
+                    prune_entry_patterns=[r"v\d+/[^/]+(?=/)"],
+                )
+            ],
         ),
         PackageManager(
             name="cargo",
@@ -242,6 +287,34 @@ package_managers: Dict[str, PackageManager] = {
                 "cargo": "cargo --version",
                 "cargo-audit": "cargo audit --version",
             },
+            # in CARGO_HOME of the rust images; cargo's package cache lock
+            # is CARGO_HOME/.package-cache outside the volumes, so it
+            # doesn't lock them across containers
+            caches=[
+                PackageCache(
+                    volume_name="fpr-cache-cargo-registry",
+                    mount_point="/usr/local/cargo/registry",
+                    concurrent_writes=False,
+                    # a registry's index and a crate's .crate file with
+                    # its unpacked src/<registry>/<crate>-<version> dir
+                    prune_entry_patterns=[
+                        r"index/[^/]+(?=/)",
+                        r"cache/(?P<entry>[^/]+/[^/]+)\.crate$",
+                        r"src/(?P<entry>[^/]+/[^/]+)(?=/)",
+                    ],
+                ),
+                PackageCache(
+                    volume_name="fpr-cache-cargo-git",
+                    mount_point="/usr/local/cargo/git",
+                    concurrent_writes=False,
+                    # a repo's bare db/<name>-<hash> clone with its
+                    # checkouts/<name>-<hash>/<rev> dirs
+                    prune_entry_patterns=[
+                        r"db/(?P<entry>[^/]+)(?=/)",
+                        r"checkouts/(?P<entry>[^/]+)(?=/)",
+                    ],
+                ),
+            ],
         ),
     ]
 }
@@ -4,8 +4,10 @@ import sys
 from dataclasses import dataclass, field
 from typing import AbstractSet, Callable, Optional
 
+from fpr.compression_util import CompressedFileType
 from fpr.graph_util import NODE_ID_FORMATS, NODE_LABEL_FORMATS, GROUP_ATTRS
 from fpr.serialize_util import identity_serializer
+from fpr.shard_util import default_shard_key
 
 
 def add_infile_and_outfile(
@@ -14,27 +16,38 @@ def add_infile_and_outfile(
     pipeline_parser.add_argument(
         "-i",
         "--infile",
-        type=argparse.FileType("r", encoding="UTF-8"),
+        type=CompressedFileType("r", encoding="UTF-8"),
         required=False,
         default=sys.stdin,
-        help="pipeline input file (use '-' for stdin)",
+        help="pipeline input file (use '-' for stdin). gzip, zstd, and lz4 "
+        "compressed files are detected and decompressed",
     )
     pipeline_parser.add_argument(
         "-o",
         "--outfile",
-        type=argparse.FileType("w", encoding="UTF-8"),
+        type=CompressedFileType("w", encoding="UTF-8"),
         required=False,
         default=sys.stdout,
-        help="pipeline output file (defaults to stdout)",
+        help="pipeline output file (defaults to stdout). Files ending in .gz, "
+        ".zst, or .lz4 are compressed",
     )
     pipeline_parser.add_argument(
         "-a",
         "--append-outfile",
-        type=argparse.FileType("a", encoding="UTF-8"),
+        type=CompressedFileType("a", encoding="UTF-8"),
         required=False,
         default=None,
         help="Output file to append to instead of overwriting like outfile (defaults to None)",
     )
+    pipeline_parser.add_argument(
+        "--format",
+        choices=["jsonl", "msgpack"],
+        required=False,
+        default=None,
+        help="Format to write outfiles in: JSON lines or length prefixed msgpack "
+        "frames. The infile format is detected when reading. Defaults to the "
+        "pipeline writer's format (JSON lines).",
+    )
     return pipeline_parser
 
 
@@ -149,6 +162,15 @@ def add_docker_args(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
         default=False,
         help="Build docker images. Default to False.",
     )
+    parser.add_argument(
+        "--container-log-dir",
+        type=str,
+        required=False,
+        default=None,
+        help="Follow the logs of each container and write them to "
+        "<container name>.log files in this directory. Defaults to not "
+        "fetching container logs.",
+    )
     return parser
 
 
@@ -170,16 +192,53 @@ def add_volume_args(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
     return parser
 
 
+def add_git_mirror_args(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
+    parser.add_argument(
+        "--git-mirror-dir",
+        type=str,
+        default=None,
+        required=False,
+        help="Keep bare mirrors of repos in this directory, fetch them once "
+        "per run, and clone from them in containers. Must be a path on the "
+        "docker host. Defaults to cloning from GitHub in each container.",
+    )
+    return parser
+
+
+def add_concurrency_args(parser: argparse.ArgumentParser,) -> argparse.ArgumentParser:
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        required=False,
+        help="Max number of input items to process at once. Defaults to 1.",
+    )
+    parser.add_argument(
+        "--unordered",
+        action="store_true",
+        default=False,
+        required=False,
+        help="Write results for each input item as it finishes instead of in "
+        "input order when --concurrency is greater than 1. Defaults to False.",
+    )
+    return parser
+
+
 @dataclass
 class Pipeline:
     """
     A Pipeline to run. run_pipeline.py will:
 
     0. use the .argparser to read any additional program arguments
-    1. read the infile with .reader
-    2. process the parsed infile with .runner
+    1. read the infile with .reader in a helper thread (rx_util.aiter_in_thread)
+       keeping items in the --shard by their .shard_key
+    2. process the parsed infile with .runner (runners with
+       add_concurrency_args process up to args.concurrency input items at
+       once with rx_util.map_concurrently)
     3. optionally serializer the processed result with .serializer
-    4. write the output to outfile with .writer
+    4. write the output to outfile with a .writer created for each outfile
+       (e.g. rx_util.JSONLinesWriter) that buffers and batches writes or the
+       writer for args.format when provided
     """
 
     # pipeline name
@@ -195,3 +254,7 @@ class Pipeline:
     writer: Callable
     serializer: Optional[Callable] = field(default=identity_serializer)
     argparser: Optional[Callable] = field(default=add_infile_and_outfile)
+
+    # returns the key to shard input items by for run_pipeline --shard
+    # items with the same key are in the same shard
+    shard_key: Callable = field(default=default_shard_key)
@@ -5,14 +5,22 @@ import itertools
 import logging
 import json
 import random
-from typing import Dict, Tuple, Sequence, Iterable, Generator, AsyncGenerator
+from typing import (
+    AsyncGenerator,
+    AsyncIterable,
+    Dict,
+    Generator,
+    Iterable,
+    Sequence,
+    Tuple,
+)
 
 import networkx as nx
 from networkx.drawing.nx_pydot import to_pydot
 from networkx.utils import make_str
 import pydot
 
-from fpr.rx_util import on_next_save_to_jsonl
+from fpr.rx_util import JSONLinesWriter
 from fpr.graph_util import rust_crates_and_packages_to_networkx_digraph
 from fpr.models.pipeline import Pipeline
 from fpr.models.rust import (
@@ -189,10 +197,10 @@ def style_graph_nodes(styles: Iterable[str], g: nx.DiGraph) -> nx.DiGraph:
 
 
 async def run_pipeline(
-    source: Generator[Dict, None, None], args: argparse.Namespace
+    source: AsyncIterable[Dict], args: argparse.Namespace
 ) -> AsyncGenerator[nx.DiGraph, None]:
     log.info("pipeline started")
-    for item in source:
+    async for item in source:
         log.debug("processing {!r}".format(item))
         rust_crate_and_packages: Tuple[
             Dict[str, RustCrate], Dict[str, RustPackage]
@@ -222,5 +230,5 @@ pipeline = Pipeline(
     reader=lambda infile: [json.load(infile)],
     runner=run_pipeline,
     serializer=serialize,
-    writer=on_next_save_to_jsonl,
+    writer=JSONLinesWriter,
 )
@@ -5,14 +5,22 @@ import itertools
 import logging
 import json
 import random
-from typing import Dict, Tuple, Sequence, Iterable, Generator, AsyncGenerator
+from typing import (
+    AsyncGenerator,
+    AsyncIterable,
+    Dict,
+    Generator,
+    Iterable,
+    Sequence,
+    Tuple,
+)
 
 import networkx as nx
 from networkx.drawing.nx_pydot import to_pydot
 from networkx.utils import make_str
 import pydot
 
-from fpr.rx_util import on_next_save_to_jsonl
+from fpr.rx_util import JSONLinesWriter
 from fpr.graph_util import npm_packages_to_networkx_digraph, get_graph_stats
 from fpr.models.pipeline import Pipeline
 from fpr.models.nodejs import NPMPackage
@@ -23,7 +31,7 @@ from fpr.models.pipeline import (
     NODE_LABEL_FORMATS,
     GROUP_ATTRS,
 )
-from fpr.serialize_util import extract_fields, get_in, iter_jsonlines
+from fpr.serialize_util import extract_fields, get_in, iter_records
 from fpr.pipelines.util import exc_to_str
 
 log = logging.getLogger("fpr.pipelines.dep_graph")
@@ -184,10 +192,10 @@ def style_graph_nodes(styles: Iterable[str], g: nx.DiGraph) -> nx.DiGraph:
 
 
 async def run_pipeline(
-    source: Generator[Dict, None, None], args: argparse.Namespace
+    source: AsyncIterable[Dict], args: argparse.Namespace
 ) -> AsyncGenerator[nx.DiGraph, None]:
     log.info(f"pipeline {pipeline.name} started")
-    for item in source:
+    async for item in source:
         nx_graph: nx.DiGraph = npm_packages_to_networkx_digraph(
             NPMPackage(**package_dict) for package_dict in item.get("dependencies", [])
         )
@@ -210,8 +218,8 @@ pipeline = Pipeline(
     desc=__doc__,
     fields=set(),
     argparser=parse_args,
-    reader=iter_jsonlines,
+    reader=iter_records,
     runner=run_pipeline,
     serializer=serialize,
-    writer=on_next_save_to_jsonl,
+    writer=JSONLinesWriter,
 )
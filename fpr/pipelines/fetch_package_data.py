@@ -2,16 +2,26 @@ import os
 import argparse
 import logging
 import pathlib
-from typing import Any, AsyncGenerator, Dict, Generator, List, Optional, Tuple, Union
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterable,
+    Dict,
+    Generator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
-from fpr.rx_util import on_next_save_to_jsonl
+from fpr.rx_util import JSONLinesWriter
 from fpr.clients.cratesio import fetch_cratesio_metadata
 from fpr.clients.npmsio import fetch_npmsio_scores
 from fpr.clients.npm_registry import fetch_npm_registry_metadata
 from fpr.models.pipeline import Pipeline, add_infile_and_outfile, add_aiohttp_args
 from fpr.models.package_meta_result import Result
 from fpr.pipelines.util import exc_to_str
-from fpr.serialize_util import iter_jsonlines
+from fpr.serialize_util import iter_records
 
 
 NAME = "fetch_package_data"
@@ -67,12 +77,12 @@ def is_dict_with_name(package: Any) -> bool:
 
 
 async def run_pipeline(
-    source: Generator[Dict[str, Any], None, None], args: argparse.Namespace
+    source: AsyncIterable[Dict[str, Any]], args: argparse.Namespace
 ) -> AsyncGenerator[Dict, None]:
     log.info(f"{pipeline.name} pipeline started with task {args.package_task}")
 
     if args.package_task in ["fetch_npmsio_scores", "fetch_npm_registry_metadata"]:
-        packages = [package for package in source]
+        packages = [package async for package in source]
         assert all(is_dict_with_name(package) for package in packages)
         package_names = [package["name"] for package in packages]
         log.info(
@@ -91,7 +101,9 @@ async def run_pipeline(
             else:
                 yield package_result
     elif args.package_task == "fetch_cratesio_metadata":
-        async for package_result in fetch_cratesio_metadata(args, source):
+        async for package_result in fetch_cratesio_metadata(
+            args, [item async for item in source]
+        ):
             if isinstance(package_result, Exception):
                 log.error(
                     f"error running {pipeline.name} {args.package_task}:\n{exc_to_str()}"
@@ -114,12 +126,17 @@ IN_FIELDS: Dict[str, Union[type, str, Dict[str, str]]] = {
 OUT_FIELDS: Dict[str, Any] = dict()
 
 
+def shard_key(item: Dict[str, Any]) -> Any:
+    return item["name"] if is_dict_with_name(item) else item
+
+
 pipeline = Pipeline(
     name=NAME,
     desc=__doc__,
     fields=set(OUT_FIELDS.keys()),
     argparser=parse_args,
-    reader=iter_jsonlines,
+    reader=iter_records,
     runner=run_pipeline,
-    writer=on_next_save_to_jsonl,
+    writer=JSONLinesWriter,
+    shard_key=shard_key,
 )
@@ -1,28 +1,47 @@
 import argparse
 import asyncio
 from dataclasses import asdict, dataclass
+import fnmatch
 import functools
 import logging
 import pathlib
 from random import randrange
-from typing import Any, AsyncGenerator, Dict, Generator, Iterable, Tuple, Union
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterable,
+    Dict,
+    Generator,
+    Iterable,
+    List,
+    Sequence,
+    Tuple,
+    Union,
+)
 
-from fpr.rx_util import on_next_save_to_jsonl
-from fpr.serialize_util import get_in, extract_fields, iter_jsonlines
+from fpr.checkpoint_util import checkpointed
+from fpr.rx_util import agroupby, map_concurrently, JSONLinesWriter
+from fpr.serialize_util import get_in, extract_fields, iter_records
 import fpr.docker.containers as containers
 from fpr.docker.images import build_images
 import fpr.docker.volumes as volumes
+from fpr.git_mirror_util import clone_source
 from fpr.models.pipeline import Pipeline
 from fpr.models.org_repo import OrgRepo
-from fpr.models.git_ref import GitRef
-from fpr.models.pipeline import add_infile_and_outfile, add_docker_args, add_volume_args
+from fpr.models.git_ref import GitRef, GitRefKind
+from fpr.models.pipeline import (
+    add_infile_and_outfile,
+    add_concurrency_args,
+    add_docker_args,
+    add_git_mirror_args,
+    add_volume_args,
+)
 from fpr.models.language import (
     dependency_file_patterns,
     DependencyFile,
     DockerImage,
     docker_images,
 )
-from fpr.pipelines.util import exc_to_str
 
 log = logging.getLogger("fpr.pipelines.find_dep_files")
 
@@ -35,6 +54,8 @@ def parse_args(pipeline_parser: argparse.ArgumentParser) -> argparse.ArgumentPar
     parser = add_infile_and_outfile(pipeline_parser)
     parser = add_docker_args(parser)
     parser = add_volume_args(parser)
+    parser = add_git_mirror_args(parser)
+    parser = add_concurrency_args(parser)
     parser.add_argument(
         "--glob",
         type=str,
@@ -44,9 +65,54 @@ def parse_args(pipeline_parser: argparse.ArgumentParser) -> argparse.ArgumentPar
         help=f"manifest globs to search for dep files in the repo. "
         f"Defaults to: {list(dependency_file_patterns.keys())}",
     )
+    parser.add_argument(
+        "--batch-refs",
+        action="store_true",
+        required=False,
+        default=False,
+        help="Find dep files for consecutive input refs of the same repo in one "
+        "container by listing each ref's tree with git ls-tree and hashing "
+        "blobs with git cat-file instead of checking out each ref. "
+        "Defaults to False.",
+    )
     return parser
 
 
+def matches_glob_parts(parts: Sequence[str], glob_parts: Sequence[str]) -> bool:
+    """Returns whether path segments match glob segments where * and ?
+    only match within a segment and ** matches zero or more segments
+    """
+    if not glob_parts:
+        return not parts
+    if glob_parts[0] == "**":
+        return any(
+            matches_glob_parts(parts[i:], glob_parts[1:]) for i in range(len(parts) + 1)
+        )
+    return (
+        bool(parts)
+        and fnmatch.fnmatchcase(parts[0], glob_parts[0])
+        and matches_glob_parts(parts[1:], glob_parts[1:])
+    )
+
+
+def matches_globs(path: str, globs: Iterable[str]) -> bool:
+    """Returns whether rg --files --iglob would list path for a glob
+
+    i.e. path is not hidden and a glob without a / matches its filename
+    or a glob with one matches the path segment by segment ignoring case
+    """
+    parts = path.lower().split("/")
+    if any(part.startswith(".") for part in parts):
+        return False
+    for glob in globs:
+        glob_parts = glob.lower().strip("/").split("/")
+        if len(glob_parts) == 1:
+            glob_parts = ["**", *glob_parts]
+        if matches_glob_parts(parts, glob_parts):
+            return True
+    return False
+
+
 async def run_find_dep_files(
     item: Tuple[OrgRepo, GitRef], args: argparse.Namespace
 ) -> AsyncGenerator[Dict, None]:
@@ -56,6 +122,7 @@ async def run_find_dep_files(
     )
     name = f"dep-obs-find-dep-files-{org_repo.org}-{org_repo.repo}-{hex(randrange(1 << 32))[2:]}"
 
+    repo_url, binds = await clone_source(args, org_repo)
     async with containers.run(
         "dep-obs/find-dep-files:latest",
         name=name,
@@ -70,21 +137,19 @@ async def run_find_dep_files(
         ]
         if args.use_volumes
         else [],
+        binds=binds,
+        log_path=containers.container_log_path(args.container_log_dir, name),
     ) as c:
         if not args.use_volumes:
-            await c.run("mkdir -p /repos", wait=True, check=True)
+            await c.run("mkdir -p /repos", wait=True, check=True, keep_output=False)
         await containers.ensure_repo(
-            c, org_repo.github_clone_url, working_dir="/repos/"
+            c, repo_url, working_dir="/repos/", shared=bool(binds)
         )
         await containers.ensure_ref(c, git_ref, working_dir="/repos/repo")
-        branch, commit, tag, ripgrep_version = await asyncio.gather(
-            containers.get_branch(c, working_dir="/repos/repo"),
-            containers.get_commit(c, working_dir="/repos/repo"),
-            containers.get_tag(c, working_dir="/repos/repo"),
-            containers.get_ripgrep_version(c, working_dir="/repos/repo"),
+        ref_info, versions = await containers.probe_ref_info_and_versions(
+            c, {"ripgrep": "rg --version"}, working_dir="/repos/repo"
         )
-        log.debug(f"{name} stdout: {await c.log(stdout=True)}")
-        log.debug(f"{name} stderr: {await c.log(stderr=True)}")
+        branch, commit, tag = ref_info["branch"], ref_info["commit"], ref_info["tag"]
 
         for dep_file_path in await containers.find_files(
             args.glob, c, working_dir="/repos/repo"
@@ -98,7 +163,7 @@ async def run_find_dep_files(
                 commit=commit,
                 branch=branch,
                 tag=tag,
-                versions={"ripgrep": ripgrep_version},
+                versions=versions,
                 dependency_file=DependencyFile.from_dict(
                     dict(
                         path=dep_file_path,
@@ -111,8 +176,89 @@ async def run_find_dep_files(
             )
 
 
+async def run_find_dep_files_for_refs(
+    item: Tuple[OrgRepo, List[GitRef]], args: argparse.Namespace
+) -> AsyncGenerator[Dict, None]:
+    org_repo, git_refs = item
+    log.debug(
+        f"running find-dep-files on repo {org_repo.github_clone_url!r} for {len(git_refs)} refs"
+    )
+    name = f"dep-obs-find-dep-files-{org_repo.org}-{org_repo.repo}-{hex(randrange(1 << 32))[2:]}"
+
+    repo_url, binds = await clone_source(args, org_repo)
+    async with containers.run(
+        "dep-obs/find-dep-files:latest",
+        name=name,
+        cmd="/bin/bash",
+        volumes=[
+            volumes.DockerVolumeConfig(
+                name=f"fpr-org_{org_repo.org}-repo_{org_repo.repo}",
+                mount_point="/repos",
+                labels=asdict(org_repo),
+                delete=not args.keep_volumes,
+            )
+        ]
+        if args.use_volumes
+        else [],
+        binds=binds,
+        log_path=containers.container_log_path(args.container_log_dir, name),
+    ) as c:
+        if not args.use_volumes:
+            await c.run("mkdir -p /repos", wait=True, check=True, keep_output=False)
+        await containers.ensure_repo(
+            c, repo_url, working_dir="/repos/", shared=bool(binds)
+        )
+        ref_names = await containers.fetch_refs(c, git_refs, working_dir="/repos/repo")
+        commits, tags_by_commit, ripgrep_version = await asyncio.gather(
+            containers.get_ref_commits(c, ref_names, working_dir="/repos/repo"),
+            containers.get_tags_by_commit(c, working_dir="/repos/repo"),
+            containers.get_ripgrep_version(c, working_dir="/repos/repo"),
+        )
+
+        dep_files_by_ref: Dict[str, List[Tuple[str, str]]] = {
+            ref_name: [] for ref_name in ref_names
+        }
+        for ref_name, path, blob in await containers.ls_tree_blobs(
+            c, ref_names, working_dir="/repos/repo"
+        ):
+            if matches_globs(path, args.glob):
+                dep_files_by_ref[ref_name].append((path, blob))
+        sha256s = await containers.blob_sha256s(
+            c,
+            (
+                blob
+                for dep_files in dep_files_by_ref.values()
+                for (_, blob) in dep_files
+            ),
+            working_dir="/repos/repo",
+        )
+
+        for git_ref, ref_name, commit in zip(git_refs, ref_names, commits):
+            for dep_file_path, blob in dep_files_by_ref[ref_name]:
+                log.info(
+                    f"{c['Name']} found dep file at {git_ref.value}: {dep_file_path}"
+                )
+                yield dict(
+                    org=org_repo.org,
+                    repo=org_repo.repo,
+                    ref=git_ref.to_dict(),
+                    repo_url=org_repo.github_clone_url,
+                    commit=commit,
+                    # what git rev-parse --abbrev-ref HEAD shows after checking out the ref
+                    branch=git_ref.value
+                    if git_ref.kind == GitRefKind.BRANCH
+                    else "HEAD",
+                    tag=tags_by_commit.get(commit, [None])[0],
+                    # same versions as run_find_dep_files
+                    versions={"ripgrep": ripgrep_version},
+                    dependency_file=DependencyFile.from_dict(
+                        dict(path=dep_file_path, sha256=sha256s.get(blob, ""))
+                    ).to_dict(),
+                )
+
+
 async def run_pipeline(
-    source: Generator[Dict[str, Any], None, None], args: argparse.Namespace
+    source: AsyncIterable[Dict[str, Any]], args: argparse.Namespace
 ) -> AsyncGenerator[Dict[str, Any], None]:
     log.info(f"started pipeline {pipeline.name} with globs: {args.glob}")
     if args.docker_build:
@@ -123,17 +269,62 @@ async def run_pipeline(
         built_image_tags: Iterable[str] = await build_images(args.docker_pull, images)
         log.info(f"successfully built and tagged images {built_image_tags}")
 
-    for item in source:
+    concurrency = args.concurrency
+    if args.use_volumes and concurrency > 1:
+        log.warning(
+            "ignoring --concurrency since --use-volumes shares a repo checkout between containers"
+        )
+        concurrency = 1
+
+    async def find_dep_files(item: Dict[str, Any]) -> AsyncGenerator[Dict, None]:
         org_repo, git_ref = (
             OrgRepo.from_github_repo_url(item["repo_url"]),
             GitRef.from_dict(item["ref"]),
         )
         log.debug(f"finding dep files for {org_repo} {git_ref}")
-        try:
-            async for dep_file in run_find_dep_files((org_repo, git_ref), args):
-                yield dep_file
-        except Exception as e:
-            log.error(f"error running find_dep_files:\n{exc_to_str()}")
+        async for dep_file in run_find_dep_files((org_repo, git_ref), args):
+            yield dep_file
+
+    async def find_dep_files_for_refs(
+        group: Tuple[str, List[Dict[str, Any]]]
+    ) -> AsyncGenerator[Dict, None]:
+        repo_url, items = group
+        org_repo = OrgRepo.from_github_repo_url(repo_url)
+        git_refs = [GitRef.from_dict(item["ref"]) for item in items]
+        log.debug(f"finding dep files for {org_repo} {len(git_refs)} refs")
+        async for dep_file in run_find_dep_files_for_refs((org_repo, git_refs), args):
+            yield dep_file
+
+    if args.batch_refs:
+        dep_files = map_concurrently(
+            checkpointed(
+                args,
+                pipeline.name,
+                lambda group: [
+                    group[0],
+                    [item["ref"] for item in group[1]],
+                    args.glob,
+                ],
+                find_dep_files_for_refs,
+            ),
+            agroupby(source, lambda item: item["repo_url"]),
+            concurrency=concurrency,
+            ordered=not args.unordered,
+        )
+    else:
+        dep_files = map_concurrently(
+            checkpointed(
+                args,
+                pipeline.name,
+                lambda item: [item["repo_url"], item["ref"], args.glob],
+                find_dep_files,
+            ),
+            source,
+            concurrency=concurrency,
+            ordered=not args.unordered,
+        )
+    async for dep_file in dep_files:
+        yield dep_file
 
 
 # fields and types for the input and output JSON
@@ -151,12 +342,21 @@ OUT_FIELDS: Dict[str, Union[type, str, Dict[str, str]]] = {
     **{"dependency_file": DependencyFile(path=pathlib.Path("./"), sha256="").to_dict()},
 }
 
+
+def shard_key(item: Dict[str, Any]) -> Tuple[str, str]:
+    return (
+        OrgRepo.from_github_repo_url(item["repo_url"]).org_repo,
+        item["ref"]["value"],
+    )
+
+
 pipeline = Pipeline(
     name="find_dep_files",
     desc=__doc__,
     fields=set(OUT_FIELDS.keys()),
     argparser=parse_args,
-    reader=iter_jsonlines,
+    reader=iter_records,
     runner=run_pipeline,
-    writer=on_next_save_to_jsonl,
+    writer=JSONLinesWriter,
+    shard_key=shard_key,
 )
@@ -4,19 +4,34 @@ from dataclasses import asdict
 import functools
 import logging
 from random import randrange
-from typing import Tuple, Dict, Generator, AsyncGenerator, Union, Iterable
+from typing import (
+    AsyncGenerator,
+    AsyncIterable,
+    Dict,
+    Generator,
+    Iterable,
+    Tuple,
+    Union,
+)
 
-from fpr.rx_util import on_next_save_to_jsonl
-from fpr.serialize_util import get_in, extract_fields, iter_jsonlines
+from fpr.checkpoint_util import checkpointed
+from fpr.rx_util import aenumerate, map_concurrently, JSONLinesWriter
+from fpr.serialize_util import get_in, extract_fields, iter_records
 import fpr.docker.containers as containers
 from fpr.docker.images import build_images
 import fpr.docker.volumes as volumes
+from fpr.git_mirror_util import clone_source
 from fpr.models.pipeline import Pipeline
 from fpr.models.org_repo import OrgRepo
 from fpr.models.git_ref import GitRef
 from fpr.models.language import DockerImage, docker_images
-from fpr.models.pipeline import add_infile_and_outfile, add_docker_args, add_volume_args
-from fpr.pipelines.util import exc_to_str
+from fpr.models.pipeline import (
+    add_infile_and_outfile,
+    add_concurrency_args,
+    add_docker_args,
+    add_git_mirror_args,
+    add_volume_args,
+)
 
 log = logging.getLogger("fpr.pipelines.find_git_refs")
 
@@ -32,6 +47,8 @@ def parse_args(pipeline_parser: argparse.ArgumentParser) -> argparse.ArgumentPar
     parser = add_infile_and_outfile(pipeline_parser)
     parser = add_docker_args(parser)
     parser = add_volume_args(parser)
+    parser = add_git_mirror_args(parser)
+    parser = add_concurrency_args(parser)
     parser.add_argument(
         "-t",
         "--tags",
@@ -48,6 +65,7 @@ async def run_find_git_refs(org_repo: OrgRepo, args: argparse.Namespace):
     log.debug(f"finding git refs for repo {org_repo.github_clone_url!r}")
     name = f"dep-obs-find-git-refs-{org_repo.org}-{org_repo.repo}-{hex(randrange(1 << 32))[2:]}"
     results = []
+    repo_url, binds = await clone_source(args, org_repo)
     async with containers.run(
         "dep-obs/find-git-refs:latest",
         name=name,
@@ -62,14 +80,14 @@ async def run_find_git_refs(org_repo: OrgRepo, args: argparse.Namespace):
         ]
         if args.use_volumes
         else [],
+        binds=binds,
+        log_path=containers.container_log_path(args.container_log_dir, name),
     ) as c:
         if not args.use_volumes:
-            await c.run("mkdir -p /repos", wait=True, check=True)
+            await c.run("mkdir -p /repos", wait=True, check=True, keep_output=False)
         await containers.ensure_repo(
-            c, org_repo.github_clone_url, working_dir="/repos/"
+            c, repo_url, working_dir="/repos/", shared=bool(binds)
         )
-        log.debug(f"{name} stdout: {await c.log(stdout=True)}")
-        log.debug(f"{name} stderr: {await c.log(stderr=True)}")
         async for tag, tag_ts, commit_ts in containers.get_tags(
             c, working_dir="/repos/repo"
         ):
@@ -89,8 +107,8 @@ async def run_find_git_refs(org_repo: OrgRepo, args: argparse.Namespace):
 
 
 async def run_pipeline(
-    source: Generator[Dict[str, str], None, None], args: argparse.Namespace
-) -> AsyncGenerator[OrgRepo, None]:
+    source: AsyncIterable[Dict[str, str]], args: argparse.Namespace
+) -> AsyncGenerator[Dict, None]:
     log.info("pipeline find_git_refs started")
     if args.docker_build:
         images: Iterable[DockerImage] = [docker_images["dep-obs/find-git-refs:latest"]]
@@ -100,15 +118,25 @@ async def run_pipeline(
         built_image_tags: Iterable[str] = await build_images(args.docker_pull, images)
         log.info(f"successfully built and tagged images {built_image_tags}")
 
-    for i, item in enumerate(source):
-        row = (i, OrgRepo.from_github_repo_url(item["repo_url"]))
+    async def find_git_refs(
+        row: Tuple[int, Dict[str, str]]
+    ) -> AsyncGenerator[Dict, None]:
+        i, item = row
+        org_repo = OrgRepo.from_github_repo_url(item["repo_url"])
         await asyncio.sleep(min(1 * i, 30))
-        log.debug(f"processing {row[1]!r}")
-        try:
-            for ref in await run_find_git_refs(row[1], args):
-                yield ref
-        except Exception as e:
-            log.error(f"error running find_git_refs:\n{exc_to_str()}")
+        log.debug(f"processing {org_repo!r}")
+        for ref in await run_find_git_refs(org_repo, args):
+            yield ref
+
+    async for ref in map_concurrently(
+        checkpointed(
+            args, pipeline.name, lambda row: row[1]["repo_url"], find_git_refs
+        ),
+        aenumerate(source),
+        concurrency=args.concurrency,
+        ordered=not args.unordered,
+    ):
+        yield ref
 
 
 # fields and types for the input and output JSON
@@ -124,12 +152,17 @@ OUT_FIELDS: Dict[str, Union[type, str, Dict[str, str]]] = {
 }
 
 
+def shard_key(item: Dict[str, str]) -> str:
+    return OrgRepo.from_github_repo_url(item["repo_url"]).org_repo
+
+
 pipeline = Pipeline(
     name="find_git_refs",
     desc=__doc__,
     fields=set(OUT_FIELDS.keys()),
     argparser=parse_args,
-    reader=iter_jsonlines,
+    reader=iter_records,
     runner=run_pipeline,
-    writer=on_next_save_to_jsonl,
+    writer=JSONLinesWriter,
+    shard_key=shard_key,
 )
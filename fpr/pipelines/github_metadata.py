@@ -11,6 +11,7 @@ from typing import (
     AbstractSet,
     Any,
     AsyncGenerator,
+    AsyncIterable,
     Callable,
     Dict,
     Generator,
@@ -24,8 +25,8 @@ import aiohttp
 import snug
 import quiz
 
-from fpr.rx_util import on_next_save_to_jsonl
-from fpr.serialize_util import iter_jsonlines
+from fpr.rx_util import JSONLinesWriter
+from fpr.serialize_util import iter_records
 from fpr.quiz_util import raw_result_to_dict
 from fpr.models.pipeline import Pipeline
 from fpr.models.org_repo import OrgRepo
@@ -277,9 +278,7 @@ def get_response(task):
     yield task.result()
 
 
-async def run_pipeline(
-    source: Generator[Dict[str, str], None, None], args: argparse.Namespace
-):
+async def run_pipeline(source: AsyncIterable[Dict[str, str]], args: argparse.Namespace):
     log.info("pipeline github_metadata started")
 
     async with aiohttp_session(args) as session:
@@ -320,7 +319,7 @@ async def run_pipeline(
 
         # add initial items to the queue
         args_dict = vars(args)
-        for item in source:
+        async for item in source:
             org_repo: OrgRepo = OrgRepo.from_github_repo_url(item["repo_url"])
             context = ChainMap(args_dict, dict(owner=org_repo.org, name=org_repo.repo))
             for request in get_next_requests(log, context, last_exchange=None):
@@ -388,12 +387,17 @@ async def run_pipeline(
 FIELDS: AbstractSet[str] = set()  # "crate", "categories", "keywords", "versions"}
 
 
+def shard_key(item: Dict[str, str]) -> str:
+    return OrgRepo.from_github_repo_url(item["repo_url"]).org_repo
+
+
 pipeline = Pipeline(
     name="github_metadata",
     desc=__doc__,
     argparser=parse_args,
     fields=FIELDS,
-    reader=iter_jsonlines,
+    reader=iter_records,
     runner=run_pipeline,
-    writer=on_next_save_to_jsonl,
+    writer=JSONLinesWriter,
+    shard_key=shard_key,
 )
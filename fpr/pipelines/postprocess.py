@@ -15,6 +15,7 @@ from typing import (
     Any,
     AnyStr,
     AsyncGenerator,
+    AsyncIterable,
     Dict,
     Generator,
     List,
@@ -25,13 +26,14 @@ from typing import (
 )
 import typing
 
-from fpr.rx_util import on_next_save_to_jsonl
+from fpr.rx_util import JSONLinesWriter
 from fpr.graph_util import npm_packages_to_networkx_digraph, get_graph_stats
 from fpr.serialize_util import (
     get_in,
     extract_fields,
     extract_nested_fields,
     iter_jsonlines,
+    iter_records,
     REPO_FIELDS,
 )
 from fpr.models.pipeline import Pipeline
@@ -326,11 +328,11 @@ def parse_command(
 
 
 async def run_pipeline(
-    source: Generator[Dict[str, Any], None, None], args: argparse.Namespace
+    source: AsyncIterable[Dict[str, Any]], args: argparse.Namespace
 ) -> AsyncGenerator[Dict, None]:
     log.info(f"{pipeline.name} pipeline started")
 
-    for i, line in enumerate(source):
+    async for line in source:
         result = extract_fields(
             line,
             [
@@ -394,7 +396,7 @@ pipeline = Pipeline(
     desc=__doc__,
     fields=FIELDS,
     argparser=parse_args,
-    reader=iter_jsonlines,
+    reader=iter_records,
     runner=run_pipeline,
-    writer=on_next_save_to_jsonl,
+    writer=JSONLinesWriter,
 )
@@ -1,7 +1,9 @@
 import aiodocker
 import argparse
 import asyncio
+import collections
 from collections import ChainMap
+import contextlib
 from dataclasses import asdict
 import functools
 import itertools
@@ -16,6 +18,7 @@ from typing import (
     Any,
     AnyStr,
     AsyncGenerator,
+    AsyncIterable,
     Dict,
     Generator,
     Iterable,
@@ -26,19 +29,29 @@ from typing import (
 )
 import typing
 
-from fpr.rx_util import on_next_save_to_jsonl
-from fpr.serialize_util import get_in, extract_fields, iter_jsonlines, REPO_FIELDS
+from fpr.checkpoint_util import checkpointed
+from fpr.rx_util import aiter_items, map_concurrently, JSONLinesWriter
+from fpr.serialize_util import get_in, extract_fields, iter_records, REPO_FIELDS
 import fpr.docker.containers as containers
+from fpr.docker.pool import ContainerPool
+from fpr.docker.scheduler import (
+    ContainerScheduler,
+    JobResources,
+    docker_host_resources,
+)
+from fpr.git_mirror_util import clone_source
 import fpr.docker.volumes as volumes
 from fpr.models.pipeline import Pipeline
 from fpr.models.org_repo import OrgRepo
 from fpr.models.git_ref import GitRef
-from fpr.docker.images import build_images
+from fpr.docker.images import build_images, inspect_image
+import fpr.disk_cache_util as disk_cache_util
 from fpr.models.language import (
     ContainerTask,
     DependencyFile,
     DockerImage,
     Language,
+    PackageCache,
     PackageManager,
     docker_images,
     docker_image_names,
@@ -47,8 +60,13 @@ from fpr.models.language import (
     package_manager_names,
     package_managers,
 )
-from fpr.models.pipeline import add_infile_and_outfile, add_docker_args, add_volume_args
-from fpr.pipelines.util import exc_to_str
+from fpr.models.pipeline import (
+    add_infile_and_outfile,
+    add_concurrency_args,
+    add_docker_args,
+    add_git_mirror_args,
+    add_volume_args,
+)
 
 log = logging.getLogger("fpr.pipelines.run_repo_tasks")
 
@@ -59,6 +77,8 @@ def parse_args(pipeline_parser: argparse.ArgumentParser) -> argparse.ArgumentPar
     parser = add_infile_and_outfile(pipeline_parser)
     parser = add_docker_args(parser)
     parser = add_volume_args(parser)
+    parser = add_git_mirror_args(parser)
+    parser = add_concurrency_args(parser)
     parser.add_argument(
         "--dry-run",
         action="store_true",
@@ -83,6 +103,42 @@ def parse_args(pipeline_parser: argparse.ArgumentParser) -> argparse.ArgumentPar
         "sums for multiple git refs (NB: ignores changes to non-dep files e.g. to "
         "node.js install hook scripts).",
     )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        required=False,
+        default=None,
+        help="Also cache results on disk in this directory to reuse in later "
+        "runs. Results are keyed by the --use-cache key, image ID, and tasks. "
+        "Defaults to not caching results on disk.",
+    )
+    parser.add_argument(
+        "--cache-max-size",
+        type=int,
+        required=False,
+        default=1024,
+        help="Evict least recently used results from --cache-dir over this "
+        "many MiB. Defaults to 1024.",
+    )
+    parser.add_argument(
+        "--cache-max-age",
+        type=float,
+        required=False,
+        default=30,
+        help="Expire results in --cache-dir older than this many days. "
+        "Defaults to 30.",
+    )
+    parser.add_argument(
+        "--use-global-cache",
+        action="store_true",
+        required=False,
+        default=False,
+        help="Reuse results for dep. files with the same SHA2 sums from any "
+        "repo, ref, or dir when the package manager, image, and task commands "
+        "match (also stored in --cache-dir when set). Reused results have "
+        "data_source global_cache and null branch, commit, and tag. "
+        "Defaults to False.",
+    )
     parser.add_argument(
         "--dir",
         type=str,
@@ -127,6 +183,85 @@ def parse_args(pipeline_parser: argparse.ArgumentParser) -> argparse.ArgumentPar
         help="Run install, list_metadata, or audit tasks in the order provided. "
         "Defaults to none of them.",
     )
+    parser.add_argument(
+        "--container-pool-size",
+        type=int,
+        required=False,
+        default=4,
+        help="Max. number of idle containers to keep running to reuse for "
+        "other refs and dep. file dirs of the same repo and image. "
+        "Reused checkouts are reset with 'git reset --hard' and 'git clean -fdx'. "
+        "0 stops each container after use. Defaults to 4.",
+    )
+    parser.add_argument(
+        "--use-package-caches",
+        action="store_true",
+        required=False,
+        default=False,
+        help="Mount named docker volumes with package manager caches (e.g. "
+        "npm's cache, yarn's cache, and cargo's registry) shared by task "
+        "containers. Faster but less isolated. Tasks using caches without "
+        "their own locking (yarn and cargo) run one at a time per process; "
+        "the locks are not shared between processes, so don't share the "
+        "volumes between --shard processes. Defaults to False.",
+    )
+    parser.add_argument(
+        "--package-cache-max-size",
+        type=int,
+        required=False,
+        default=10 * 1024,
+        help="Delete least recently used entries from each package cache over "
+        "this many MiB after running tasks. Defaults to 10240.",
+    )
+    parser.add_argument(
+        "--container-idle-timeout",
+        type=float,
+        required=False,
+        default=60.0,
+        help="Stop pooled containers idle for longer than this many seconds. "
+        "Defaults to 60.",
+    )
+    parser.add_argument(
+        "--job-cpus",
+        type=float,
+        required=False,
+        default=0,
+        help="Limit each task container to this many CPUs. 0 for no limit. "
+        "Defaults to 0.",
+    )
+    parser.add_argument(
+        "--job-memory",
+        type=int,
+        required=False,
+        default=0,
+        help="Limit each task container to this many MiB of memory. 0 for no "
+        "limit. Defaults to 0.",
+    )
+    parser.add_argument(
+        "--cpu-budget",
+        type=float,
+        required=False,
+        default=None,
+        help="Only run task containers at once while their --job-cpus sum to "
+        "at most this many CPUs. Defaults to the docker host's CPU count.",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=int,
+        required=False,
+        default=None,
+        help="Only run task containers at once while their --job-memory sums "
+        "to at most this many MiB. Defaults to the docker host's memory.",
+    )
+    parser.add_argument(
+        "--max-host-load",
+        type=float,
+        required=False,
+        default=1.0,
+        help="Halve the number of task containers to run at once when the one "
+        "minute load average per CPU of this host goes over this or a task "
+        "fails, and grow it back up to --concurrency otherwise. Defaults to 1.",
+    )
     return parser
 
 
@@ -162,21 +297,15 @@ async def run_task(
         job_run = await c.run(
             cmd=task.command, working_dir=working_dir, wait=True, check=task.check
         )
-        last_inspect = await job_run.inspect()
+        last_inspect = job_run.last_inspect or await job_run.inspect()
     except containers.DockerRunException as e:
         log.error(
             f"{container_name} in {working_dir} for task {task.name} error running {task.command}: {e}"
         )
         return e
 
-    stdout, stderr = [
-        "\n".join(line_iter)
-        for line_iter in job_run.decoded_start_result_stdout_and_stderr_line_iters
-    ]
-
-    c_stdout, c_stderr = await asyncio.gather(c.log(stdout=True), c.log(stderr=True))
-    log.debug(f"{container_name} stdout: {c_stdout}")
-    log.debug(f"{container_name} stderr: {c_stderr}")
+    stdout, stderr = job_run.decoded_start_result_stdout_and_stderr
+    job_run.close()
     return {
         "name": task.name,
         "command": task.command,
@@ -198,53 +327,79 @@ async def run_in_repo_at_ref(
     cwd_files: AbstractSet[str],
     file_rows: List[DependencyFile],
     image: DockerImage,
+    pool: ContainerPool,
+    caches: List[PackageCache],
+    cache_locks: typing.DefaultDict[str, asyncio.Lock],
+    scheduler: ContainerScheduler,
 ) -> AsyncGenerator[Dict[str, Any], None]:
     (org_repo, git_ref, path) = item
+    resources = job_resources(args)
+    repo_url, binds = await clone_source(args, org_repo)
+
+    def start_container() -> typing.AsyncContextManager[
+        aiodocker.containers.DockerContainer
+    ]:
+        name = f"dep-obs-nodejs-metadata-{org_repo.org}-{org_repo.repo}-{hex(randrange(1 << 32))[2:]}"
+        return containers.run(
+            image.local.repo_name_tag,
+            name=name,
+            cmd="/bin/bash",
+            volumes=(
+                [
+                    volumes.DockerVolumeConfig(
+                        name=f"fpr-org_{org_repo.org}-repo_{org_repo.repo}",
+                        mount_point="/repos",
+                        labels=asdict(org_repo),
+                        delete=not args.keep_volumes,
+                    )
+                ]
+                if args.use_volumes
+                else []
+            )
+            + cache_volume_configs(caches),
+            binds=binds,
+            env={name: value for cache in caches for name, value in cache.env.items()},
+            nano_cpus=resources.nano_cpus,
+            memory=resources.memory,
+            log_path=containers.container_log_path(args.container_log_dir, name),
+        )
 
-    container_name = f"dep-obs-nodejs-metadata-{org_repo.org}-{org_repo.repo}-{hex(randrange(1 << 32))[2:]}"
-    async with containers.run(
-        image.local.repo_name_tag,
-        name=container_name,
-        cmd="/bin/bash",
-        volumes=[
-            volumes.DockerVolumeConfig(
-                name=f"fpr-org_{org_repo.org}-repo_{org_repo.repo}",
-                mount_point="/repos",
-                labels=asdict(org_repo),
-                delete=not args.keep_volumes,
+    async with contextlib.AsyncExitStack() as stack:
+        # take package cache locks before a scheduler slot so jobs waiting
+        # on a lock don't hold a slot and its share of the CPU and memory budget
+        if not dry_run:
+            for cache in caches:
+                if not cache.concurrent_writes:
+                    await stack.enter_async_context(cache_locks[cache.volume_name])
+        slot = await stack.enter_async_context(scheduler.slot(resources))
+        c = await stack.enter_async_context(
+            pool.acquire(
+                (
+                    image.local.repo_name_tag,
+                    org_repo.org_repo,
+                    tuple(cache.volume_name for cache in caches),
+                ),
+                start_container,
+                reset=functools.partial(
+                    containers.reset_repo, working_dir="/repos/repo"
+                ),
             )
-        ]
-        if args.use_volumes
-        else [],
-    ) as c:
+        )
+        container_name = c["Name"].lstrip("/")
         if not args.use_volumes:
-            await c.run("mkdir -p /repos", wait=True, check=True)
+            await c.run("mkdir -p /repos", wait=True, check=True, keep_output=False)
         await containers.ensure_repo(
             c,
-            org_repo.github_clone_url,
+            repo_url,
             git_clean=args.git_clean,
             working_dir="/repos/",
+            shared=bool(binds),
         )
         await containers.ensure_ref(c, git_ref, working_dir="/repos/repo")
-        branch, commit, tag, *version_results = await asyncio.gather(
-            *(
-                [
-                    containers.get_branch(c, working_dir="/repos/repo"),
-                    containers.get_commit(c, working_dir="/repos/repo"),
-                    containers.get_tag(c, working_dir="/repos/repo"),
-                ]
-                + [
-                    containers.run_container_cmd_no_args_return_first_line_or_none(
-                        command, c, working_dir="/repos/repo"
-                    )
-                    for command in version_commands.values()
-                ]
-            )
+        ref_info, versions = await containers.probe_ref_info_and_versions(
+            c, version_commands, working_dir="/repos/repo"
         )
-        versions = {
-            command_name: version_results[i]
-            for (i, (command_name, command)) in enumerate(version_commands.items())
-        }
+        branch, commit, tag = ref_info["branch"], ref_info["commit"], ref_info["tag"]
 
         if dry_run:
             for task in tasks:
@@ -261,6 +416,7 @@ async def run_in_repo_at_ref(
             for tr in task_results:
                 if isinstance(tr, Exception):
                     log.error(f"error running task: {tr}")
+            slot.failed = any(is_failed_run(tr) for tr in task_results)
 
             result: Dict[str, Any] = dict(
                 org=org_repo.org,
@@ -273,15 +429,157 @@ async def run_in_repo_at_ref(
                 tag=tag,
                 dependency_files=[fr.to_dict() for fr in file_rows],
                 task_results=[tr for tr in task_results if isinstance(tr, dict)],
+                # tasks that didn't run or finish e.g. from missing files
+                task_errors=[
+                    str(tr) for tr in task_results if isinstance(tr, Exception)
+                ],
             )
             yield result
 
 
+# exit code of an exec killed with SIGKILL e.g. by the OOM killer
+KILLED_EXIT_CODE = 128 + 9
+
+
+def is_failed_run(task_result: Union[Dict[str, Any], Exception]) -> bool:
+    "Returns whether a task result indicates the container was overloaded"
+    if isinstance(task_result, containers.DockerRunException):
+        return True
+    return (
+        isinstance(task_result, dict) and task_result["exit_code"] == KILLED_EXIT_CODE
+    )
+
+
+def is_cacheable_result(result: Dict[str, Any]) -> bool:
+    "Returns whether a result's tasks all ran and finished without being killed"
+    return not result.get("task_errors", []) and not any(
+        is_failed_run(task_result) for task_result in result["task_results"]
+    )
+
+
+def cache_results(
+    disk_cache: Optional[disk_cache_util.DiskCache],
+    keys: Iterable[Any],
+    results: List[Dict],
+) -> bool:
+    """Returns whether a run's results are cacheable and saves them under
+    each key in disk_cache when they are, so failed runs are retried
+    """
+    if not results or not all(is_cacheable_result(result) for result in results):
+        return False
+    if disk_cache is not None:
+        for key in keys:
+            disk_cache.set(key, results)
+    return True
+
+
+def rebase_result(
+    result: Dict[str, Any],
+    org_repo: OrgRepo,
+    git_ref: GitRef,
+    path: pathlib.Path,
+    dep_files: List[DependencyFile],
+) -> Dict[str, Any]:
+    """Returns a copy of a result for the same dep. files in another repo,
+    ref, or dir as if it ran for org_repo at git_ref in path
+
+    The commit, branch, and tag of the ref aren't known without checking
+    it out, so they're None.
+    """
+    working_dir = str(pathlib.Path("/repos/repo") / path)
+    return dict(
+        result,
+        org=org_repo.org,
+        repo=org_repo.repo,
+        ref=git_ref.to_dict(),
+        repo_url=org_repo.github_clone_url,
+        branch=None,
+        commit=None,
+        tag=None,
+        dependency_files=[df.to_dict() for df in dep_files],
+        task_results=[
+            dict(task_result, working_dir=working_dir, relative_path=str(path))
+            for task_result in result["task_results"]
+        ],
+    )
+
+
+def job_resources(args: argparse.Namespace) -> JobResources:
+    return JobResources(
+        cpus=args.job_cpus or None, memory=(args.job_memory * 1024 * 1024) or None,
+    )
+
+
+def open_disk_cache(args: argparse.Namespace) -> Optional[disk_cache_util.DiskCache]:
+    if args.cache_dir is None or args.dry_run:
+        return None
+    return disk_cache_util.DiskCache(
+        str(pathlib.Path(args.cache_dir) / "run_repo_tasks.sqlite3"),
+        max_size=args.cache_max_size * 1024 * 1024,
+        max_age=args.cache_max_age * 24 * 60 * 60,
+    )
+
+
+async def create_scheduler(
+    args: argparse.Namespace, concurrency: int
+) -> ContainerScheduler:
+    cpu_budget = args.cpu_budget
+    memory_budget = (
+        None if args.memory_budget is None else args.memory_budget * 1024 * 1024
+    )
+    if not args.dry_run and (cpu_budget is None or memory_budget is None):
+        host_cpus, host_memory = await docker_host_resources()
+        cpu_budget = host_cpus if cpu_budget is None else cpu_budget
+        memory_budget = host_memory if memory_budget is None else memory_budget
+    log.info(
+        f"running up to {concurrency} task containers with a budget of "
+        f"{cpu_budget} CPUs and {memory_budget} bytes of memory"
+    )
+    return ContainerScheduler(
+        concurrency,
+        cpu_budget=cpu_budget,
+        memory_budget=memory_budget,
+        max_load=args.max_host_load,
+        metrics=getattr(args, "metrics", None),
+    )
+
+
+def cache_volume_configs(
+    caches: List[PackageCache],
+) -> List[volumes.DockerVolumeConfig]:
+    return [
+        volumes.DockerVolumeConfig(
+            name=cache.volume_name,
+            mount_point=cache.mount_point,
+            labels={"fpr-package-cache": cache.volume_name},
+            delete=False,
+        )
+        for cache in caches
+    ]
+
+
+async def prune_package_caches(
+    args: argparse.Namespace, caches_and_images: Iterable[Tuple[PackageCache, str]]
+) -> None:
+    "Deletes least recently used entries from caches over --package-cache-max-size"
+    max_size = args.package_cache_max_size * 1024 * 1024
+    for cache, image_tag in caches_and_images:
+        async with containers.run(
+            image_tag,
+            name=f"dep-obs-prune-{cache.volume_name}-{hex(randrange(1 << 32))[2:]}",
+            cmd="/bin/bash",
+            volumes=cache_volume_configs([cache]),
+        ) as c:
+            await containers.prune_cache(
+                c, cache.mount_point, max_size, cache.prune_entry_patterns
+            )
+
+
 DepFileRow = Tuple[OrgRepo, GitRef, DependencyFile]
 
 
 def group_by_org_repo_ref_path(
-    source: Generator[Dict[str, Any], None, None]
+    source: Iterable[Dict[str, Any]]
 ) -> Generator[Tuple[Tuple[str, str, pathlib.Path], List[DepFileRow]], None, None]:
     # read all input rows into memory
     rows: List[DepFileRow] = [
@@ -313,13 +611,10 @@ def group_by_org_repo_ref_path(
             yield (org_repo_key, ref_value_key, dep_file_parent_key), file_rows
 
 
-def iter_task_envs(
-    args: argparse.Namespace,
-) -> Generator[
-    Tuple[Language, PackageManager, DockerImage, ChainMap, List[ContainerTask]],
-    None,
-    None,
-]:
+TaskEnv = Tuple[Language, PackageManager, DockerImage, ChainMap, List[ContainerTask]]
+
+
+def iter_task_envs(args: argparse.Namespace) -> Generator[TaskEnv, None, None]:
     enabled_languages = args.language or language_names
     if not args.language:
         log.debug(f"languages not specified using all of {enabled_languages}")
@@ -360,7 +655,7 @@ def iter_task_envs(
 
 
 async def run_pipeline(
-    source: Generator[Dict[str, Any], None, None], args: argparse.Namespace
+    source: AsyncIterable[Dict[str, Any]], args: argparse.Namespace
 ) -> AsyncGenerator[Dict, None]:
     log.info(f"{pipeline.name} pipeline started with args {args}")
     task_envs = list(iter_task_envs(args))
@@ -377,74 +672,247 @@ async def run_pipeline(
         built_image_tags: Iterable[str] = await build_images(args.docker_pull, images)
         log.info(f"successfully built and tagged images {built_image_tags}")
 
+    concurrency = args.concurrency
+    if args.use_volumes and concurrency > 1:
+        log.warning(
+            "ignoring --concurrency since --use-volumes shares a repo checkout between containers"
+        )
+        concurrency = 1
+
+    def iter_items(
+        rows: Iterable[Dict[str, Any]]
+    ) -> Generator[Tuple[str, pathlib.Path, List[DepFileRow], TaskEnv], None, None]:
+        for (
+            (org_repo_key, ref_value_key, dep_file_parent_key),
+            file_rows,
+        ) in group_by_org_repo_ref_path(rows):
+            log.debug(
+                f"in {dep_file_parent_key!r} with files {[fr[2].path for fr in file_rows]}"
+            )
+            if args.dir is not None:
+                if pathlib.PurePath(args.dir) != dep_file_parent_key:
+                    log.debug(
+                        f"Skipping non-matching folder {dep_file_parent_key} for glob {args.dir}"
+                    )
+                    continue
+                else:
+                    log.debug(
+                        f"matching folder {dep_file_parent_key!r} for glob {args.dir!r}"
+                    )
+
+            for task_env in task_envs:
+                yield org_repo_key, dep_file_parent_key, file_rows, task_env
+
     # cache of results by lang name, package manager name,
     # image.local.repo_name_tag, org/repo, dep files dir path, dep file sha256s
-    cache: Dict[Tuple[str, str, str, str, pathlib.Path, str], List[Dict]] = {}
-    for (
-        (org_repo_key, ref_value_key, dep_file_parent_key),
-        file_rows,
-    ) in group_by_org_repo_ref_path(source):
+    # resolved when the first item with the key finishes running
+    cache: Dict[Tuple[str, str, str, str, pathlib.Path, str], asyncio.Future] = {}
+
+    # locks for package caches that don't support concurrent writers (only
+    # within this process; see --use-package-caches)
+    cache_locks: typing.DefaultDict[str, asyncio.Lock] = collections.defaultdict(
+        asyncio.Lock
+    )
+
+    # started containers to reuse by image.local.repo_name_tag, org/repo, and caches
+    pool = ContainerPool(
+        max_idle=args.container_pool_size, idle_timeout=args.container_idle_timeout
+    )
+
+    # admits task containers by resource limits and adaptive concurrency
+    scheduler = await create_scheduler(args, concurrency)
+
+    # results from previous runs by the in memory cache key with image IDs
+    # instead of tags and the tasks
+    disk_cache = open_disk_cache(args)
+
+    # results shared by items from any repo by package manager, image ID,
+    # task commands, and dep file sha256s
+    # resolved when the first item with the key finishes running
+    global_cache: Dict[str, asyncio.Future] = {}
+
+    # image IDs by image.local.repo_name_tag
+    image_ids: Dict[str, str] = {}
+
+    async def image_id(image: DockerImage) -> str:
+        tag = image.local.repo_name_tag
+        if tag not in image_ids:
+            image_info = await inspect_image(tag)
+            image_ids[tag] = image_info["Id"] if image_info is not None else tag
+        return image_ids[tag]
+
+    async def run_item(
+        item: Tuple[str, pathlib.Path, List[DepFileRow], TaskEnv]
+    ) -> AsyncGenerator[Dict, None]:
+        org_repo_key, dep_file_parent_key, file_rows, task_env = item
+        lang, pm, image, version_commands, tasks = task_env
         files = {fr[2].path.parts[-1] for fr in file_rows}
         file_hashes = sorted([fr[2].sha256 for fr in file_rows])
         dep_files = [fr[2] for fr in file_rows]
 
         org_repo, git_ref = file_rows[0][0:2]
 
-        log.debug(f"in {dep_file_parent_key!r} with files {files}")
-        if args.dir is not None:
-            if pathlib.PurePath(args.dir) != dep_file_parent_key:
-                log.debug(
-                    f"Skipping non-matching folder {dep_file_parent_key} for glob {args.dir}"
-                )
-                continue
-            else:
-                log.debug(
-                    f"matching folder {dep_file_parent_key!r} for glob {args.dir!r}"
+        if args.dry_run:
+            log.info(
+                f"for {lang.name} {pm.name} would run in {image.local.repo_name_tag}"
+                f" {org_repo_key} {git_ref.kind.name} {git_ref.value} {dep_file_parent_key}"
+                f" {list(version_commands.values())} concurrently then"
+                f" {[t.command for t in tasks]} "
+            )
+            return
+
+        # TODO: use caching decorator
+        cache_key = (
+            lang.name,
+            pm.name,
+            image.local.repo_name_tag,
+            org_repo_key,
+            dep_file_parent_key,
+            "-".join(file_hashes),
+        )
+        if args.use_cache and cache_key in cache:
+            log.debug(f"using cached result for {cache_key}")
+            for cached_result in await cache[cache_key]:
+                yield dict(cached_result, data_source="in_memory_cache")
+            return
+
+        cache[cache_key] = asyncio.get_running_loop().create_future()
+        results: List[Dict] = []
+        succeeded = False
+        # keys to save the results under in disk_cache
+        disk_cache_keys: List[Any] = []
+        global_future: Optional[asyncio.Future] = None
+        try:
+            if disk_cache is not None:
+                disk_cache_key = dict(
+                    language=lang.name,
+                    package_manager=pm.name,
+                    image_id=await image_id(image),
+                    org_repo=org_repo_key,
+                    dir=str(dep_file_parent_key),
+                    dependency_file_sha256s=file_hashes,
+                    tasks=[[task.name, task.command] for task in tasks],
                 )
-
-        for lang, pm, image, version_commands, tasks in task_envs:
-            if args.dry_run:
-                log.info(
-                    f"for {lang.name} {pm.name} would run in {image.local.repo_name_tag}"
-                    f" {org_repo_key} {git_ref.kind.name} {git_ref.value} {dep_file_parent_key}"
-                    f" {list(version_commands.values())} concurrently then"
-                    f" {[t.command for t in tasks]} "
+                disk_cache_keys.append(disk_cache_key)
+                cached_results = disk_cache.get(disk_cache_key)
+                if cached_results is not None:
+                    log.debug(f"using disk cached result for {cache_key}")
+                    for cached_result in cached_results:
+                        result = rebase_result(
+                            cached_result,
+                            org_repo,
+                            git_ref,
+                            dep_file_parent_key,
+                            dep_files,
+                        )
+                        result["data_source"] = "disk_cache"
+                        results.append(result)
+                        yield result
+                    return
+
+            if args.use_global_cache:
+                global_key = disk_cache_util.cache_key(
+                    dict(
+                        tier="global",
+                        package_manager=pm.name,
+                        image_id=await image_id(image),
+                        commands=[task.command for task in tasks],
+                        dependency_file_sha256s=file_hashes,
+                    )
                 )
-                continue
-
-            # TODO: use caching decorator
-            cache_key = (
-                lang.name,
-                pm.name,
-                image.local.repo_name_tag,
-                org_repo_key,
-                dep_file_parent_key,
-                "-".join(file_hashes),
-            )
-            if args.use_cache and cache_key in cache:
-                log.debug(f"using cached result for {cache_key}")
-                for cached_result in cache[cache_key]:
-                    cached_result["data_source"] = "in_memory_cache"
-                    yield cached_result
-                continue
-
-            cache[cache_key] = []
-            try:
-                async for result in run_in_repo_at_ref(
-                    args,
-                    (org_repo, git_ref, dep_file_parent_key),
-                    tasks,
-                    version_commands,
-                    args.dry_run,
-                    files,
-                    dep_files,
-                    image,
-                ):
-                    cache[cache_key].append(result)
-                    yield result
+                disk_cache_keys.append(global_key)
+                if global_key in global_cache:
+                    global_results = await global_cache[global_key]
+                elif disk_cache is not None:
+                    global_results = disk_cache.get(global_key) or []
+                else:
+                    global_results = []
+                if global_results:
+                    log.debug(f"using global cached result for {cache_key}")
+                    for global_result in global_results:
+                        result = rebase_result(
+                            global_result,
+                            org_repo,
+                            git_ref,
+                            dep_file_parent_key,
+                            dep_files,
+                        )
+                        result["data_source"] = "global_cache"
+                        results.append(result)
+                        yield result
+                    return
+                if global_key not in global_cache:
+                    global_future = global_cache[
+                        global_key
+                    ] = asyncio.get_running_loop().create_future()
+
+            async for result in run_in_repo_at_ref(
+                args,
+                (org_repo, git_ref, dep_file_parent_key),
+                tasks,
+                version_commands,
+                args.dry_run,
+                files,
+                dep_files,
+                image,
+                pool,
+                pm.caches if args.use_package_caches else [],
+                cache_locks,
+                scheduler,
+            ):
+                results.append(result)
+                yield result
+            succeeded = cache_results(disk_cache, disk_cache_keys, results)
+            if succeeded and disk_cache is not None:
                 log.debug(f"saved cached result for {cache_key}")
-            except Exception as e:
-                log.error(f"error running tasks {tasks!r}:\n{exc_to_str()}")
+        finally:
+            cache[cache_key].set_result(results)
+            if global_future is not None:
+                if succeeded:
+                    global_future.set_result(results)
+                else:
+                    # waiting items and later items run the tasks themselves
+                    del global_cache[global_key]
+                    global_future.set_result([])
+
+    def item_key(
+        item: Tuple[str, pathlib.Path, List[DepFileRow], TaskEnv]
+    ) -> Tuple[str, ...]:
+        org_repo_key, dep_file_parent_key, file_rows, task_env = item
+        lang, pm, image, _, tasks = task_env
+        return (
+            lang.name,
+            pm.name,
+            image.local.repo_name_tag,
+            org_repo_key,
+            file_rows[0][1].value,
+            str(dep_file_parent_key),
+            "-".join(sorted(fr[2].sha256 for fr in file_rows)),
+            ",".join(task.name for task in tasks),
+        )
+
+    try:
+        async for result in map_concurrently(
+            checkpointed(args, pipeline.name, item_key, run_item),
+            aiter_items(iter_items([item async for item in source])),
+            concurrency=concurrency,
+            ordered=not args.unordered,
+        ):
+            yield result
+    finally:
+        await pool.close()
+        if disk_cache is not None:
+            disk_cache.close()
+
+    if args.use_package_caches and not args.dry_run:
+        await prune_package_caches(
+            args,
+            {
+                cache.volume_name: (cache, image.local.repo_name_tag)
+                for (_, pm, image, _, _) in task_envs
+                for cache in pm.caches
+            }.values(),
+        )
 
 
 # TODO: improve validation and specify field providers
@@ -460,12 +928,24 @@ IN_FIELDS: Dict[str, Union[type, str, Dict[str, str]]] = {
 }
 OUT_FIELDS = {**{k: v for k, v in IN_FIELDS.items() if k != "dependency_file"}}
 
+
+def shard_key(item: Dict[str, Any]) -> Tuple[str, str, str, str]:
+    "shard by the org, repo, ref, and dep file dir group_by_org_repo_ref_path groups by"
+    return (
+        item["org"],
+        item["repo"],
+        item["ref"]["value"],
+        str(pathlib.PurePath(item["dependency_file"]["path"]).parent),
+    )
+
+
 pipeline = Pipeline(
     name="run_repo_tasks",
     desc=__doc__,
     fields=set(OUT_FIELDS.keys()),
     argparser=parse_args,
-    reader=iter_jsonlines,
+    reader=iter_records,
     runner=run_pipeline,
-    writer=on_next_save_to_jsonl,
+    writer=JSONLinesWriter,
+    shard_key=shard_key,
 )
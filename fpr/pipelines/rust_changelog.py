@@ -16,10 +16,12 @@ from typing import (
     Union,
     Generator,
     AsyncGenerator,
+    AsyncIterable,
+    Iterable,
 )
 
-from fpr.rx_util import on_next_save_to_jsonl
-from fpr.serialize_util import get_in, extract_fields, iter_jsonlines, REPO_FIELDS
+from fpr.rx_util import JSONLinesWriter
+from fpr.serialize_util import get_in, extract_fields, iter_records, REPO_FIELDS
 import fpr.docker.containers as containers
 from fpr.models.pipeline import Pipeline
 from fpr.models.org_repo import OrgRepo
@@ -132,17 +134,18 @@ def run_compare_rust_commits(
 
 
 async def run_pipeline(
-    source: Generator[Dict, None, None], args: argparse.Namespace
+    source: AsyncIterable[Dict], args: argparse.Namespace
 ) -> AsyncGenerator[None, None]:
+    metas: Iterable[Dict] = [meta async for meta in source]
     if args.manifest_path is not None:
-        source = (
-            meta for meta in source if meta["cargo_tomlfile_path"] == args.manifest_path
+        metas = (
+            meta for meta in metas if meta["cargo_tomlfile_path"] == args.manifest_path
         )
 
     # combine meta outputs for each commit (e.g. {path1: meta1, path2: meta2})
     commits_with_meta = list(
         {meta["cargo_tomlfile_path"]: meta for meta in group}
-        for commit, group in itertools.groupby(source, key=lambda meta: meta["commit"])
+        for commit, group in itertools.groupby(metas, key=lambda meta: meta["commit"])
     )
 
     last_commit_metas = None
@@ -215,8 +218,8 @@ pipeline = Pipeline(
     desc=__doc__,
     fields=FIELDS,
     argparser=parse_args,
-    reader=iter_jsonlines,
+    reader=iter_records,
     runner=run_pipeline,
     serializer=serialize,
-    writer=on_next_save_to_jsonl,
+    writer=JSONLinesWriter,
 )
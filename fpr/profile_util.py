@@ -0,0 +1,99 @@
+import argparse
+import cProfile
+import io
+import logging
+import os
+import pstats
+from typing import Callable, List, TypeVar
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None  # type: ignore
+
+
+log = logging.getLogger("fpr.profile_util")
+
+T = TypeVar("T")
+
+PROFILERS = ["auto", "cprofile", "pyinstrument"]
+
+
+def profile_path(args: argparse.Namespace, pipeline_names: List[str], ext: str) -> str:
+    return os.path.join(
+        args.profile_dir, f"fpr-profile-{'-'.join(pipeline_names)}{ext}"
+    )
+
+
+def cprofile_summary(
+    profiler: cProfile.Profile, pipeline_names: List[str], top_n: int
+) -> str:
+    """Returns the top_n functions by internal time overall and by
+    cumulative time in each pipeline module
+    """
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats(pstats.SortKey.TIME)
+    out.write(f"top {top_n} functions by internal time:\n")
+    stats.print_stats(top_n)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE)
+    for pipeline_name in pipeline_names:
+        out.write(f"top {top_n} {pipeline_name} functions by cumulative time:\n")
+        stats.print_stats(f"pipelines[/\\\\]{pipeline_name}\\.py", top_n)
+    return out.getvalue()
+
+
+def run_cprofile(
+    fn: Callable[[], T], args: argparse.Namespace, pipeline_names: List[str]
+) -> T:
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(fn)
+    finally:
+        path = profile_path(args, pipeline_names, ".prof")
+        profiler.dump_stats(path)
+        summary = cprofile_summary(profiler, pipeline_names, args.profile_top)
+        with open(profile_path(args, pipeline_names, ".txt"), "w") as f:
+            f.write(summary)
+        log.info(f"wrote cProfile stats to {path} summary:\n{summary}")
+
+
+def run_pyinstrument(
+    fn: Callable[[], T], args: argparse.Namespace, pipeline_names: List[str]
+) -> T:
+    profiler = pyinstrument.Profiler(async_mode="enabled")
+    profiler.start()
+    try:
+        return fn()
+    finally:
+        profiler.stop()
+        path = profile_path(args, pipeline_names, ".html")
+        with open(path, "w") as f:
+            f.write(profiler.output_html())
+        summary = profiler.output_text(unicode=False, color=False)
+        with open(profile_path(args, pipeline_names, ".txt"), "w") as f:
+            f.write(summary)
+        log.info(f"wrote pyinstrument profile to {path} summary:\n{summary}")
+
+
+def run_profiled(
+    fn: Callable[[], T], args: argparse.Namespace, pipeline_names: List[str]
+) -> T:
+    """Returns fn() run with args.profiler writing a profile and summary
+    named for the pipelines to args.profile_dir
+
+    The auto profiler uses the pyinstrument sampling profiler when it is
+    installed (it attributes time to awaiting coroutines) and cProfile
+    otherwise.
+    """
+    profiler = args.profiler
+    if profiler == "auto":
+        profiler = "cprofile" if pyinstrument is None else "pyinstrument"
+    if profiler == "pyinstrument":
+        if pyinstrument is None:
+            raise ImportError(
+                "--profiler pyinstrument requires the pyinstrument package "
+                "(pip install pyinstrument)"
+            )
+        return run_pyinstrument(fn, args, pipeline_names)
+    return run_cprofile(fn, args, pipeline_names)
@@ -11,10 +11,37 @@ import logging
 import os
 import sys
 import json
+import time
+from typing import (
+    IO,
+    Any,
+    AsyncGenerator,
+    AsyncIterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
+from fpr.checkpoint_util import CheckpointJournal, RESUME_MODES
+from fpr.compression_util import open_stdin
+from fpr.docker.client import DEFAULT_CONNECTION_LIMIT, shared_client, streaming_client
+from fpr.metrics_util import ErrorCountingHandler, MetricsRegistry, METRICS_FORMATS
+from fpr.models.pipeline import Pipeline
 from fpr.pipelines import pipelines
 from fpr.pipelines.util import exc_to_str
-from fpr.rx_util import save_to_tmpfile
+from fpr.profile_util import PROFILERS, pyinstrument, run_profiled
+from fpr.rx_util import (
+    aiter_in_thread,
+    iter_queue,
+    save_to_tmpfile,
+    BufferedWriter,
+    END_OF_QUEUE,
+    when_all_flushed,
+    writers_by_format,
+)
+from fpr.serialize_util import msgpack
+from fpr.shard_util import filter_shard, parse_shard
 
 log = logging.getLogger("fpr")
 log.setLevel(logging.DEBUG)
@@ -26,10 +53,41 @@ formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(messag
 fh.setFormatter(formatter)
 ch.setFormatter(formatter)
 
+pipeline_names = [pipeline.name for pipeline in pipelines]
 
-def parse_args():
+# separates the args for each pipeline in a chain
+CHAIN_ARGS_SEPARATOR = "--"
+
+
+def is_pipeline_chain(arg: str) -> bool:
+    "Returns True for two or more comma separated pipeline names"
+    names = arg.split(",")
+    return len(names) > 1 and all(name in pipeline_names for name in names)
+
+
+def split_chain_args(args: Sequence[str]) -> List[List[str]]:
+    """Splits args on CHAIN_ARGS_SEPARATOR
+
+    e.g. ['--tags', '--', '--glob', 'Cargo.lock'] -> [['--tags'], ['--glob', 'Cargo.lock']]
+    """
+    chain_args: List[List[str]] = [[]]
+    for arg in args:
+        if arg == CHAIN_ARGS_SEPARATOR:
+            chain_args.append([])
+        else:
+            chain_args[-1].append(arg)
+    return chain_args
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> List[argparse.Namespace]:
     parser = argparse.ArgumentParser(
-        description="Runs a single pipeline", usage=__doc__
+        description="Runs a single pipeline or a comma separated chain of pipelines",
+        usage=__doc__,
+        epilog="To run pipelines in one process pass comma separated pipeline names "
+        "and separate the args for each pipeline with '--' e.g. "
+        "'find_git_refs,find_dep_files,run_repo_tasks --docker-build -- "
+        "--docker-build -- --repo-task audit'. Pipelines other than the last "
+        "only write to their outfile when one is provided.",
     )
     parser.add_argument(
         "-v",
@@ -51,16 +109,392 @@ def parse_args():
         default=False,
         help="Save unserialized and serizalized results to temp files. Defaults to False.",
     )
+    parser.add_argument(
+        "--chain-queue-size",
+        type=int,
+        default=100,
+        help="Max number of results to queue between chained pipelines before "
+        "pausing the upstream pipeline. Defaults to 100.",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        type=str,
+        default=None,
+        help="Path to a journal of finished input items and their results "
+        "to skip items finished by a previous run with the same path. Applies "
+        "to find_git_refs, find_dep_files, and run_repo_tasks. Defaults to None.",
+    )
+    parser.add_argument(
+        "--checkpoint-resume",
+        choices=RESUME_MODES,
+        default="replay",
+        help="Whether to write the results of input items finished by a "
+        "previous run (replay) or skip them (suppress e.g. when appending to "
+        "the previous run's outfile). Defaults to replay.",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        default=None,
+        metavar="INDEX/COUNT",
+        help="Only process the first pipeline's input items in zero-based "
+        "shard INDEX of COUNT shards e.g. 0/4. Items are assigned to shards by "
+        "hashing a pipeline specific key (e.g. org/repo for find_git_refs) so "
+        "grouping and caching stay valid within a shard. Defaults to None.",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        type=str,
+        default=None,
+        help="Path to write per pipeline item counts, error counts, and "
+        "reader, runner, serializer, and writer latency histograms to "
+        "periodically and on exit. Defaults to None.",
+    )
+    parser.add_argument(
+        "--metrics-format",
+        choices=METRICS_FORMATS,
+        default="json",
+        help="Format to write --metrics-file in. Defaults to json.",
+    )
+    parser.add_argument(
+        "--metrics-interval",
+        type=float,
+        default=10.0,
+        help="Seconds between writes to --metrics-file. Defaults to 10.",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        default=False,
+        help="Profile the pipeline(s) writing a profile and a summary of the "
+        "slowest functions named for the pipeline(s) to --profile-dir. "
+        "Defaults to False.",
+    )
+    parser.add_argument(
+        "--profiler",
+        choices=PROFILERS,
+        default="auto",
+        help="Profiler for --profile. auto uses pyinstrument when it is "
+        "installed and cprofile otherwise. Defaults to auto.",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        type=str,
+        default=".",
+        help="Directory to write --profile output to. Defaults to the current directory.",
+    )
+    parser.add_argument(
+        "--profile-top",
+        type=int,
+        default=30,
+        help="Number of functions to include in --profile summaries. Defaults to 30.",
+    )
+    parser.add_argument(
+        "--read-ahead",
+        type=int,
+        default=100,
+        help="Max number of input items to read and decode before the first "
+        "pipeline processes them. Defaults to 100.",
+    )
+    parser.add_argument(
+        "--write-buffer-size",
+        type=int,
+        default=1 << 20,
+        help="Max number of bytes of serialized results to buffer before "
+        "writing them to the outfiles. Defaults to 1MiB.",
+    )
+    parser.add_argument(
+        "--flush-interval",
+        type=float,
+        default=1.0,
+        help="Max number of seconds to buffer serialized results before "
+        "writing them to the outfiles. Use 0 to write each result as it "
+        "finishes. Defaults to 1.",
+    )
+    parser.add_argument(
+        "--docker-connection-limit",
+        type=int,
+        default=DEFAULT_CONNECTION_LIMIT,
+        help="Max number of open connections to the docker daemon shared by "
+        "all pipelines. Container logs followed for --container-log-dir use "
+        f"separate connections. Defaults to {DEFAULT_CONNECTION_LIMIT}.",
+    )
 
     subparsers = parser.add_subparsers(help="available pipelines", dest="pipeline_name")
     for pipeline in pipelines:
         pipeline_parser = subparsers.add_parser(pipeline.name, help=pipeline.desc)
-        pipeline.argparser(pipeline_parser)
-    return parser.parse_args()
+        getattr(pipeline, "argparser")(pipeline_parser)
+
+    argv = sys.argv[1:] if argv is None else argv
+    pipelines_args = parse_pipelines_args(parser, argv)
+    for args in pipelines_args:
+        if getattr(args, "format", None) == "msgpack" and msgpack is None:
+            parser.error("--format msgpack requires the msgpack package")
+        if args.profiler == "pyinstrument" and pyinstrument is None:
+            parser.error(
+                "--profiler pyinstrument requires the pyinstrument package "
+                "(pip install pyinstrument)"
+            )
+
+    first_args = pipelines_args[0]
+    if getattr(first_args, "infile", None) is sys.stdin:
+        # decompress the default stdin infile like -i -
+        try:
+            first_args.infile = open_stdin()
+        except ImportError as e:
+            parser.error(f"can't read stdin: {e}")
+    return pipelines_args
+
+
+def parse_pipelines_args(
+    parser: argparse.ArgumentParser, argv: Sequence[str]
+) -> List[argparse.Namespace]:
+    chain_index = next(
+        (i for (i, arg) in enumerate(argv) if is_pipeline_chain(arg)), None
+    )
+    if chain_index is None:
+        return [parser.parse_args(argv)]
+
+    global_args, names = argv[:chain_index], argv[chain_index].split(",")
+    chain_args = split_chain_args(argv[chain_index + 1 :])
+    if len(chain_args) > len(names):
+        parser.error(
+            f"got {len(chain_args)} sets of pipeline args for {len(names)} pipelines"
+        )
+    chain_args += [[] for _ in range(len(names) - len(chain_args))]
+    return [
+        parser.parse_args([*global_args, name, *pipeline_args])
+        for (name, pipeline_args) in zip(names, chain_args)
+    ]
+
+
+def open_writers(
+    pipeline: Pipeline, args: argparse.Namespace, write_outfile: bool = True
+) -> List[BufferedWriter]:
+    "Returns pipeline writers for the outfile and append outfile"
+    outfiles: List[IO] = []
+    if write_outfile:
+        outfiles.append(args.outfile)
+    if args.append_outfile:
+        outfiles.append(args.append_outfile)
+    writer_cls = getattr(pipeline, "writer")
+    if getattr(args, "format", None):
+        writer_cls = writers_by_format[args.format]
+    return [
+        writer_cls(
+            outfile,
+            buffer_size=args.write_buffer_size,
+            flush_interval=args.flush_interval,
+        )
+        for outfile in outfiles
+    ]
+
+
+def close_writers(args: argparse.Namespace, writers: Sequence[BufferedWriter]) -> None:
+    for writer in writers:
+        try:
+            writer.close()
+        except Exception as e:
+            log.error(
+                f"error flushing results for {args.pipeline_name} pipeline:\n{exc_to_str()}"
+            )
+
+
+def write_row(
+    pipeline: Pipeline,
+    args: argparse.Namespace,
+    row: Any,
+    writers: Sequence[BufferedWriter],
+    metrics: MetricsRegistry,
+) -> Optional[Any]:
+    """Serializes a pipeline result and writes it to the pipeline outfiles
+
+    Records the checkpoint of the result's input item once its results
+    are flushed. Returns the serialized result or None if serializing or
+    writing failed.
+    """
+    if args.save_to_tmpfile:
+        save_to_tmpfile(
+            f"{args.pipeline_name}_unserialized_", file_ext=".pickle", item=row
+        )
+
+    journal = getattr(args, "checkpoint_journal", None)
+    stage = "serializer"
+    try:
+        with metrics.timer(
+            "fpr_stage_seconds", pipeline=args.pipeline_name, stage=stage
+        ):
+            serialized = getattr(pipeline, "serializer")(args, row)
+        if args.save_to_tmpfile:
+            save_to_tmpfile(
+                f"{args.pipeline_name}_serialized_", file_ext=".json", item=serialized,
+            )
+        stage = "writer"
+        with metrics.timer(
+            "fpr_stage_seconds", pipeline=args.pipeline_name, stage=stage
+        ):
+            for writer in writers:
+                writer.write(serialized)
+        if journal is not None:
+            flushed = journal.written(row)
+            if flushed is not None:
+                when_all_flushed(writers, flushed)
+        metrics.inc("fpr_items_out_total", pipeline=args.pipeline_name)
+        return serialized
+    except Exception as e:
+        if journal is not None:
+            journal.write_failed(row)
+        metrics.inc("fpr_errors_total", pipeline=args.pipeline_name, stage=stage)
+        log.error(
+            f"error serializing result for {args.pipeline_name} pipeline:\n{exc_to_str()}"
+        )
+    return None
+
+
+async def run_stage(
+    pipeline: Pipeline,
+    args: argparse.Namespace,
+    source: AsyncIterable[Any],
+    metrics: MetricsRegistry,
+) -> AsyncGenerator[Any, None]:
+    """Yields the pipeline runner results for source observing the seconds
+    spent waiting on source (reader) and in the runner per result
+    """
+    labels = dict(pipeline=args.pipeline_name)
+    reader_seconds = 0.0
+
+    async def read() -> AsyncGenerator[Any, None]:
+        nonlocal reader_seconds
+        items = source.__aiter__()
+        while True:
+            start = time.perf_counter()
+            try:
+                item = await items.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                elapsed = time.perf_counter() - start
+                reader_seconds += elapsed
+                metrics.observe("fpr_stage_seconds", elapsed, stage="reader", **labels)
+            metrics.inc("fpr_items_in_total", **labels)
+            yield item
+
+    rows = pipeline.runner(read(), args).__aiter__()
+    while True:
+        start, start_reader_seconds = time.perf_counter(), reader_seconds
+        try:
+            row = await rows.__anext__()
+        except StopAsyncIteration:
+            return
+        # exclude time the runner spent waiting on the reader
+        runner_seconds = time.perf_counter() - start
+        runner_seconds -= reader_seconds - start_reader_seconds
+        metrics.observe("fpr_stage_seconds", runner_seconds, stage="runner", **labels)
+        yield row
+
+
+async def write_metrics_periodically(
+    args: argparse.Namespace, metrics: MetricsRegistry
+) -> None:
+    while True:
+        await asyncio.sleep(args.metrics_interval)
+        try:
+            metrics.write(args.metrics_file, args.metrics_format)
+        except Exception as e:
+            log.error(f"error writing metrics:\n{exc_to_str()}")
+
+
+async def run_chained_pipeline(
+    pipeline: Pipeline,
+    args: argparse.Namespace,
+    rows: AsyncIterable[Any],
+    queue: asyncio.Queue,
+    metrics: MetricsRegistry,
+) -> None:
+    "Writes serialized results to the next pipeline's input queue"
+    writers = open_writers(pipeline, args, write_outfile=args.outfile is not sys.stdout)
+    try:
+        async for row in rows:
+            serialized = write_row(pipeline, args, row, writers, metrics)
+            if serialized is not None:
+                await queue.put(serialized)
+    except Exception as e:
+        metrics.inc("fpr_errors_total", pipeline=args.pipeline_name, stage="runner")
+        log.error(f"error running {args.pipeline_name} pipeline:\n{exc_to_str()}")
+    finally:
+        close_writers(args, writers)
+    await queue.put(END_OF_QUEUE)
+
+
+async def run_pipelines(
+    pipelines_and_args: Sequence[Tuple[Pipeline, argparse.Namespace]],
+    queue_size: int,
+    metrics: MetricsRegistry,
+) -> None:
+    """Runs one or more pipelines passing the serialized results of each
+    pipeline to the next through a bounded queue
+
+    The first pipeline's infile is read and decoded in a helper thread.
+    """
+    first_pipeline, first_args = pipelines_and_args[0]
+    metrics_task = None
+    if first_args.metrics_file:
+        metrics_task = asyncio.create_task(
+            write_metrics_periodically(first_args, metrics)
+        )
+
+    source = aiter_in_thread(
+        first_pipeline.reader(first_args.infile), first_args.read_ahead
+    )
+    if first_args.shard is not None:
+        source = filter_shard(
+            source, getattr(first_pipeline, "shard_key"), *first_args.shard
+        )
+
+    chained_tasks: List[asyncio.Task] = []
+    for pipeline, args in pipelines_and_args[:-1]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        chained_tasks.append(
+            asyncio.create_task(
+                run_chained_pipeline(
+                    pipeline,
+                    args,
+                    run_stage(pipeline, args, source, metrics),
+                    queue,
+                    metrics,
+                )
+            )
+        )
+        source = iter_queue(queue)
+
+    last_pipeline, last_args = pipelines_and_args[-1]
+    writers = open_writers(last_pipeline, last_args)
+    try:
+        async for row in run_stage(last_pipeline, last_args, source, metrics):
+            write_row(last_pipeline, last_args, row, writers, metrics)
+    finally:
+        with metrics.timer(
+            "fpr_stage_seconds", pipeline=last_args.pipeline_name, stage="writer"
+        ):
+            close_writers(last_args, writers)
+        if metrics_task is not None:
+            metrics_task.cancel()
+
+    for task in chained_tasks:
+        if not task.done():
+            log.warning(f"cancelling unfinished upstream pipeline {task}")
+            task.cancel()
+    await asyncio.gather(*chained_tasks, return_exceptions=True)
+
+
+def file_name(f: IO) -> str:
+    "Returns the name of a file arg (stream wrappers may not have one)"
+    return str(getattr(f, "name", f))
 
 
 def main():
-    args = parse_args()
+    pipelines_args = parse_args()
+    args = pipelines_args[0]
     if args.verbose:
         ch.setLevel(logging.DEBUG)
 
@@ -71,52 +505,87 @@ def main():
     if args.quiet:
         log.removeHandler(ch)
 
+    metrics = MetricsRegistry()
+    log.addHandler(ErrorCountingHandler(metrics))
+
     _scrub_arg_names = {"github_auth_token", "npm_auth_token"}
-    debug_args = {k: v for (k, v) in vars(args).items() if k not in _scrub_arg_names}
-    log.debug(f"args: {debug_args}")
+    for pipeline_args in pipelines_args:
+        debug_args = {
+            k: v for (k, v) in vars(pipeline_args).items() if k not in _scrub_arg_names
+        }
+        log.debug(f"args: {debug_args}")
 
     loop = asyncio.get_event_loop()
     asyncio.set_event_loop(loop)
 
-    pipeline = next(p for p in pipelines if p.name == args.pipeline_name)
+    journal = None
+    if args.checkpoint:
+        journal = CheckpointJournal(args.checkpoint, resume=args.checkpoint_resume)
+        for pipeline_args in pipelines_args:
+            pipeline_args.checkpoint_journal = journal
+
+    pipelines_and_args = [
+        (
+            next(p for p in pipelines if p.name == pipeline_args.pipeline_name),
+            pipeline_args,
+        )
+        for pipeline_args in pipelines_args
+    ]
+    pipeline_name = " -> ".join(
+        pipeline_args.pipeline_name for pipeline_args in pipelines_args
+    )
+    last_args = pipelines_args[-1]
     log_line = (
-        f"running pipeline {args.pipeline_name} on {args.infile.name} writing to "
-        f"{args.outfile.name}"
+        f"running pipeline {pipeline_name} on {file_name(args.infile)} writing to "
+        f"{file_name(last_args.outfile)}"
     )
-    if args.append_outfile:
-        log_line += f"and appending to {args.append_outfile.name}"
+    if last_args.append_outfile:
+        log_line += f"and appending to {file_name(last_args.append_outfile)}"
     log.info(log_line)
 
-    async def main():
-        async for row in pipeline.runner(pipeline.reader(args.infile), args):
-            if args.save_to_tmpfile:
-                save_to_tmpfile(
-                    f"{args.pipeline_name}_unserialized_", file_ext=".pickle", item=row
-                )
+    shared_client.configure(args.docker_connection_limit, metrics)
+    streaming_client.metrics = metrics
+    for pipeline_args in pipelines_args:
+        pipeline_args.metrics = metrics
 
-            try:
-                serialized = pipeline.serializer(args, row)
-                if args.save_to_tmpfile:
-                    save_to_tmpfile(
-                        f"{args.pipeline_name}_serialized_",
-                        file_ext=".json",
-                        item=serialized,
-                    )
-                writer = getattr(pipeline, "writer")
-                writer(args.outfile, serialized)
-                if args.append_outfile:
-                    writer(args.append_outfile, serialized)
-            except Exception as e:
-                log.error(
-                    f"error serializing result for {args.pipeline_name} pipeline:\n{exc_to_str()}"
-                )
+    async def run_and_close_docker_client() -> None:
+        try:
+            await run_pipelines(pipelines_and_args, args.chain_queue_size, metrics)
+        finally:
+            await shared_client.close()
+            await streaming_client.close()
+
+    def run() -> None:
+        asyncio.run(run_and_close_docker_client(), debug=False)
 
     try:
-        asyncio.run(main(), debug=False)
+        if args.profile:
+            run_profiled(
+                run,
+                args,
+                [pipeline_args.pipeline_name for pipeline_args in pipelines_args],
+            )
+        else:
+            run()
     except Exception as e:
-        log.error(f"error running {args.pipeline_name} pipeline:\n{exc_to_str()}")
+        log.error(f"error running {pipeline_name} pipeline:\n{exc_to_str()}")
+
+    if journal is not None:
+        journal.close()
+
+    # close outfiles to write compressed file trailers
+    for pipeline_args in pipelines_args:
+        for outfile in [pipeline_args.outfile, pipeline_args.append_outfile]:
+            if outfile is not None and outfile is not sys.stdout:
+                outfile.close()
+
+    if args.metrics_file:
+        try:
+            metrics.write(args.metrics_file, args.metrics_format)
+        except Exception as e:
+            log.error(f"error writing metrics:\n{exc_to_str()}")
 
-    log.info(f"pipeline {args.pipeline_name} finished")
+    log.info(f"pipeline {pipeline_name} finished")
 
 
 if __name__ == "__main__":
@@ -1,14 +1,46 @@
+import abc
 import asyncio
+import collections
+import concurrent.futures
 import functools
+import io
 import json
 import logging
+import os
 import pickle
 import tempfile
-from typing import Dict, IO, Tuple, Any
+import threading
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterable,
+    Callable,
+    Deque,
+    Dict,
+    IO,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    TypeVar,
+)
 
+from fpr.serialize_util import (
+    dumps_jsonline,
+    dumps_msgpack_frame,
+    MSGPACK_FRAMES_MAGIC,
+)
 
 log = logging.getLogger("fpr.rx_util")
 
+T = TypeVar("T")
+R = TypeVar("R")
+
+# marks the end of items put on a queue for iter_queue
+END_OF_QUEUE = object()
+
 
 async def sleep_by_index(sleep_per_index: float, item: Tuple[int, Any]):
     i, val = item
@@ -17,6 +49,163 @@ async def sleep_by_index(sleep_per_index: float, item: Tuple[int, Any]):
     return val
 
 
+async def aiter_items(items: Iterable[T]) -> AsyncGenerator[T, None]:
+    "Async generator over the items of a sync iterable"
+    for item in items:
+        yield item
+
+
+async def aenumerate(
+    items: AsyncIterable[T], start: int = 0
+) -> AsyncGenerator[Tuple[int, T], None]:
+    "enumerate for async iterables"
+    i = start
+    async for item in items:
+        yield i, item
+        i += 1
+
+
+async def agroupby(
+    items: AsyncIterable[T], key: Callable[[T], Any]
+) -> AsyncGenerator[Tuple[Any, List[T]], None]:
+    "itertools.groupby for async iterables yielding lists of consecutive items"
+    group: List[T] = []
+    group_key: Any = None
+    async for item in items:
+        item_key = key(item)
+        if group and item_key != group_key:
+            yield group_key, group
+            group = []
+        group_key = item_key
+        group.append(item)
+    if group:
+        yield group_key, group
+
+
+async def iter_queue(queue: asyncio.Queue) -> AsyncGenerator[Any, None]:
+    "Async generator over items from a queue until it gets END_OF_QUEUE"
+    while True:
+        item = await queue.get()
+        queue.task_done()
+        if item is END_OF_QUEUE:
+            break
+        yield item
+
+
+class _IterationError:
+    "Holds an exception raised iterating in a thread for aiter_in_thread"
+
+    def __init__(self, exc: Exception):
+        self.exc = exc
+
+
+async def aiter_in_thread(
+    items: Iterable[T], max_queue_size: int = 100
+) -> AsyncGenerator[T, None]:
+    """Async generator over the items of a sync iterable iterated in a
+    daemon thread e.g. to read and decode an infile without blocking the
+    event loop
+
+    Iterates up to max_queue_size items ahead of the consumer. Exceptions
+    raised iterating are raised in the consumer.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(max_queue_size, 1))
+    stopped = threading.Event()
+
+    def put(item: Any) -> bool:
+        "put an item on the queue returning False when the consumer stopped"
+        if stopped.is_set() or loop.is_closed():
+            return False
+        try:
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+        except (RuntimeError, concurrent.futures.CancelledError):
+            return False
+        return not stopped.is_set()
+
+    def iterate() -> None:
+        try:
+            for item in items:
+                if not put(item):
+                    return
+        except Exception as e:
+            put(_IterationError(e))
+            return
+        put(END_OF_QUEUE)
+
+    threading.Thread(target=iterate, name="fpr-aiter-in-thread", daemon=True).start()
+    try:
+        while True:
+            item = await queue.get()
+            if item is END_OF_QUEUE:
+                break
+            if isinstance(item, _IterationError):
+                raise item.exc
+            yield item
+    finally:
+        stopped.set()
+        # unblock a put waiting on a full queue so the thread can exit
+        while not queue.empty():
+            queue.get_nowait()
+
+
+async def map_concurrently(
+    fn: Callable[[T], AsyncIterable[R]],
+    items: AsyncIterable[T],
+    concurrency: int = 1,
+    ordered: bool = True,
+) -> AsyncGenerator[R, None]:
+    """Yields results from the async generator fn for each item processing up
+    to concurrency items at once
+
+    When ordered results are yielded in item order, otherwise results for
+    each item are yielded as soon as the item finishes. With a concurrency
+    of one or less items are processed one at a time and results are
+    yielded as fn yields them.
+    """
+    if concurrency <= 1:
+        async for item in items:
+            async for result in fn(item):
+                yield result
+        return
+
+    async def collect(item: T) -> List[R]:
+        return [result async for result in fn(item)]
+
+    pending: Deque[asyncio.Future] = collections.deque()
+    running: Set[asyncio.Future] = set()
+    try:
+        async for item in items:
+            if ordered:
+                if len(pending) >= concurrency:
+                    for result in await pending.popleft():
+                        yield result
+                pending.append(asyncio.ensure_future(collect(item)))
+            else:
+                if len(running) >= concurrency:
+                    done, running = await asyncio.wait(
+                        running, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for task in done:
+                        for result in task.result():
+                            yield result
+                running.add(asyncio.ensure_future(collect(item)))
+
+        while pending:
+            for result in await pending.popleft():
+                yield result
+        while running:
+            done, running = await asyncio.wait(
+                running, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                for result in task.result():
+                    yield result
+    finally:
+        for task in [*pending, *running]:
+            task.cancel()
+
+
 def save_to_tmpfile(prefix: str, item: Dict, file_ext=".json"):
     "Serializes item to JSON and saves it to a named temp file with the given prefix"
     if file_ext == ".json":
@@ -47,11 +236,160 @@ def save_to_tmpfile(prefix: str, item: Dict, file_ext=".json"):
         )
 
 
+class BufferedWriter(abc.ABC):
+    """Encodes items with .encode and writes them to outfile in batches
+
+    Buffered bytes are written and flushed when the buffer reaches
+    buffer_size bytes, flush_interval seconds after the first buffered
+    item, or on close. Close does not close outfile.
+    """
+
+    def __init__(
+        self, outfile: IO, buffer_size: int = 1 << 20, flush_interval: float = 1.0
+    ):
+        self.outfile = outfile
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.buffer: List[bytes] = []
+        self.buffered_bytes = 0
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+        # called once after the next flush
+        self.flush_callbacks: List[Callable[[], None]] = []
+
+        # write bytes to binary files and the binary buffer of text files
+        # (e.g. sys.stdout) to skip decoding then reencoding items
+        self.binary_outfile: Optional[IO[bytes]] = None
+        if not isinstance(outfile, io.TextIOBase):
+            self.binary_outfile = outfile
+        elif getattr(outfile, "buffer", None) is not None:
+            outfile.flush()
+            self.binary_outfile = getattr(outfile, "buffer")
+
+        if self.header and self.at_start_of_file():
+            self.buffer.append(self.header)
+            self.buffered_bytes += len(self.header)
+
+    # bytes to write before the first item of a new file
+    header: bytes = b""
+
+    @staticmethod
+    @abc.abstractmethod
+    def encode(item: Any) -> bytes:
+        pass
+
+    def at_start_of_file(self) -> bool:
+        # check the size of the underlying file since compressed streams
+        # opened for append (e.g. gzip) tell() 0 at the end of the file
+        try:
+            return os.fstat(self.outfile.fileno()).st_size == 0
+        except (OSError, ValueError):
+            # no file descriptor e.g. an in-memory stream
+            pass
+        try:
+            return self.outfile.tell() == 0
+        except (OSError, ValueError):
+            # not seekable e.g. a pipe
+            return True
+
+    def write(self, item: Any) -> None:
+        encoded = self.encode(item)
+        self.buffer.append(encoded)
+        self.buffered_bytes += len(encoded)
+        if self.buffered_bytes >= self.buffer_size or self.flush_interval <= 0:
+            self.flush()
+        elif self.flush_handle is None:
+            self.schedule_flush()
+
+    def schedule_flush(self) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # no loop to flush from; rely on size and close flushes
+            return
+        self.flush_handle = loop.call_later(self.flush_interval, self.flush)
+
+    def flush(self) -> None:
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        if not self.buffer:
+            return
+
+        data = b"".join(self.buffer)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(
+                "writing {} items ({} bytes) to {}".format(
+                    len(self.buffer), len(data), getattr(self.outfile, "name", "")
+                )
+            )
+        self.buffer.clear()
+        self.buffered_bytes = 0
+        if self.binary_outfile is not None:
+            self.binary_outfile.write(data)
+            self.binary_outfile.flush()
+        else:
+            self.outfile.write(data.decode("utf-8"))
+            self.outfile.flush()
+
+        callbacks, self.flush_callbacks = self.flush_callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def when_flushed(self, callback: Callable[[], None]) -> None:
+        "Calls callback after the buffered items are written and flushed"
+        if self.buffer:
+            self.flush_callbacks.append(callback)
+        else:
+            callback()
+
+    def close(self) -> None:
+        self.flush()
+
+
+def when_all_flushed(
+    writers: Sequence[BufferedWriter], callback: Callable[[], None]
+) -> None:
+    "Calls callback once all writers flush their buffered items"
+    unflushed = len(writers)
+
+    def flushed() -> None:
+        nonlocal unflushed
+        unflushed -= 1
+        if unflushed == 0:
+            callback()
+
+    if not writers:
+        callback()
+    for writer in writers:
+        writer.when_flushed(flushed)
+
+
+class JSONLinesWriter(BufferedWriter):
+    "Writes items as JSON lines http://jsonlines.org/"
+
+    encode = staticmethod(dumps_jsonline)
+
+
+class MsgpackWriter(BufferedWriter):
+    "Writes items as length prefixed msgpack frames for serialize_util.iter_records"
+
+    header = MSGPACK_FRAMES_MAGIC
+    encode = staticmethod(dumps_msgpack_frame)
+
+
+# writers for the pipeline --format arg
+writers_by_format: Dict[str, Callable[..., BufferedWriter]] = {
+    "jsonl": JSONLinesWriter,
+    "msgpack": MsgpackWriter,
+}
+
+
 def on_next_save_to_jsonl(outfile: IO, item):
-    log.debug("saving final pipeline item to {0}:\n{1}".format(outfile, item))
-    line = "{}\n".format(json.dumps(item))
+    "Writes item as an unbuffered JSON line to outfile"
+    line = dumps_jsonline(item).decode("utf-8")
     outfile.write(line)
-    log.debug("wrote jsonl to {0}:\n{1}".format(outfile, line))
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("wrote jsonl to {0}:\n{1}".format(outfile, line))
 
 
 def on_next_save_to_file(outfile: IO, item):
@@ -1,7 +1,35 @@
 import argparse
 import itertools
 import json
-from typing import Any, Dict, Iterable, Set, Sequence, List, Union, Generator
+import struct
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Set,
+    Sequence,
+    List,
+    Optional,
+    Union,
+    Generator,
+)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# first bytes of a msgpack frames file (JSON can't start with a null byte)
+MSGPACK_FRAMES_MAGIC = b"\x00fpr-msgpack-frames\x00"
+# big-endian unsigned int byte length of a msgpack frame
+MSGPACK_FRAME_HEADER = struct.Struct(">I")
 
 JSONPathElement = Union[int, str]
 JSONPath = Sequence[JSONPathElement]
@@ -42,13 +70,89 @@ def extract_nested_fields(d: Dict, fields: Dict[str, JSONPath]) -> Dict:
 
 
 def iter_jsonlines(
-    f: Sequence,
+    f: Iterable,
 ) -> Generator[Union[Dict, Sequence, int, str, None], None, None]:
     "Generator over JSON lines http://jsonlines.org/ files with extension .jsonl"
     for line in f:
         yield json.loads(line)
 
 
+def dumps_jsonline(item: Any, default: Optional[Callable[[Any], Any]] = None) -> bytes:
+    """Returns item serialized as a UTF-8 encoded JSON line
+
+    Uses orjson when it is installed and falls back to json for items
+    orjson can't serialize (e.g. ints over 64 bits). default is called
+    for objects that can't otherwise be serialized.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(
+                item,
+                default=default,
+                option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS,
+            )
+        except TypeError:
+            pass
+    # match orjson's compact separators and raw UTF-8 output
+    return (
+        json.dumps(item, default=default, separators=(",", ":"), ensure_ascii=False)
+        + "\n"
+    ).encode("utf-8")
+
+
+def canonical_json(item: Any) -> str:
+    "Returns a stable compact JSON string for item e.g. to hash or compare keys"
+    return json.dumps(item, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def check_msgpack_installed() -> None:
+    if msgpack is None:
+        raise ImportError(
+            "msgpack frames require the msgpack package (pip install msgpack)"
+        )
+
+
+def dumps_msgpack_frame(item: Any) -> bytes:
+    "Returns item serialized as a length prefixed msgpack frame"
+    check_msgpack_installed()
+    payload = msgpack.packb(item, use_bin_type=True)
+    return MSGPACK_FRAME_HEADER.pack(len(payload)) + payload
+
+
+def iter_msgpack_frames(f: IO[bytes]) -> Generator[Any, None, None]:
+    "Generator over length prefixed msgpack frames (after MSGPACK_FRAMES_MAGIC)"
+    check_msgpack_installed()
+    while True:
+        header = f.read(MSGPACK_FRAME_HEADER.size)
+        if not header:
+            return
+        if len(header) < MSGPACK_FRAME_HEADER.size:
+            raise ValueError("truncated msgpack frame header")
+        (size,) = MSGPACK_FRAME_HEADER.unpack(header)
+        payload = f.read(size)
+        if len(payload) < size:
+            raise ValueError(
+                f"truncated msgpack frame got {len(payload)} of {size} bytes"
+            )
+        yield msgpack.unpackb(payload, raw=False, strict_map_key=False)
+
+
+def iter_records(f: IO) -> Generator[Any, None, None]:
+    """Generator over the records of a msgpack frames or JSON lines file
+
+    Detects msgpack frames by MSGPACK_FRAMES_MAGIC and reads text file
+    args (e.g. sys.stdin) through their binary buffer.
+    """
+    binary = getattr(f, "buffer", f)
+    head = binary.read(len(MSGPACK_FRAMES_MAGIC))
+    if head == MSGPACK_FRAMES_MAGIC:
+        yield from iter_msgpack_frames(binary)
+    elif head:
+        # put back the lines of the first read
+        first_lines = (head + binary.readline()).splitlines(keepends=True)
+        yield from iter_jsonlines(itertools.chain(first_lines, binary))
+
+
 def identity_serializer(_: argparse.Namespace, result: Dict) -> Dict:
     return result
 
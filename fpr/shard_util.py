@@ -0,0 +1,47 @@
+import argparse
+import hashlib
+import logging
+from typing import Any, AsyncGenerator, AsyncIterable, Callable, Tuple, TypeVar
+
+from fpr.serialize_util import canonical_json
+
+log = logging.getLogger("fpr.shard_util")
+
+T = TypeVar("T")
+
+
+def parse_shard(arg: str) -> Tuple[int, int]:
+    "Returns the (index, count) for a zero-based shard arg e.g. '0/4' -> (0, 4)"
+    try:
+        index, count = (int(part) for part in arg.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"shard {arg!r} is not INDEX/COUNT e.g. 0/4")
+    if not (count > 0 and 0 <= index < count):
+        raise argparse.ArgumentTypeError(
+            f"shard {arg!r} index must be between 0 and {count - 1}"
+        )
+    return index, count
+
+
+def default_shard_key(item: Any) -> Any:
+    "Shards input items by their entire value"
+    return item
+
+
+def shard_index(key: Any, count: int) -> int:
+    "Returns the shard for a JSON serializable key that is stable across processes"
+    digest = hashlib.sha256(canonical_json(key).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count
+
+
+async def filter_shard(
+    items: AsyncIterable[T], shard_key: Callable[[T], Any], index: int, count: int
+) -> AsyncGenerator[T, None]:
+    "Yields items with a shard_key in shard index of count shards"
+    kept, total = 0, 0
+    async for item in items:
+        total += 1
+        if shard_index(shard_key(item), count) == index:
+            kept += 1
+            yield item
+    log.info(f"kept {kept} of {total} input items in shard {index}/{count}")
@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+
+import context
+
+
+async def collect(aiterable):
+    "Returns a list of the items of an async iterable"
+    return [item async for item in aiterable]
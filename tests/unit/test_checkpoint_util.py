@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import asyncio
+import importlib
+import io
+import pathlib
+
+import pytest
+
+import context
+from helpers import collect
+
+import fpr.checkpoint_util as m
+from fpr.metrics_util import MetricsRegistry
+from fpr.rx_util import aiter_items, JSONLinesWriter, map_concurrently
+
+
+def write_outputs(args, outputs):
+    "Marks outputs written like run_pipeline.write_row with unbuffered writers"
+    journal = getattr(args, "checkpoint_journal", None)
+    for output in outputs:
+        flushed = journal and journal.written(output)
+        if flushed is not None:
+            flushed()
+
+
+def run_items(args, items, fail_on=None, write=True):
+    calls = []
+
+    async def fn(item):
+        calls.append(item)
+        yield {"item": item, "path": pathlib.Path("a") / str(item)}
+        if item == fail_on:
+            raise Exception("task failed")
+        yield {"item": item, "done": True}
+
+    run_item = m.checkpointed(args, "test", lambda item: {"id": item}, fn)
+
+    async def run():
+        return [output for item in items for output in await collect(run_item(item))]
+
+    outputs = asyncio.run(run())
+    if write:
+        write_outputs(args, outputs)
+    return outputs, calls
+
+
+def test_checkpointed_without_journal_logs_errors():
+    outputs, calls = run_items(argparse.Namespace(), [1, 2], fail_on=1)
+    assert calls == [1, 2]
+    assert outputs == [
+        {"item": 1, "path": pathlib.Path("a/1")},
+        {"item": 2, "path": pathlib.Path("a/2")},
+        {"item": 2, "done": True},
+    ]
+
+
+@pytest.mark.parametrize("resume", m.RESUME_MODES)
+def test_checkpointed_resumes_finished_items(tmp_path, resume):
+    path = str(tmp_path / "checkpoint.jsonl")
+    journal = m.CheckpointJournal(path)
+    run_items(argparse.Namespace(checkpoint_journal=journal), [1, 2, 3], fail_on=2)
+    journal.close()
+    # simulate a crash while writing a record
+    with open(path, "ab") as f:
+        f.write(b'{"pipeline": "test", "key": "{\\"id\\":3')
+
+    journal = m.CheckpointJournal(path, resume=resume)
+    assert journal.is_finished("test", m.item_key({"id": 1}))
+    assert not journal.is_finished("test", m.item_key({"id": 2}))
+    outputs, calls = run_items(
+        argparse.Namespace(checkpoint_journal=journal), [1, 2, 3]
+    )
+    journal.close()
+
+    assert calls == [2]
+    replayed = [
+        {"item": 1, "path": "a/1"},
+        {"item": 1, "done": True},
+    ]
+    assert outputs == [
+        *(replayed if resume == "replay" else []),
+        {"item": 2, "path": pathlib.Path("a/2")},
+        {"item": 2, "done": True},
+        *(
+            [{"item": 3, "path": "a/3"}, {"item": 3, "done": True}]
+            if resume == "replay"
+            else []
+        ),
+    ]
+    assert m.CheckpointJournal(path).offsets.keys() == {
+        ("test", m.item_key({"id": i})) for i in [1, 2, 3]
+    }
+
+
+def test_checkpointed_does_not_record_dry_runs(tmp_path):
+    journal = m.CheckpointJournal(str(tmp_path / "checkpoint.jsonl"))
+    run_items(argparse.Namespace(checkpoint_journal=journal, dry_run=True), [1])
+    assert not journal.is_finished("test", m.item_key({"id": 1}))
+
+
+def test_checkpointed_records_items_after_their_outputs_are_written(tmp_path):
+    journal = m.CheckpointJournal(str(tmp_path / "checkpoint.jsonl"))
+    args = argparse.Namespace(checkpoint_journal=journal)
+    outputs, _ = run_items(args, [1, 2], write=False)
+    assert not journal.is_finished("test", m.item_key({"id": 1}))
+
+    write_outputs(args, outputs[:3])
+    assert journal.is_finished("test", m.item_key({"id": 1}))
+    assert not journal.is_finished("test", m.item_key({"id": 2}))
+    write_outputs(args, outputs[3:])
+    assert journal.is_finished("test", m.item_key({"id": 2}))
+    assert not journal.pending
+
+
+@pytest.mark.parametrize("concurrency", [1, 2])
+def test_checkpointed_records_items_written_by_write_row(
+    tmp_path, monkeypatch, concurrency
+):
+    # run_pipeline logs to fpr-debug.log in the working dir
+    monkeypatch.chdir(tmp_path)
+    run_pipeline = importlib.import_module("fpr.run_pipeline")
+
+    journal = m.CheckpointJournal(str(tmp_path / "checkpoint.jsonl"))
+    args = argparse.Namespace(
+        checkpoint_journal=journal, pipeline_name="test", save_to_tmpfile=False
+    )
+    pipeline = argparse.Namespace(serializer=lambda args, row: row)
+    writers = [JSONLinesWriter(io.BytesIO(), flush_interval=60) for _ in range(2)]
+
+    async def fn(item):
+        for i in range(3):
+            yield {"item": item, "i": i}
+
+    async def run():
+        async for row in map_concurrently(
+            m.checkpointed(args, "test", lambda item: {"id": item}, fn),
+            aiter_items([1, 2]),
+            concurrency=concurrency,
+        ):
+            run_pipeline.write_row(pipeline, args, row, writers, MetricsRegistry())
+
+    asyncio.run(run())
+    keys = [m.item_key({"id": item}) for item in [1, 2]]
+    # recorded only after the writers flush
+    assert not any(journal.is_finished("test", key) for key in keys)
+    for writer in writers:
+        writer.close()
+    assert all(journal.is_finished("test", key) for key in keys)
+    assert not journal.pending
+    journal.close()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import gzip
+import io
+
+import pytest
+
+import context
+
+import fpr.compression_util as m
+
+
+lines = ['{"a": 1}\n', '{"b": "é"}\n']
+
+
+@pytest.mark.parametrize(
+    "ext,compression,package",
+    [
+        (".jsonl", None, None),
+        (".jsonl.gz", "gzip", None),
+        (".jsonl.zst", "zstd", "zstandard"),
+        (".jsonl.lz4", "lz4", "lz4.frame"),
+    ],
+)
+def test_compressed_file_type_round_trips(tmp_path, ext, compression, package):
+    if package:
+        pytest.importorskip(package)
+    path = str(tmp_path / f"out{ext}")
+
+    outfile = m.CompressedFileType("w", encoding="UTF-8")(path)
+    outfile.writelines(lines[:1])
+    outfile.close()
+    appendfile = m.CompressedFileType("a", encoding="UTF-8")(path)
+    appendfile.writelines(lines[1:])
+    appendfile.close()
+
+    with open(path, "rb") as f:
+        assert m.compression_from_magic_bytes(f.read(4)) == compression
+
+    infile = m.CompressedFileType("r", encoding="UTF-8")(path)
+    assert list(infile) == lines
+    infile.close()
+
+
+def test_compressed_file_type_detects_compression_from_magic_bytes(tmp_path):
+    path = tmp_path / "misnamed.jsonl"
+    path.write_bytes(gzip.compress("".join(lines).encode("utf-8")))
+
+    infile = m.CompressedFileType("r", encoding="UTF-8")(str(path))
+    assert list(infile) == lines
+    infile.close()
+
+
+@pytest.mark.parametrize("compress", [gzip.compress, lambda data: data])
+def test_open_stdin_decompresses_compressed_stdin(monkeypatch, compress):
+    data = compress("".join(lines).encode("utf-8"))
+    stdin = io.TextIOWrapper(io.BufferedReader(io.BytesIO(data)), encoding="UTF-8")
+    monkeypatch.setattr(m.sys, "stdin", stdin)
+    assert list(m.open_stdin()) == lines
+
+
+def test_compressed_file_type_errors_for_missing_packages(tmp_path, monkeypatch):
+    monkeypatch.setattr(m, "zstandard", None)
+    with pytest.raises(argparse.ArgumentTypeError, match="requires the zstandard"):
+        m.CompressedFileType("w")(str(tmp_path / "out.jsonl.zst"))
+    with pytest.raises(ImportError, match="pip install zstandard"):
+        m.open_compressed(str(tmp_path / "out.jsonl.zst"), "w")
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+import context
+
+import fpr.disk_cache_util as m
+
+
+def test_cache_key_is_stable_for_equal_keys():
+    assert m.cache_key(dict(a=1, b=[1, 2])) == m.cache_key(dict(b=[1, 2], a=1))
+    assert m.cache_key(dict(a=1)) != m.cache_key(dict(a=2))
+
+
+def test_disk_cache_persists_values(tmp_path):
+    path = str(tmp_path / "cache" / "results.sqlite3")
+    cache = m.DiskCache(path)
+    assert cache.get(["repo", "sha"]) is None
+    cache.set(["repo", "sha"], [dict(exit_code=0, stdout="ok")])
+    cache.close()
+
+    cache = m.DiskCache(path)
+    assert cache.get(["repo", "sha"]) == [dict(exit_code=0, stdout="ok")]
+    assert (cache.hits, cache.misses) == (1, 0)
+    cache.close()
+
+
+def test_disk_cache_expires_old_entries(tmp_path, monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(m.time, "time", lambda: now)
+    cache = m.DiskCache(str(tmp_path / "results.sqlite3"), max_age=60)
+    cache.set("old", 1)
+    now += 30
+    cache.set("new", 2)
+    assert cache.get("old") == 1
+
+    now += 31
+    assert cache.get("old") is None
+    assert cache.get("new") == 2
+    cache.close()
+
+
+def test_disk_cache_evicts_least_recently_used_entries(tmp_path, monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(m.time, "time", lambda: now)
+    value = "x" * 100
+    cache = m.DiskCache(str(tmp_path / "results.sqlite3"), max_size=350)
+    for key in ["a", "b", "c"]:
+        cache.set(key, value)
+        now += 1
+    assert cache.get("a") == value
+    now += 1
+
+    cache.set("d", value)
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in ["a", "c", "d"]] == [value] * 3
+    assert cache.size <= 350
+    cache.close()
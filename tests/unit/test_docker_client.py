@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+from aiohttp import web
+import pytest
+
+import context
+
+from fpr.metrics_util import MetricsRegistry
+import fpr.docker.client as m
+
+
+@pytest.mark.parametrize(
+    "path, endpoint",
+    [
+        ("/version", "version"),
+        ("/v1.40/containers/create", "containers/create"),
+        ("/v1.40/containers/3f4e5a/exec", "containers/{id}/exec"),
+        ("/v1.40/exec/3f4e5a/start", "exec/{id}/start"),
+        ("/v1.40/exec/3f4e5a", "exec/{id}"),
+        ("/v1.40/volumes/fpr-org_foo-repo_bar", "volumes/{id}"),
+        ("/v1.40/events", "events"),
+    ],
+)
+def test_api_endpoint(path, endpoint):
+    assert m.api_endpoint(path) == endpoint
+
+
+def test_shared_client_reuses_connections_and_counts_calls(tmp_path, monkeypatch):
+    socket_path = str(tmp_path / "docker.sock")
+    monkeypatch.setenv("DOCKER_HOST", f"unix://{socket_path}")
+
+    async def version(request):
+        return web.json_response(dict(ApiVersion="1.40"))
+
+    async def list_containers(request):
+        return web.json_response([])
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/version", version)
+        app.router.add_get("/v1.40/containers/json", list_containers)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.UnixSite(runner, socket_path).start()
+
+        manager, metrics = m.DockerClientManager(), MetricsRegistry()
+        manager.configure(2, metrics)
+        try:
+            clients = []
+            for _ in range(3):
+                client = manager.get()
+                clients.append(client)
+                await client.containers.list()
+            connection_limit = manager.session.connector.limit
+            await manager.close()
+        finally:
+            await runner.cleanup()
+        return clients, connection_limit, manager, metrics
+
+    clients, connection_limit, manager, metrics = asyncio.run(run())
+    assert clients[0] is clients[1] is clients[2]
+    assert connection_limit == 2
+    assert manager.calls == {("GET", "version"): 1, ("GET", "containers/json"): 3}
+    assert metrics.counters["fpr_docker_api_calls_total"] == {
+        (("endpoint", "version"), ("method", "GET")): 1.0,
+        (("endpoint", "containers/json"), ("method", "GET")): 3.0,
+    }
+    assert manager.client is None
+
+
+def test_streaming_client_does_not_share_the_connection_limit(tmp_path, monkeypatch):
+    monkeypatch.setenv("DOCKER_HOST", f"unix://{tmp_path / 'docker.sock'}")
+
+    async def run():
+        m.shared_client.configure(1)
+        try:
+            shared, streaming = m.shared_client.get(), m.streaming_client.get()
+            return (
+                shared is not streaming,
+                m.shared_client.session.connector.limit,
+                m.streaming_client.session.connector.limit,
+            )
+        finally:
+            await m.shared_client.close()
+            await m.streaming_client.close()
+            m.shared_client.configure(m.DEFAULT_CONNECTION_LIMIT)
+
+    # 0 is no limit for aiohttp connectors
+    assert asyncio.run(run()) == (True, 1, 0)
@@ -0,0 +1,424 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import contextlib
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+
+import pytest
+
+import context
+
+import fpr.docker.containers as m
+from fpr.models.language import package_managers
+
+
+class FakeContent:
+    def __init__(self, raw):
+        self.raw = raw
+
+    async def iter_chunked(self, chunk_size):
+        for start in range(0, len(self.raw), chunk_size):
+            yield self.raw[start : start + chunk_size]
+
+    async def __aiter__(self):
+        for line in self.raw.splitlines(keepends=True):
+            yield line
+
+
+class FakeResponse:
+    def __init__(self, raw):
+        self.content = FakeContent(raw)
+
+
+class FakeDocker:
+    def __init__(self, raw, events=b"", inspects=None):
+        self.raw = raw
+        self.events = events
+        self.inspects = inspects or [dict(Running=False, ExitCode=0)]
+        self.queries = []
+
+    @contextlib.asynccontextmanager
+    async def _query(self, path, **kwargs):
+        self.queries.append(path)
+        yield FakeResponse(self.events if path == "events" else self.raw)
+
+    async def _query_json(self, path, **kwargs):
+        self.queries.append(path)
+        return self.inspects.pop(0)
+
+
+class FakeContainer(dict):
+    def __init__(self, raw, **kwargs):
+        super().__init__(Name="/fake", Id="fake-id")
+        self._id = "fake-id"
+        self._container = dict(self)
+        self.docker = FakeDocker(raw, **kwargs)
+
+    async def exec_create(self, **kwargs):
+        return await m.Exec.create(self, **kwargs)
+
+
+def start_streaming(raw, **kwargs):
+    exec_ = m.Exec("exec-id", FakeContainer(raw))
+    asyncio.run(exec_.start_streaming(**kwargs))
+    return exec_
+
+
+def test_exec_start_streaming_demultiplexes_to_spool_files():
+    exec_ = start_streaming(
+        b"\x01\x00\x00\x00\x00\x00\x00\x06hello\n"
+        b"\x02\x00\x00\x00\x00\x00\x00\x06world\n"
+        b"\x01\x00\x00\x00\x00\x00\x00\x03foo",
+        chunk_size=5,
+        spool_max_size=4,
+    )
+    stdout, stderr = [
+        list(line_iter)
+        for line_iter in exec_.decoded_start_result_stdout_and_stderr_line_iters
+    ]
+    assert stdout == ["hello", "foo"]
+    assert stderr == ["world"]
+    assert exec_.decoded_start_result_stdout == ["hello", "foo"]
+    assert exec_.decoded_start_result_stdout_and_stderr == ("hello\nfoo", "world")
+    assert exec_.start_result is None
+    exec_.close()
+
+
+def test_exec_start_streaming_writes_tty_output_to_stdout():
+    exec_ = start_streaming(b"hello\nworld", Tty=True, chunk_size=3)
+    assert exec_.decoded_start_result_stdout == ["hello", "world"]
+
+
+def test_iter_spool_chunks():
+    exec_ = start_streaming(b"hello world", Tty=True)
+    assert list(m.iter_spool_chunks(exec_.stdout, 4)) == [b"hell", b"o wo", b"rld"]
+
+
+def patch_streaming_client(monkeypatch, events=b""):
+    streaming_docker = FakeDocker(b"", events=events)
+
+    @contextlib.asynccontextmanager
+    async def fake_aiodocker_streaming_client():
+        yield streaming_docker
+
+    monkeypatch.setattr(
+        m, "aiodocker_streaming_client", fake_aiodocker_streaming_client
+    )
+    return streaming_docker
+
+
+def test_exec_wait_returns_without_events_when_exited(monkeypatch):
+    streaming_docker = patch_streaming_client(monkeypatch)
+    exec_ = m.Exec("exec-id", FakeContainer(b""))
+    assert asyncio.run(exec_.wait()) == dict(Running=False, ExitCode=0)
+    # events stream on the streaming client and inspects on the shared one
+    assert streaming_docker.queries == ["events"]
+    assert exec_.container.docker.queries == ["exec/exec-id/json"]
+
+
+def test_exec_wait_waits_for_exec_die_event(monkeypatch):
+    patch_streaming_client(
+        monkeypatch,
+        events=b'{"Action": "exec_die", "Actor": {"Attributes": {"execID": "other"}}}\n'
+        b"\n"
+        b'{"Action": "exec_die", "Actor": {"Attributes": {"execID": "exec-id"}}}\n',
+    )
+    container = FakeContainer(
+        b"", inspects=[dict(Running=True), dict(Running=False, ExitCode=2)],
+    )
+    exec_ = m.Exec("exec-id", container)
+    assert asyncio.run(exec_.wait()) == dict(Running=False, ExitCode=2)
+
+
+def test_run_inspects_once_after_attached_output_ends():
+    container = FakeContainer(
+        b"\x01\x00\x00\x00\x00\x00\x00\x06hello\n",
+        inspects=[dict(Id="exec-id"), dict(Running=False, ExitCode=0)],
+    )
+    exec_ = asyncio.run(
+        m._run(container, "echo hello", working_dir="/", wait=True, check=True)
+    )
+    assert exec_.last_inspect == dict(Running=False, ExitCode=0)
+    assert exec_.decoded_start_result_stdout == ["hello"]
+    assert container.docker.queries == [
+        "containers/fake-id/exec",
+        "exec/exec-id/start",
+        "exec/exec-id/json",
+    ]
+
+
+def test_run_raises_for_non_zero_exit_code():
+    container = FakeContainer(
+        b"", inspects=[dict(Id="exec-id"), dict(Running=False, ExitCode=1)]
+    )
+    with pytest.raises(m.DockerRunException):
+        asyncio.run(m._run(container, "false", wait=True, check=True))
+
+
+def test_run_closes_output_spool_files_when_not_kept_or_failed(monkeypatch):
+    closed = []
+    monkeypatch.setattr(m.Exec, "close", lambda self: closed.append(self.exec_id))
+    container = FakeContainer(
+        b"",
+        inspects=[
+            dict(Id="exec-id"),
+            dict(Running=False, ExitCode=0),
+            dict(Id="failed-exec-id"),
+            dict(Running=False, ExitCode=1),
+        ],
+    )
+    asyncio.run(m._run(container, "true", keep_output=False))
+    with pytest.raises(m.DockerRunException):
+        asyncio.run(m._run(container, "false"))
+    assert closed == ["exec-id", "failed-exec-id"]
+
+
+class LocalContainer:
+    "Runs container commands with subprocess on the host"
+
+    async def run(self, cmd, working_dir=None, check=True, **kwargs):
+        proc = subprocess.run(
+            cmd if isinstance(cmd, list) else cmd.split(" "),
+            cwd=working_dir,
+            check=check,
+            capture_output=True,
+        )
+        exec_ = m.Exec("exec-id", self)
+        exec_.stdout, exec_.stderr = tempfile.TemporaryFile(), tempfile.TemporaryFile()
+        exec_.stdout.write(proc.stdout)
+        exec_.stderr.write(proc.stderr)
+        return exec_
+
+
+@pytest.fixture
+def git_repo(tmp_path):
+    def git(*args):
+        subprocess.run(
+            ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+            cwd=tmp_path,
+            check=True,
+            capture_output=True,
+        )
+
+    git("init", "--quiet")
+    (tmp_path / "package.json").write_bytes(b"{}\n")
+    (tmp_path / "sub dir").mkdir()
+    (tmp_path / "sub dir" / "package.json").write_bytes(b'{"name": "sub"}\n')
+    git("add", ".")
+    git("commit", "--quiet", "-m", "first")
+    git("tag", "-a", "-m", "v1", "v1")
+    (tmp_path / "package.json").write_bytes(b'{"version": 2}\n')
+    git("commit", "--quiet", "-am", "second")
+    git("tag", "v2")
+    git("tag", "v2-alias")
+    return tmp_path
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="requires git")
+def test_git_ref_helpers_read_trees_without_checkouts(git_repo):
+    c, working_dir = LocalContainer(), str(git_repo)
+
+    async def run():
+        ref_names = ["refs/tags/v1", "refs/tags/v2"]
+        commits = await m.get_ref_commits(c, ref_names, working_dir=working_dir)
+        tags_by_commit = await m.get_tags_by_commit(c, working_dir=working_dir)
+        blobs = list(await m.ls_tree_blobs(c, ref_names, working_dir=working_dir))
+        sha256s = await m.blob_sha256s(
+            c, [blob for (_, _, blob) in blobs], working_dir=working_dir
+        )
+        return commits, tags_by_commit, blobs, sha256s
+
+    commits, tags_by_commit, blobs, sha256s = asyncio.run(run())
+    assert [tags_by_commit[commit] for commit in commits] == [
+        ["v1"],
+        ["v2", "v2-alias"],
+    ]
+    assert [(ref, path) for (ref, path, _) in blobs] == [
+        ("refs/tags/v1", "package.json"),
+        ("refs/tags/v1", "sub dir/package.json"),
+        ("refs/tags/v2", "package.json"),
+        ("refs/tags/v2", "sub dir/package.json"),
+    ]
+    assert [sha256s[blob] for (_, _, blob) in blobs] == [
+        hashlib.sha256(content).hexdigest()
+        for content in [
+            b"{}\n",
+            b'{"name": "sub"}\n',
+            b'{"version": 2}\n',
+            b'{"name": "sub"}\n',
+        ]
+    ]
+
+
+def test_iter_cat_file_batch_sha256s_skips_missing_objects():
+    spool = tempfile.TemporaryFile()
+    spool.write(b"aaa blob 3\nabc\nbbb missing\nccc blob 0\n\n")
+    assert list(m.iter_cat_file_batch_sha256s(spool, chunk_size=2)) == [
+        ("aaa", hashlib.sha256(b"abc").hexdigest()),
+        ("ccc", hashlib.sha256(b"").hexdigest()),
+    ]
+
+
+def test_iter_spool_records():
+    spool = tempfile.TemporaryFile()
+    spool.write(b"a\0bc\0\0d")
+    assert list(m.iter_spool_records(spool, chunk_size=2)) == [b"a", b"bc", b"", b"d"]
+
+
+class CountingLocalContainer(LocalContainer, dict):
+    def __init__(self, image_id):
+        super().__init__(Image=image_id)
+        self.cmds = []
+
+    async def run(self, cmd, **kwargs):
+        self.cmds.append(cmd)
+        return await super().run(cmd, **kwargs)
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="requires git")
+def test_probe_ref_info_and_versions_in_one_exec(git_repo):
+    subprocess.run(["git", "checkout", "--quiet", "v2"], cwd=git_repo, check=True)
+    version_commands = {
+        "git": "git --version",
+        "echo": 'echo "quoted  arg"',
+        "missing": "false",
+    }
+
+    async def run(c):
+        return await m.probe_ref_info_and_versions(
+            c, version_commands, working_dir=str(git_repo)
+        )
+
+    c = CountingLocalContainer("sha256:image-1")
+    ref_info, versions = asyncio.run(run(c))
+    assert len(c.cmds) == 1
+    assert ref_info == dict(
+        branch="HEAD",
+        commit=subprocess.run(
+            ["git", "rev-parse", "v2"], cwd=git_repo, capture_output=True, text=True
+        ).stdout.strip(),
+        tag="v2",
+    )
+    assert versions["git"].startswith("git version ")
+    assert versions["echo"] == '"quoted  arg"'
+    assert versions["missing"] is None
+
+    # versions are memoized by image ID
+    c = CountingLocalContainer("sha256:image-1")
+    assert asyncio.run(run(c))[1] == versions
+    assert "git --version" not in c.cmds[0][-1]
+
+
+def test_cache_entries_to_prune_deletes_least_recently_used_first():
+    records = [
+        b"100.0\t100.0\t10\t/cache/old",
+        b"50.0\t300.0\t10\t/cache/modified",
+        b"200.0\t100.0\t10\t/cache/read",
+        b"150.0\t150.0\t5\t/cache/with\ttab",
+    ]
+    assert m.cache_entries_to_prune(records, 34, "/cache") == ([["/cache/old"]], 35)
+    assert m.cache_entries_to_prune(records, 19, "/cache") == (
+        [["/cache/old"], ["/cache/with\ttab"], ["/cache/read"]],
+        35,
+    )
+    assert m.cache_entries_to_prune(records, 100, "/cache") == ([], 35)
+
+
+def test_cache_entries_to_prune_groups_files_into_entries():
+    (cache,) = [
+        cache
+        for cache in package_managers["cargo"].caches
+        if cache.volume_name == "fpr-cache-cargo-registry"
+    ]
+    records = [
+        b"100.0\t100.0\t10\t/usr/local/cargo/registry/cache/reg/old-1.0.crate",
+        b"400.0\t100.0\t1\t/usr/local/cargo/registry/src/reg/old-1.0/.cargo-ok",
+        b"100.0\t100.0\t20\t/usr/local/cargo/registry/src/reg/old-1.0/src/lib.rs",
+        b"200.0\t200.0\t10\t/usr/local/cargo/registry/cache/reg/new-1.0.crate",
+        b"300.0\t300.0\t30\t/usr/local/cargo/registry/index/reg/.git/objects/pack",
+        b"50.0\t50.0\t5\t/usr/local/cargo/registry/index/reg/.git/HEAD",
+    ]
+    # old-1.0 was last used at 400 by its .cargo-ok file
+    assert m.cache_entries_to_prune(
+        records, 50, cache.mount_point, cache.prune_entry_patterns
+    ) == (
+        [
+            ["/usr/local/cargo/registry/cache/reg/new-1.0.crate"],
+            ["/usr/local/cargo/registry/index/reg"],
+        ],
+        76,
+    )
+    assert m.cache_entries_to_prune(
+        records, 0, cache.mount_point, cache.prune_entry_patterns
+    )[0][-1] == [
+        "/usr/local/cargo/registry/cache/reg/old-1.0.crate",
+        "/usr/local/cargo/registry/src/reg/old-1.0",
+    ]
+
+
+@pytest.mark.skipif(shutil.which("find") is None, reason="requires find")
+def test_prune_cache(tmp_path):
+    for i, name in enumerate(["a", "b", "c"]):
+        path = tmp_path / name
+        path.write_bytes(b"x" * 10)
+        os.utime(path, (1000 + i, 1000 + i))
+
+    assert asyncio.run(m.prune_cache(LocalContainer(), str(tmp_path), 15)) == 2
+    assert [path.name for path in tmp_path.iterdir()] == ["c"]
+
+
+@pytest.mark.skipif(shutil.which("find") is None, reason="requires find")
+def test_prune_cache_deletes_entries_whole(tmp_path):
+    # yarn package dirs with a recently used metadata file
+    for i, name in enumerate(["npm-a-1.0.0", "npm-b-1.0.0"]):
+        package_dir = tmp_path / "v6" / name / "node_modules" / name
+        package_dir.mkdir(parents=True)
+        (package_dir / "index.js").write_bytes(b"x" * 10)
+        os.utime(package_dir / "index.js", (1000 + i, 1000 + i))
+        metadata = tmp_path / "v6" / name / ".yarn-metadata.json"
+        metadata.write_bytes(b"{}")
+        os.utime(metadata, (3000 - i, 3000 - i))
+
+    assert (
+        asyncio.run(
+            m.prune_cache(LocalContainer(), str(tmp_path), 12, [r"v\d+/[^/]+(?=/)"])
+        )
+        == 1
+    )
+    assert [path.name for path in (tmp_path / "v6").iterdir()] == ["npm-a-1.0.0"]
+    assert (tmp_path / "v6" / "npm-a-1.0.0" / ".yarn-metadata.json").exists()
+    assert (
+        tmp_path / "v6" / "npm-a-1.0.0" / "node_modules" / "npm-a-1.0.0" / "index.js"
+    ).exists()
+
+
+def test_container_log_path():
+    assert m.container_log_path(None, "dep-obs-foo") is None
+    assert str(m.container_log_path("/tmp/logs", "dep-obs-foo")) == (
+        "/tmp/logs/dep-obs-foo.log"
+    )
+
+
+def test_follow_logs_appends_streamed_logs(tmp_path):
+    class LoggingContainer:
+        def __init__(self):
+            self.log_calls = []
+
+        async def _log_stream(self):
+            for piece in ["hello\n", "wörld\n"]:
+                yield piece
+
+        def log(self, **kwargs):
+            self.log_calls.append(kwargs)
+            return self._log_stream()
+
+    container = LoggingContainer()
+    log_path = tmp_path / "logs" / "dep-obs-foo.log"
+    asyncio.run(m.follow_logs(container, log_path))
+    asyncio.run(m.follow_logs(container, log_path))
+    assert log_path.read_text(encoding="utf-8") == "hello\nwörld\n" * 2
+    assert container.log_calls == [dict(stdout=True, stderr=True, follow=True)] * 2
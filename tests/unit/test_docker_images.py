@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import contextlib
+import io
+import tarfile
+
+import aiodocker
+import pytest
+
+import context
+
+import fpr.docker.containers as containers
+import fpr.docker.images as m
+from fpr.models.docker_image import DockerImage, DockerImageName
+
+
+class FakeImages:
+    def __init__(self, existing):
+        self.existing = existing
+        self.pulls = []
+        self.builds = []
+
+    async def inspect(self, name):
+        await asyncio.sleep(0)
+        if name not in self.existing:
+            raise aiodocker.exceptions.DockerError(404, dict(message="not found"))
+        return self.existing[name]
+
+    async def pull(self, name):
+        await asyncio.sleep(0)
+        self.pulls.append(name)
+        self.existing[name] = dict(Id=f"sha256:pulled-{name}")
+
+    async def build(self, fileobj, tag, labels, **kwargs):
+        with tarfile.open(fileobj=fileobj, mode="r:gz") as t:
+            dockerfile = t.extractfile("Dockerfile").read()
+        self.builds.append((tag, dockerfile))
+        self.existing[tag] = dict(Id=f"sha256:built-{tag}", Config=dict(Labels=labels))
+        yield dict(stream="sha256:built\n")
+
+
+class FakeDocker:
+    def __init__(self, existing):
+        self.images = FakeImages(existing)
+
+
+@pytest.fixture
+def docker(monkeypatch):
+    docker = FakeDocker({"debian:buster-slim": dict(Id="sha256:base")})
+
+    @contextlib.asynccontextmanager
+    async def fake_client():
+        yield docker
+
+    monkeypatch.setattr(m, "aiodocker_client", fake_client)
+    monkeypatch.setattr(containers, "aiodocker_client", fake_client)
+    monkeypatch.setattr(m, "base_image_pulls", {})
+    return docker
+
+
+def image(local_name, template="FROM {base.repo_name}:{base.tag}\n"):
+    return DockerImage(
+        base=DockerImageName(repo=None, name="debian", tag="buster-slim"),
+        local=DockerImageName(repo="dep-obs", name=local_name),
+        dockerfile_template=template,
+    )
+
+
+def test_dockerfile_tgz_is_in_memory_build_context():
+    with tarfile.open(fileobj=containers.dockerfile_tgz(b"FROM scratch\n")) as t:
+        assert t.getnames() == ["Dockerfile"]
+        assert t.extractfile("Dockerfile").read() == b"FROM scratch\n"
+
+
+def test_build_hash_depends_on_dockerfile_and_base_image():
+    assert m.build_hash(b"FROM a", "sha256:1") == m.build_hash(b"FROM a", "sha256:1")
+    assert m.build_hash(b"FROM a", "sha256:1") != m.build_hash(b"FROM b", "sha256:1")
+    assert m.build_hash(b"FROM a", "sha256:1") != m.build_hash(b"FROM a", "sha256:2")
+
+
+def test_build_images_skips_up_to_date_images(docker):
+    images = [image("a"), image("b")]
+    assert asyncio.run(m.build_images(False, images)) == [
+        "dep-obs/a:latest",
+        "dep-obs/b:latest",
+    ]
+    assert [tag for tag, _ in docker.images.builds] == [
+        "dep-obs/a:latest",
+        "dep-obs/b:latest",
+    ]
+    assert docker.images.pulls == []
+
+    # rebuilds only the image with a changed dockerfile
+    images[1] = image("b", "FROM {base.repo_name}:{base.tag}\nRUN true\n")
+    asyncio.run(m.build_images(False, images))
+    assert [tag for tag, _ in docker.images.builds] == [
+        "dep-obs/a:latest",
+        "dep-obs/b:latest",
+        "dep-obs/b:latest",
+    ]
+    assert docker.images.builds[-1][1] == b"FROM debian:buster-slim\nRUN true\n"
+
+    # and all images when the base image changes
+    docker.images.existing["debian:buster-slim"] = dict(Id="sha256:newbase")
+    asyncio.run(m.build_images(False, images))
+    assert len(docker.images.builds) == 5
+
+
+def test_build_images_pulls_each_base_image_once(docker):
+    images = [image("a"), image("b"), image("c")]
+    asyncio.run(m.build_images(True, images))
+    assert docker.images.pulls == ["debian:buster-slim"]
+    assert len(docker.images.builds) == 3
@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 
 import math
+import os
 import pathlib
+import struct
+import time
 
 import pytest
 
@@ -174,3 +177,148 @@ def test_messages_defaults_to_returning_stdout():
         ]
     )
     assert len(tuple(m.iter_lines(msgs))) == 1
+
+
+@pytest.mark.parametrize(
+    "chunks, lines",
+    [
+        ([b"a\nb", b"c\n", b"\nd"], ["a", "bc", "", "d"]),
+        ([b"a\n"], ["a"]),
+        ([b""], []),
+        # multibyte characters split across chunks
+        ([b"\xe2", b"\x82", b"\xac\n"], ["€"]),
+        (["ü\n€".encode("utf-8")[:1], "ü\n€".encode("utf-8")[1:]], ["ü", "€"]),
+    ],
+)
+def test_iter_newlines(chunks, lines):
+    assert list(m.iter_newlines(chunks)) == lines
+    assert list(m.iter_newlines([memoryview(chunk) for chunk in chunks])) == lines
+    assert m.join_lines(chunks) == "\n".join(lines)
+
+
+def test_iter_newlines_partial_character_at_end():
+    with pytest.raises(UnicodeDecodeError):
+        list(m.iter_newlines([b"a\n\xe2\x82"]))
+
+
+def test_join_lines_strips_one_trailing_newline():
+    assert m.join_lines([b"a\n", b"\n"]) == "\n".join(m.iter_newlines([b"a\n\n"]))
+    assert m.join_lines([b"\xe2\x82", b"\xac"]) == "€"
+
+
+@pytest.mark.parametrize(
+    "policy, lines",
+    [
+        (m.LongLinePolicy.SPLIT, ["abc", "def", "g", "€", "abc", "x"]),
+        (m.LongLinePolicy.TRUNCATE, ["abc", "€", "abc", "x"]),
+    ],
+)
+def test_iter_newlines_max_line_length(policy, lines):
+    chunks = [b"ab", b"cdefg\n\xe2\x82", b"\xac\nabc\nx"]
+    assert list(m.iter_newlines(chunks, 3, policy)) == lines
+
+
+def test_iter_newlines_max_line_length_error():
+    with pytest.raises(m.DockerLogReadError):
+        list(m.iter_newlines([b"abc\nabcd"], 3, m.LongLinePolicy.ERROR))
+
+
+def test_iter_newlines_long_line_is_linear():
+    chunks = [b"x" * 1024] * 16 * 1024
+    start = time.perf_counter()
+    (line,) = m.iter_newlines(chunks)
+    assert len(line) == 16 * 1024 * 1024
+    assert time.perf_counter() - start < 10
+
+
+def feed_chunks(parser, raw, chunk_size):
+    msgs = []
+    for start in range(0, len(raw), chunk_size):
+        parser.feed(raw[start : start + chunk_size])
+        msgs.extend((stream, bytes(msg)) for stream, msg in parser.frames())
+    return msgs
+
+
+def test_message_parser_matches_iter_messages_for_any_chunk_size(
+    long_cargo_metadata_output,
+):
+    expected = list(m.iter_messages(long_cargo_metadata_output))
+    for chunk_size in [1, 7, m.HEADER_LENGTH, 4096, len(long_cargo_metadata_output)]:
+        parser = m.MessageParser()
+        msgs = feed_chunks(parser, long_cargo_metadata_output, chunk_size)
+        parser.close()
+        assert msgs == expected
+
+
+def test_message_parser_only_buffers_partial_message():
+    parser = m.MessageParser()
+    parser.feed(b"\x01\x00\x00\x00\x00\x00\x00\x06hello\n\x02\x00")
+    assert list(parser.frames()) == [(m.DockerLogStream.STDOUT, b"hello\n")]
+    assert bytes(parser.buf) == b"\x02\x00"
+    with pytest.raises(m.DockerLogReadError):
+        parser.close()
+
+
+def test_message_parser_frames_are_views_of_the_chunk():
+    chunk = b"\x01\x00\x00\x00\x00\x00\x00\x06hello\n\x02\x00\x00\x00\x00\x00\x00\x01!"
+    parser = m.MessageParser()
+    parser.feed(chunk)
+    frames = list(parser.frames())
+    assert frames == [
+        (m.DockerLogStream.STDOUT, b"hello\n"),
+        (m.DockerLogStream.STDERR, b"!"),
+    ]
+    assert all(msg.obj is chunk for _, msg in frames)
+    parser.close()
+
+
+def test_message_parser_keeps_undrained_frames_between_feeds():
+    parser = m.MessageParser()
+    parser.feed(b"\x01\x00\x00\x00\x00\x00\x00\x03foo\x02\x00\x00")
+    parser.feed(b"\x00\x00\x00\x00\x03bar")
+    assert list(parser.frames()) == [
+        (m.DockerLogStream.STDOUT, b"foo"),
+        (m.DockerLogStream.STDERR, b"bar"),
+    ]
+    parser.close()
+
+
+def test_message_parser_unrecognized_stream_byte():
+    parser = m.MessageParser()
+    parser.feed(b"\x03\x00\x00\x00\x00\x00\x00\x01\n")
+    with pytest.raises(m.DockerLogReadError):
+        list(parser.frames())
+
+
+@pytest.mark.benchmark
+@pytest.mark.skipif(
+    "FPR_BENCHMARK_MB" not in os.environ,
+    reason="set FPR_BENCHMARK_MB to the synthetic stream size to benchmark",
+)
+def test_benchmark_message_parser(capsys):
+    size = int(os.environ["FPR_BENCHMARK_MB"]) * 1024 * 1024
+    frame = (
+        struct.pack(m.LOG_HEADER_FORMAT, 1, 16 * 1024 - 1)
+        + b"x" * (16 * 1024 - 2)
+        + b"\n"
+    )
+    raw = frame * (size // len(frame))
+    # odd chunk size so most frames are split across chunks
+    chunk_size = 64 * 1024 - 3
+
+    parser = m.MessageParser()
+    start = time.perf_counter()
+    parsed = 0
+    for chunk_start in range(0, len(raw), chunk_size):
+        parser.feed(raw[chunk_start : chunk_start + chunk_size])
+        for _, msg in parser.frames():
+            parsed += len(msg)
+    parser.close()
+    elapsed = time.perf_counter() - start
+
+    assert parsed == len(raw) - len(raw) // len(frame) * m.HEADER_LENGTH
+    with capsys.disabled():
+        print(
+            f"\nparsed {len(raw) / 1024 / 1024:.0f}MiB in {elapsed:.2f}s "
+            f"({len(raw) / 1024 / 1024 / elapsed:.0f}MiB/s)"
+        )
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import contextlib
+
+import pytest
+
+import context
+
+from fpr.docker.containers import DockerRunException
+import fpr.docker.pool as m
+
+
+class FakeContainer(dict):
+    def __init__(self, name):
+        super().__init__(Name=name)
+        self._container = dict(self)
+        self.resets = 0
+
+
+class FakeDocker:
+    def __init__(self):
+        self.started = []
+        self.stopped = []
+
+    def start(self):
+        @contextlib.asynccontextmanager
+        async def run():
+            container = FakeContainer(f"/c{len(self.started)}")
+            self.started.append(container["Name"])
+            try:
+                yield container
+            finally:
+                self.stopped.append(container["Name"])
+
+        return run()
+
+
+async def reset(container):
+    container.resets += 1
+
+
+async def use(pool, docker, key, reset=reset):
+    async with pool.acquire(key, docker.start, reset=reset) as c:
+        return c
+
+
+def test_pool_reuses_and_resets_containers_for_key():
+    async def run():
+        docker, pool = FakeDocker(), m.ContainerPool(max_idle=4)
+        first = await use(pool, docker, "a")
+        second = await use(pool, docker, "a")
+        other = await use(pool, docker, "b")
+        await pool.close()
+        return docker, first, second, other
+
+    docker, first, second, other = asyncio.run(run())
+    assert first is second
+    assert first.resets == 1
+    assert other["Name"] == "/c1"
+    assert docker.started == ["/c0", "/c1"]
+    assert sorted(docker.stopped) == ["/c0", "/c1"]
+
+
+def test_pool_size_zero_stops_containers_after_use():
+    async def run():
+        docker, pool = FakeDocker(), m.ContainerPool(max_idle=0)
+        await use(pool, docker, "a")
+        await use(pool, docker, "a")
+        return docker
+
+    docker = asyncio.run(run())
+    assert docker.started == ["/c0", "/c1"]
+    assert docker.stopped == ["/c0", "/c1"]
+
+
+def test_pool_evicts_least_recently_used_and_idle_containers():
+    async def run():
+        docker, pool = FakeDocker(), m.ContainerPool(max_idle=1, idle_timeout=60.0)
+        await use(pool, docker, "a")
+        await use(pool, docker, "b")
+        stopped_over_max_idle = list(docker.stopped)
+
+        pool.idle_timeout = 0.0
+        await asyncio.sleep(0.01)
+        await use(pool, docker, "c")
+        return docker, stopped_over_max_idle, pool.idle_count
+
+    docker, stopped_over_max_idle, idle_count = asyncio.run(run())
+    assert stopped_over_max_idle == ["/c0"]
+    assert docker.stopped == ["/c0", "/c1", "/c2"]
+    assert idle_count == 0
+
+
+def test_pool_replaces_containers_that_fail_to_reset():
+    async def failing_reset(container):
+        raise Exception("reset failed")
+
+    async def run():
+        docker, pool = FakeDocker(), m.ContainerPool()
+        await use(pool, docker, "a")
+        await use(pool, docker, "a", reset=failing_reset)
+        await pool.close()
+        return docker
+
+    docker = asyncio.run(run())
+    assert docker.started == ["/c0", "/c1"]
+    assert docker.stopped == ["/c0", "/c1"]
+
+
+def test_pool_discards_containers_on_errors():
+    async def run():
+        docker, pool = FakeDocker(), m.ContainerPool()
+        async with pool.acquire("a", docker.start, reset=reset):
+            raise DockerRunException("command failed")
+        with pytest.raises(ValueError):
+            async with pool.acquire("a", docker.start, reset=reset):
+                raise ValueError()
+        return docker, pool.idle_count
+
+    docker, idle_count = asyncio.run(run())
+    assert docker.stopped == ["/c0", "/c1"]
+    assert idle_count == 0
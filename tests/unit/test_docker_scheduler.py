@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+import pytest
+
+import context
+
+from fpr.metrics_util import MetricsRegistry
+import fpr.docker.scheduler as m
+
+
+GiB = 1024 * 1024 * 1024
+
+
+async def run_jobs(scheduler, resources, n_jobs, fail=lambda i: False):
+    "Runs n_jobs jobs returning the max. number running at once"
+    running, max_running = 0, 0
+
+    async def job(i):
+        nonlocal running, max_running
+        async with scheduler.slot(resources) as slot:
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.001)
+            running -= 1
+            slot.failed = fail(i)
+
+    await asyncio.gather(*[job(i) for i in range(n_jobs)])
+    return max_running
+
+
+def test_job_resources_nano_cpus():
+    assert m.JobResources(cpus=1.5).nano_cpus == 1500000000
+    assert m.JobResources().nano_cpus is None
+
+
+def test_scheduler_admits_jobs_within_budget():
+    async def run():
+        scheduler = m.ContainerScheduler(
+            8, cpu_budget=4, memory_budget=3 * GiB, load_fn=lambda: 0.0
+        )
+        return (
+            await run_jobs(scheduler, m.JobResources(cpus=1, memory=GiB), 10),
+            await run_jobs(scheduler, m.JobResources(cpus=2, memory=GiB), 10),
+            scheduler,
+        )
+
+    memory_bound, cpu_bound, scheduler = asyncio.run(run())
+    assert memory_bound == 3
+    assert cpu_bound == 2
+    assert (scheduler.slots_used, scheduler.cpus_used, scheduler.memory_used) == (
+        0,
+        0,
+        0,
+    )
+
+
+def test_scheduler_runs_oversized_job_alone():
+    async def run():
+        scheduler = m.ContainerScheduler(4, cpu_budget=1, load_fn=lambda: 0.0)
+        return await run_jobs(scheduler, m.JobResources(cpus=2), 3)
+
+    assert asyncio.run(run()) == 1
+
+
+def test_scheduler_decreases_limit_once_per_burst_of_failures_and_recovers():
+    async def run():
+        scheduler = m.ContainerScheduler(8, load_fn=lambda: 0.0)
+        await run_jobs(scheduler, m.JobResources(), 8, fail=lambda i: True)
+        after_failures = scheduler.limit
+        await run_jobs(scheduler, m.JobResources(), 40)
+        return after_failures, scheduler.limit
+
+    after_failures, recovered = asyncio.run(run())
+    # all 8 jobs were admitted before the first decrease so only one applies
+    assert after_failures == 4
+    assert recovered == 8
+
+
+def test_scheduler_decreases_limit_on_high_load():
+    async def run():
+        scheduler = m.ContainerScheduler(4, load_fn=lambda: 2.0)
+        max_running = await run_jobs(scheduler, m.JobResources(), 20)
+        return max_running, scheduler.limit
+
+    max_running, limit = asyncio.run(run())
+    assert max_running == 4
+    assert limit == 1
+
+
+def test_scheduler_sets_metrics():
+    async def run():
+        metrics = MetricsRegistry()
+        scheduler = m.ContainerScheduler(2, load_fn=lambda: 0.0, metrics=metrics)
+        await run_jobs(scheduler, m.JobResources(cpus=1), 3, fail=lambda i: i == 0)
+        return metrics
+
+    metrics = asyncio.run(run())
+    assert metrics.gauges["fpr_scheduler_queue_depth"] == {(): 0}
+    assert metrics.gauges["fpr_scheduler_slots_used"] == {(): 0}
+    assert metrics.counters["fpr_scheduler_jobs_total"] == {
+        (("result", "failed"),): 1.0,
+        (("result", "ok"),): 2.0,
+    }
+
+
+def test_scheduler_counts_exceptions_as_failures():
+    async def run():
+        scheduler = m.ContainerScheduler(4, load_fn=lambda: 0.0)
+        with pytest.raises(ValueError):
+            async with scheduler.slot(m.JobResources()):
+                raise ValueError("job failed")
+        return scheduler
+
+    scheduler = asyncio.run(run())
+    assert scheduler.limit == 2
+    assert scheduler.slots_used == 0
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+import context
+
+from fpr.pipelines.find_dep_files import matches_globs
+
+
+@pytest.mark.parametrize(
+    "path, globs, expected",
+    [
+        ("package.json", ["package.json"], True),
+        ("packages/foo/Package.json", ["package.json"], True),
+        ("packages/foo/package.json.bak", ["package.json"], False),
+        ("foo/Cargo.lock", ["package.json", "Cargo.lock"], True),
+        (".github/package.json", ["package.json"], False),
+        ("foo/.hidden/package.json", ["package.json"], False),
+        ("packages/foo/package.json", ["packages/*/package.json"], True),
+        ("package.json", ["packages/*/package.json"], False),
+        ("packages/a/b/package.json", ["packages/*/package.json"], False),
+        ("packages/a/b/package.json", ["packages/**/package.json"], True),
+        ("packages/package.json", ["packages/**/package.json"], True),
+        ("Packages/A/package.JSON", ["packages/*/package.json"], True),
+    ],
+)
+def test_matches_globs(path, globs, expected):
+    assert matches_globs(path, globs) == expected
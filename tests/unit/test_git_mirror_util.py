@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import asyncio
+import shutil
+import subprocess
+
+import pytest
+
+import context
+
+from fpr.models.org_repo import OrgRepo
+import fpr.git_mirror_util as m
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="requires git")
+
+
+def git(*args, cwd):
+    return subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        cwd=cwd,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+
+
+@pytest.fixture
+def remote(tmp_path):
+    path = tmp_path / "remote"
+    path.mkdir()
+    git("init", "--quiet", cwd=path)
+    git("commit", "--quiet", "--allow-empty", "-m", "first", cwd=path)
+    git("tag", "v1", cwd=path)
+    return path
+
+
+def test_mirror_cache_clones_then_fetches_once_per_run(tmp_path, remote):
+    org_repo = OrgRepo("org", "repo")
+    repo_url = f"file://{remote}"
+
+    async def ensure_twice(cache):
+        return await asyncio.gather(
+            cache.ensure(org_repo, repo_url), cache.ensure(org_repo, repo_url)
+        )
+
+    cache = m.GitMirrorCache(str(tmp_path / "mirrors"))
+    paths = asyncio.run(ensure_twice(cache))
+    assert paths == [tmp_path / "mirrors" / "org" / "repo.git"] * 2
+    assert git("tag", cwd=paths[0]).split() == ["v1"]
+
+    git("commit", "--quiet", "--allow-empty", "-m", "second", cwd=remote)
+    git("tag", "v2", cwd=remote)
+    # memoized for the run
+    asyncio.run(cache.ensure(org_repo, repo_url))
+    assert git("tag", cwd=paths[0]).split() == ["v1"]
+
+    # a new run fetches
+    asyncio.run(m.GitMirrorCache(str(tmp_path / "mirrors")).ensure(org_repo, repo_url))
+    assert git("tag", cwd=paths[0]).split() == ["v1", "v2"]
+
+    # checkouts borrowing mirror objects can fetch and checkout refs offline
+    git(
+        "clone",
+        "--quiet",
+        "--shared",
+        "--origin",
+        "origin",
+        str(paths[0]),
+        "repo",
+        cwd=tmp_path,
+    )
+    checkout = tmp_path / "repo"
+    git("fetch", "--quiet", "origin", "-f", "tag", "v1", "--no-tags", cwd=checkout)
+    git("checkout", "--quiet", "v1", cwd=checkout)
+    assert git("rev-parse", "HEAD", cwd=checkout) == git("rev-parse", "v1", cwd=remote)
+
+
+def test_mirror_cache_raises_for_clone_errors(tmp_path):
+    cache = m.GitMirrorCache(str(tmp_path / "mirrors"))
+    with pytest.raises(m.GitMirrorError):
+        asyncio.run(
+            cache.ensure(OrgRepo("org", "missing"), f"file://{tmp_path / 'missing'}")
+        )
+
+
+def test_clone_source():
+    org_repo = OrgRepo("org", "repo")
+    assert asyncio.run(
+        m.clone_source(argparse.Namespace(git_mirror_dir=None), org_repo)
+    ) == ("https://github.com/org/repo.git", [],)
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+
+import pytest
+
+import context
+
+import fpr.metrics_util as m
+
+
+def test_histogram_cumulative_counts():
+    histogram = m.Histogram(buckets=[0.1, 1.0])
+    for value in [0.05, 0.1, 0.5, 2.0]:
+        histogram.observe(value)
+    assert histogram.cumulative_counts() == [(0.1, 2), (1.0, 3), (float("inf"), 4)]
+    assert histogram.count == 4
+    assert histogram.sum == pytest.approx(2.65)
+
+
+def test_registry_to_prometheus():
+    registry = m.MetricsRegistry()
+    registry.inc("fpr_items_in_total", pipeline="postprocess")
+    registry.inc("fpr_items_in_total", 2, pipeline="postprocess")
+    registry.set("fpr_queue_size", 3, pipeline='say "hi"')
+    registry.observe("fpr_stage_seconds", 0.002, pipeline="postprocess", stage="runner")
+
+    lines = registry.to_prometheus().splitlines()
+    assert lines[:4] == [
+        "# TYPE fpr_items_in_total counter",
+        'fpr_items_in_total{pipeline="postprocess"} 3.0',
+        "# TYPE fpr_queue_size gauge",
+        'fpr_queue_size{pipeline="say \\"hi\\""} 3',
+    ]
+    assert "# TYPE fpr_stage_seconds histogram" in lines
+    assert (
+        'fpr_stage_seconds_bucket{pipeline="postprocess",stage="runner",le="0.001"} 0'
+        in lines
+    )
+    assert (
+        'fpr_stage_seconds_bucket{pipeline="postprocess",stage="runner",le="0.005"} 1'
+        in lines
+    )
+    assert (
+        'fpr_stage_seconds_bucket{pipeline="postprocess",stage="runner",le="+Inf"} 1'
+        in lines
+    )
+    assert 'fpr_stage_seconds_count{pipeline="postprocess",stage="runner"} 1' in lines
+
+
+def test_registry_writes_json(tmp_path):
+    registry = m.MetricsRegistry()
+    with registry.timer("fpr_stage_seconds", pipeline="save_to_db", stage="writer"):
+        pass
+    path = tmp_path / "metrics.json"
+    registry.write(str(path), "json")
+
+    histograms = json.loads(path.read_text())["histograms"]["fpr_stage_seconds"]
+    assert histograms[0]["labels"] == {"pipeline": "save_to_db", "stage": "writer"}
+    assert histograms[0]["count"] == 1
+    assert histograms[0]["buckets"]["inf"] == 1
+    assert [p.name for p in tmp_path.iterdir()] == ["metrics.json"]
+
+
+def test_error_counting_handler():
+    registry = m.MetricsRegistry()
+    test_log = logging.getLogger("fpr.test_metrics_util")
+    handler = m.ErrorCountingHandler(registry)
+    test_log.addHandler(handler)
+    try:
+        test_log.warning("not counted")
+        test_log.error("counted")
+    finally:
+        test_log.removeHandler(handler)
+    assert registry.counters["fpr_log_errors_total"] == {
+        (("logger", "fpr.test_metrics_util"),): 1.0
+    }
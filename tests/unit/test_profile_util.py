@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import asyncio
+
+import pytest
+
+import context
+
+import fpr.profile_util as m
+
+
+async def slow_coroutine():
+    await asyncio.sleep(0.01)
+    return sum(i * i for i in range(10000))
+
+
+@pytest.mark.parametrize(
+    "profiler,profile_ext",
+    [("cprofile", ".prof"), pytest.param("pyinstrument", ".html")],
+)
+def test_run_profiled(tmp_path, profiler, profile_ext):
+    if profiler == "pyinstrument":
+        pytest.importorskip("pyinstrument")
+    args = argparse.Namespace(
+        profiler=profiler, profile_dir=str(tmp_path), profile_top=10
+    )
+
+    result = m.run_profiled(
+        lambda: asyncio.run(slow_coroutine()), args, ["find_git_refs", "find_dep_files"]
+    )
+
+    assert result == sum(i * i for i in range(10000))
+    assert {path.name for path in tmp_path.iterdir()} == {
+        f"fpr-profile-find_git_refs-find_dep_files{profile_ext}",
+        "fpr-profile-find_git_refs-find_dep_files.txt",
+    }
+    summary = (tmp_path / "fpr-profile-find_git_refs-find_dep_files.txt").read_text()
+    assert "test_profile_util.py" in summary
+
+
+def test_run_profiled_requires_pyinstrument(monkeypatch):
+    monkeypatch.setattr(m, "pyinstrument", None)
+    args = argparse.Namespace(profiler="pyinstrument")
+    with pytest.raises(ImportError, match="pip install pyinstrument"):
+        m.run_profiled(lambda: None, args, ["find_git_refs"])
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+import pathlib
+
+import context
+
+from fpr.disk_cache_util import DiskCache
+import fpr.docker.containers as containers
+from fpr.models.git_ref import GitRef
+from fpr.models.language import DependencyFile
+from fpr.models.org_repo import OrgRepo
+from fpr.pipelines.run_repo_tasks import (
+    cache_results,
+    is_cacheable_result,
+    is_failed_run,
+    rebase_result,
+)
+
+
+def test_rebase_result_for_another_repo():
+    result = dict(
+        org="mozilla",
+        repo="fxa",
+        ref=dict(kind="tag", value="v1.0.0"),
+        repo_url="https://github.com/mozilla/fxa.git",
+        versions=dict(npm="6.13.4"),
+        branch=None,
+        commit="0" * 40,
+        tag="v1.0.0",
+        dependency_files=[dict(path="packages/fxa-auth/package-lock.json", sha256="a")],
+        task_results=[
+            dict(
+                name="install",
+                working_dir="/repos/repo/packages/fxa-auth",
+                relative_path="packages/fxa-auth",
+                exit_code=0,
+            )
+        ],
+    )
+    rebased = rebase_result(
+        result,
+        OrgRepo("mozilla-fork", "fxa"),
+        GitRef.from_dict(dict(kind="tag", value="v2.0.0")),
+        pathlib.Path("."),
+        [DependencyFile(pathlib.Path("package-lock.json"), "a")],
+    )
+    assert rebased["org"] == "mozilla-fork"
+    assert rebased["ref"]["value"] == "v2.0.0"
+    assert (rebased["branch"], rebased["commit"], rebased["tag"]) == (None, None, None)
+    assert rebased["versions"] == dict(npm="6.13.4")
+    assert rebased["dependency_files"] == [dict(path="package-lock.json", sha256="a")]
+    assert rebased["task_results"] == [
+        dict(name="install", working_dir="/repos/repo", relative_path=".", exit_code=0)
+    ]
+    # the cached result isn't modified
+    assert result["org"] == "mozilla"
+    assert result["task_results"][0]["relative_path"] == "packages/fxa-auth"
+
+
+def test_is_failed_run():
+    assert is_failed_run(containers.DockerRunException("failed"))
+    assert is_failed_run(dict(exit_code=137))
+    assert not is_failed_run(dict(exit_code=1))
+    assert not is_failed_run(Exception("Missing files to run install"))
+
+
+def test_is_cacheable_result():
+    assert is_cacheable_result(dict(task_results=[dict(exit_code=1)], task_errors=[]))
+    assert not is_cacheable_result(dict(task_results=[dict(exit_code=137)]))
+    assert not is_cacheable_result(
+        dict(task_results=[], task_errors=["Missing files to run install"])
+    )
+
+
+def test_cache_results_does_not_store_failed_runs(tmp_path):
+    disk_cache = DiskCache(str(tmp_path / "results.sqlite3"))
+    ok = dict(task_results=[dict(exit_code=0)], task_errors=[])
+    killed = dict(task_results=[dict(exit_code=137)], task_errors=[])
+
+    assert not cache_results(disk_cache, ["failed", "global"], [ok, killed])
+    assert not cache_results(disk_cache, ["empty"], [])
+    assert cache_results(disk_cache, ["ok", "global"], [ok])
+    assert cache_results(None, ["ok"], [ok])
+
+    assert [disk_cache.get(key) for key in ["failed", "empty", "ok", "global"]] == [
+        None,
+        None,
+        [ok],
+        [ok],
+    ]
+    disk_cache.close()
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import io
+import time
+
+import pytest
+
+import context
+from helpers import collect
+
+from fpr.compression_util import open_compressed
+import fpr.rx_util as m
+from fpr.serialize_util import iter_records
+
+
+def test_aiter_items():
+    assert asyncio.run(collect(m.aiter_items([1, 2, 3]))) == [1, 2, 3]
+
+
+def test_aenumerate():
+    assert asyncio.run(collect(m.aenumerate(m.aiter_items("ab")))) == [
+        (0, "a"),
+        (1, "b"),
+    ]
+
+
+def test_iter_queue_stops_at_end_of_queue():
+    async def run():
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in [{"a": 1}, None, {"b": 2}, m.END_OF_QUEUE, {"c": 3}]:
+            queue.put_nowait(item)
+        return await collect(m.iter_queue(queue))
+
+    assert asyncio.run(run()) == [{"a": 1}, None, {"b": 2}]
+
+
+def test_aiter_in_thread():
+    assert asyncio.run(collect(m.aiter_in_thread(iter(range(5)), 2))) == [
+        0,
+        1,
+        2,
+        3,
+        4,
+    ]
+
+
+def test_aiter_in_thread_raises_iteration_errors():
+    def items():
+        yield 1
+        raise ValueError("bad line")
+
+    with pytest.raises(ValueError, match="bad line"):
+        asyncio.run(collect(m.aiter_in_thread(items())))
+
+
+def test_aiter_in_thread_does_not_block_the_event_loop():
+    ticks = 0
+
+    def slow_items():
+        for i in range(3):
+            time.sleep(0.05)
+            yield i
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    async def run():
+        ticker = asyncio.create_task(tick())
+        items = await collect(m.aiter_in_thread(slow_items()))
+        ticker.cancel()
+        return items
+
+    assert asyncio.run(run()) == [0, 1, 2]
+    assert ticks > 5
+
+
+def test_aiter_in_thread_limits_read_ahead():
+    read = 0
+
+    def items():
+        nonlocal read
+        for i in range(100):
+            read += 1
+            yield i
+
+    async def run():
+        async for item in m.aiter_in_thread(items(), max_queue_size=3):
+            await asyncio.sleep(0.05)
+            return item
+
+    assert asyncio.run(run()) == 0
+    assert read <= 5
+
+
+def run_map_concurrently(delays, concurrency, ordered):
+    running = 0
+    max_running = 0
+
+    async def fn(item):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(running, max_running)
+        await asyncio.sleep(delays[item])
+        running -= 1
+        yield item
+        yield item * 10
+
+    results = asyncio.run(
+        collect(
+            m.map_concurrently(
+                fn, m.aiter_items(range(len(delays))), concurrency, ordered
+            )
+        )
+    )
+    return results, max_running
+
+
+@pytest.mark.parametrize("concurrency", [0, 1, 2, 8])
+def test_map_concurrently_ordered(concurrency):
+    results, max_running = run_map_concurrently(
+        [0.03, 0.0, 0.02, 0.01], concurrency, ordered=True
+    )
+    assert results == [0, 0, 1, 10, 2, 20, 3, 30]
+    assert max_running <= max(concurrency, 1)
+
+
+def test_map_concurrently_unordered_yields_finished_items_first():
+    results, max_running = run_map_concurrently(
+        [0.15, 0.0, 0.1, 0.05], concurrency=4, ordered=False
+    )
+    assert results == [1, 10, 3, 30, 2, 20, 0, 0]
+    assert max_running == 4
+
+
+def test_map_concurrently_unordered_limits_concurrency():
+    results, max_running = run_map_concurrently(
+        [0.01] * 10, concurrency=3, ordered=False
+    )
+    assert sorted(results) == sorted(
+        [i for i in range(10)] + [i * 10 for i in range(10)]
+    )
+    assert max_running == 3
+
+
+def test_jsonlines_writer_flushes_by_size():
+    outfile = io.BytesIO()
+    writer = m.JSONLinesWriter(outfile, buffer_size=20, flush_interval=60)
+    writer.write({"a": 1})
+    assert outfile.getvalue() == b""
+    writer.write({"b": [1, 2, 3]})
+    assert outfile.getvalue() == b'{"a":1}\n{"b":[1,2,3]}\n'
+    writer.write({"c": None})
+    writer.close()
+    assert outfile.getvalue().splitlines()[-1] == b'{"c":null}'
+
+
+def test_jsonlines_writer_writes_text_to_binary_buffer():
+    outfile = io.TextIOWrapper(io.BytesIO(), encoding="utf-8")
+    outfile.write("header\n")
+    writer = m.JSONLinesWriter(outfile, flush_interval=0)
+    writer.write({"emoji": "\U0001f980"})
+    assert outfile.buffer.getvalue().decode("utf-8").splitlines() == [
+        "header",
+        '{"emoji":"\U0001f980"}',
+    ]
+
+
+def test_jsonlines_writer_flushes_by_interval():
+    outfile = io.StringIO()
+
+    async def run():
+        writer = m.JSONLinesWriter(outfile, flush_interval=0.01)
+        writer.write({"a": 1})
+        assert outfile.getvalue() == ""
+        await asyncio.sleep(0.05)
+        return outfile.getvalue()
+
+    assert asyncio.run(run()) == '{"a":1}\n'
+
+
+def test_agroupby_groups_consecutive_items():
+    items = [("a", 1), ("a", 2), ("b", 3), ("a", 4)]
+    assert asyncio.run(collect(m.agroupby(m.aiter_items(items), lambda x: x[0]))) == [
+        ("a", [("a", 1), ("a", 2)]),
+        ("b", [("b", 3)]),
+        ("a", [("a", 4)]),
+    ]
+
+
+def test_buffered_writer_requires_encode():
+    with pytest.raises(TypeError):
+        m.BufferedWriter(io.BytesIO())
+
+
+def test_msgpack_writer_appends_to_compressed_outfile(tmp_path):
+    path = str(tmp_path / "t.msgpack.gz")
+    for mode, items in [("wb", [{"a": 1}]), ("ab", [{"b": 2}, {"c": 3}])]:
+        outfile = open_compressed(path, mode)
+        writer = m.MsgpackWriter(outfile, flush_interval=0)
+        for item in items:
+            writer.write(item)
+        writer.close()
+        outfile.close()
+
+    with open_compressed(path, "rb") as infile:
+        assert list(iter_records(infile)) == [{"a": 1}, {"b": 2}, {"c": 3}]
+
+
+def test_when_all_flushed_waits_for_buffered_writers():
+    writers = [
+        m.JSONLinesWriter(io.BytesIO(), buffer_size=100, flush_interval=60)
+        for _ in range(2)
+    ]
+    writers[0].write({"a": 1})
+    calls = []
+    m.when_all_flushed(writers, lambda: calls.append(1))
+    assert calls == []
+    writers[0].flush()
+    assert calls == [1]
+
+    m.when_all_flushed(writers, lambda: calls.append(2))
+    assert calls == [1, 2]
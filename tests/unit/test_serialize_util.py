@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import io
 import json
 import pathlib
 import pickle
@@ -38,3 +39,92 @@ def test_get_in(value, path, default, expected):
 def test_get_in_errors(value, path, default, expected_error):
     with pytest.raises(expected_error):
         m.get_in(value, path, default)
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_dumps_jsonline(monkeypatch, use_orjson):
+    if use_orjson:
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(m, "orjson", None)
+    item = {"a": [1, None, "é"], "big": 1 << 70}
+    line = m.dumps_jsonline(item)
+    assert line.endswith(b"\n")
+    assert json.loads(line) == item
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_dumps_jsonline_output_is_the_same_without_orjson(monkeypatch, use_orjson):
+    if use_orjson:
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(m, "orjson", None)
+    assert m.dumps_jsonline({"a": [1, None, "é"]}) == '{"a":[1,null,"é"]}\n'.encode(
+        "utf-8"
+    )
+
+
+jsonl_records = [{"a": 1}, [1, {"b": None}], "short", 2]
+
+
+@pytest.mark.parametrize(
+    "f",
+    [
+        io.BytesIO(b'{"a": 1}\n[1, {"b": null}]\n"short"\n2\n'),
+        io.TextIOWrapper(io.BytesIO(b'{"a":1}\n[1,{"b":null}]\n"short"\n2')),
+        io.StringIO('{"a": 1}\n[1, {"b": null}]\n"short"\n2\n'),
+    ],
+)
+def test_iter_records_reads_jsonlines(f):
+    assert list(m.iter_records(f)) == jsonl_records
+
+
+def test_iter_records_reads_empty_file():
+    assert list(m.iter_records(io.BytesIO(b""))) == []
+
+
+def test_iter_records_reads_msgpack_frames():
+    pytest.importorskip("msgpack")
+    from fpr.rx_util import MsgpackWriter
+
+    f = io.BytesIO()
+    writer = MsgpackWriter(f)
+    for record in jsonl_records:
+        writer.write(record)
+    writer.close()
+    # appending to a non-empty file does not repeat the header
+    writer = MsgpackWriter(f)
+    writer.write({"appended": True})
+    writer.close()
+
+    f.seek(0)
+    assert list(m.iter_records(io.TextIOWrapper(f))) == [
+        *jsonl_records,
+        {"appended": True},
+    ]
+
+
+def test_iter_msgpack_frames_raises_on_truncated_frame():
+    pytest.importorskip("msgpack")
+
+    frame = m.dumps_msgpack_frame({"a": "b" * 100})
+    with pytest.raises(ValueError, match="truncated msgpack frame"):
+        list(m.iter_msgpack_frames(io.BytesIO(frame[:-1])))
+
+
+def test_msgpack_frames_without_msgpack_raise_import_error(monkeypatch):
+    monkeypatch.setattr(m, "msgpack", None)
+    with pytest.raises(ImportError, match="pip install msgpack"):
+        m.dumps_msgpack_frame({"a": 1})
+
+
+def test_dumps_jsonline_matches_the_rust_changelog_fixture():
+    # make check-rust-changelog diffs pipeline output against the fixture
+    path = (
+        pathlib.Path(__file__).parent / ".." / "fixtures" / "channelserver_tags.jsonl"
+    )
+    fixture = path.read_bytes()
+    assert (
+        b"".join(m.dumps_jsonline(json.loads(line)) for line in fixture.splitlines())
+        == fixture
+    )
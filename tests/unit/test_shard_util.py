@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import asyncio
+
+import pytest
+
+import context
+from helpers import collect
+
+from fpr.rx_util import aiter_items
+import fpr.shard_util as m
+from fpr.pipelines.run_repo_tasks import pipeline as run_repo_tasks
+
+
+@pytest.mark.parametrize(
+    "arg,expected", [("0/1", (0, 1)), ("3/4", (3, 4)), ("9/10", (9, 10))]
+)
+def test_parse_shard(arg, expected):
+    assert m.parse_shard(arg) == expected
+
+
+@pytest.mark.parametrize("arg", ["", "1", "a/b", "1/2/3", "4/4", "-1/4", "0/0"])
+def test_parse_shard_errors(arg):
+    with pytest.raises(argparse.ArgumentTypeError):
+        m.parse_shard(arg)
+
+
+def test_shard_index_is_stable():
+    assert m.shard_index({"b": 1, "a": [2]}, 7) == m.shard_index({"a": [2], "b": 1}, 7)
+
+
+def test_filter_shard_partitions_items():
+    items = [{"name": f"package-{i}"} for i in range(100)]
+    shards = [
+        asyncio.run(
+            collect(m.filter_shard(aiter_items(items), m.default_shard_key, i, 3))
+        )
+        for i in range(3)
+    ]
+    assert all(shards)
+    assert sorted(
+        (item for shard in shards for item in shard), key=lambda item: item["name"]
+    ) == sorted(items, key=lambda item: item["name"])
+
+
+def test_run_repo_tasks_shard_key_groups_dep_file_dirs():
+    def row(ref, path):
+        return {
+            "org": "mozilla",
+            "repo": "fpr",
+            "ref": {"kind": "tag", "value": ref},
+            "dependency_file": {"path": path, "sha256": path},
+        }
+
+    shard_key = run_repo_tasks.shard_key
+    assert shard_key(row("v1", "a/package.json")) == shard_key(
+        row("v1", "a/package-lock.json")
+    )
+    assert shard_key(row("v1", "a/package.json")) != shard_key(
+        row("v2", "a/package.json")
+    )
+    assert shard_key(row("v1", "a/package.json")) != shard_key(
+        row("v1", "b/package.json")
+    )